@@ -75,6 +75,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'apps.tienda.context_processors.catalogo',
             ],
         },
     },
@@ -105,10 +106,76 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # SQLite no bloquea filas (select_for_update no hace nada): cada transacción
+                # toma el bloqueo de escritura al comenzar, así las que leen y luego escriben
+                # (secuencias de documentos, stock) se ejecutan una tras otra en vez de fallar
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+            # Base de pruebas en archivo (no en memoria) para que las pruebas de
+            # concurrencia usen conexiones independientes desde varios hilos
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
 
+# Caché
+# Las páginas y fragmentos del catálogo van por defecto en la memoria de cada proceso,
+# así servir el catálogo no escribe en la base de datos. Con CACHE_BACKEND=file se usa
+# un directorio compartido, con CACHE_BACKEND=redis un servidor Redis (requiere el
+# paquete 'redis', no incluido en requirements.txt) y con CACHE_BACKEND=db una tabla.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_URL', str(BASE_DIR / 'cache')),
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'pozinox_cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pozinox',
+        }
+    }
+
+# Lo que debe ser igual en todos los procesos: la versión del catálogo (que cambian
+# también los comandos de gestión), el IVA y los captcha usados. Si 'default' ya es
+# compartido se usa el mismo; si no, la tabla de la base de datos (la crea 'migrate',
+# ver tienda 0013). Cada proceso relee la versión cada CACHE_VERSION_CATALOGO_SEGUNDOS,
+# así un cambio hecho en otro proceso puede tardar ese tiempo en verse, a cambio de
+# no consultar la tabla en cada petición.
+if CACHE_BACKEND == 'locmem':
+    CACHES['compartido'] = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'pozinox_cache',
+    }
+else:
+    CACHES['compartido'] = dict(CACHES['default'])
+CACHE_VERSION_CATALOGO_SEGUNDOS = int(os.getenv('CACHE_VERSION_CATALOGO_SEGUNDOS', '2'))
+
+# Segundos que se conservan las páginas y fragmentos del catálogo. Las entradas se
+# invalidan antes si cambia un producto o una categoría (ver apps/tienda/cache.py).
+CACHE_TIMEOUT_CATALOGO = int(os.getenv('CACHE_TIMEOUT_CATALOGO', '3600'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -188,13 +255,31 @@ if USE_S3_STORAGE:
     
     # URLs de media usando Supabase Storage
     MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/{AWS_STORAGE_BUCKET_NAME}/"
-    print(f"🔗 MEDIA_URL configurada: {MEDIA_URL}")
 else:
     # Usar almacenamiento local (fallback)
     MEDIA_URL = '/media/'
     MEDIA_ROOT = BASE_DIR / 'media'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# PDF de cotizaciones cerradas (ver apps/tienda/pdf_cotizaciones.py). Sin S3 se
+# guardan en este directorio local, que no se publica como media.
+PDF_COTIZACIONES_ROOT = os.getenv('PDF_COTIZACIONES_ROOT', str(BASE_DIR / 'pdf_cotizaciones'))
+PDF_COTIZACIONES_EN_SEGUNDO_PLANO = os.getenv('PDF_COTIZACIONES_EN_SEGUNDO_PLANO', 'True') == 'True'
+# Procesos para generar PDF en la exportación masiva (0 = automático)
+PDF_EXPORTACION_PROCESOS = int(os.getenv('PDF_EXPORTACION_PROCESOS', '0'))
+# Variantes WebP/JPEG reducidas de las imágenes de productos (ver apps/tienda/imagenes.py)
+IMAGENES_VARIANTES_EN_SEGUNDO_PLANO = os.getenv('IMAGENES_VARIANTES_EN_SEGUNDO_PLANO', 'True') == 'True'
+
+# MercadoPago (ver apps/tienda/pagos.py). Con MERCADOPAGO_SIMULADO=True se usa una
+# API simulada en memoria para probar el flujo completo sin conexión.
+MERCADOPAGO_ACCESS_TOKEN = os.getenv('MERCADOPAGO_ACCESS_TOKEN')
+MERCADOPAGO_WEBHOOK_SECRET = os.getenv('MERCADOPAGO_WEBHOOK_SECRET', '')
+MERCADOPAGO_SIMULADO = os.getenv('MERCADOPAGO_SIMULADO', 'False') == 'True'
+MERCADOPAGO_MAX_INTENTOS = int(os.getenv('MERCADOPAGO_MAX_INTENTOS', '8'))
+# Consultar el pago apenas llega el aviso; la bandeja queda para los reintentos
+MERCADOPAGO_CONCILIACION_INMEDIATA = os.getenv('MERCADOPAGO_CONCILIACION_INMEDIATA', 'True') == 'True'
+
+# Se puede cambiar por el backend locmem o console (por ejemplo en desarrollo o pruebas)
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_HOST_USER = 'pozinox.empresa@gmail.com'
@@ -205,26 +290,22 @@ DEFAULT_FROM_EMAIL = 'pozinox.empresa@gmail.com'
 # Configuración de verificación de email
 EMAIL_VERIFICATION_REQUIRED = False  # NO requerir verificación para login
 
+# Cola de correos (ver apps/usuarios/correo.py y el comando procesar_correos)
+CORREO_LOTE = int(os.getenv('CORREO_LOTE', '50'))
+CORREO_MAX_INTENTOS = int(os.getenv('CORREO_MAX_INTENTOS', '5'))
+# Intentar el envío apenas se confirma la transacción; la cola queda para los reintentos
+CORREO_ENVIO_INMEDIATO = os.getenv('CORREO_ENVIO_INMEDIATO', 'True') == 'True'
+
 # ==================================
 # CONFIGURACIÓN DE SUPABASE
 # ==================================
 SUPABASE_URL = os.getenv('SUPABASE_URL', '')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY', '')
-
-# Si se configuró Supabase, inicializar el cliente
-if SUPABASE_URL and SUPABASE_KEY:
-    from supabase import create_client, Client
-    SUPABASE_CLIENT: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Con SUPABASE_SIMULADO=True SupabaseStorage usa un bucket en memoria (apps/supabase_simulado.py)
+SUPABASE_SIMULADO = os.getenv('SUPABASE_SIMULADO', 'False') == 'True'
+# El cliente se crea al primer uso (ver apps.utils.obtener_cliente_supabase)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-
-# ==================================
-# DEBUGGING STORAGE (temporal)
-# ==================================
-print("🔍 DEBUGGING STORAGE:")
-print("AWS_ACCESS_KEY_ID:", "✅ Configurado" if os.getenv('AWS_ACCESS_KEY_ID') else "❌ No configurado")
-print("USE_S3_STORAGE:", USE_S3_STORAGE)
-print("DEFAULT_FILE_STORAGE:", DEFAULT_FILE_STORAGE if USE_S3_STORAGE else "Local storage")
@@ -0,0 +1,180 @@
+"""
+Motor de alertas de stock.
+
+Clasifica todos los productos activos en una sola consulta: el nivel
+(``sin_stock``, ``stock_critico`` o ``stock_bajo``) se calcula en la base con
+un ``CASE`` sobre ``stock_actual`` y el stock mínimo, y la misma consulta
+descarta los productos que ya tienen una alerta abierta (no leída) de ese
+nivel. Las alertas nuevas se insertan con ``bulk_create`` y las abiertas que
+ya no corresponden (el producto se repuso o cambió de nivel) se cierran con un
+solo ``UPDATE``. Python solo recorre las alertas nuevas, no el catálogo.
+
+Se ejecuta de forma incremental para los productos de cada lote de
+movimientos (ver ``stock.aplicar_movimientos``) o cuyo stock mínimo cambió al
+editarlos, y completa al guardar ``ConfiguracionSistema`` y con el comando
+``generar_alertas_inventario`` (que docker-compose corre tras ``migrate`` para
+cargar las alertas de una base existente).
+
+Umbrales: sin stock con 0 unidades; crítico hasta la mitad del stock mínimo;
+bajo hasta el stock mínimo. Si un producto tiene stock mínimo 0 se usa el
+``stock_minimo_global`` de ``ConfiguracionSistema``, cuyas opciones
+``alerta_stock_bajo`` y ``alerta_stock_critico`` activan cada nivel (sin stock
+se considera crítico).
+
+Movimiento anómalo: las salidas del día de un producto superan
+``FACTOR_ANOMALIA`` veces su promedio diario de los ``DIAS_PROMEDIO_ANOMALIA``
+días anteriores (y al menos ``SALIDA_MINIMA_ANOMALIA`` unidades). Se calcula en
+la misma pasada con dos subconsultas agregadas sobre ``MovimientoInventario``.
+A diferencia de las de stock, es un aviso puntual: se crea como mucho una por
+producto y día, y queda abierta hasta que alguien la marca como leída.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, CharField, Exists, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.tienda.models import Producto
+from apps.usuarios.models import ConfiguracionSistema
+
+from .models import AlertaInventario, MovimientoInventario
+
+
+TIPOS_STOCK = ('sin_stock', 'stock_critico', 'stock_bajo')
+TAMANO_LOTE = 2000
+DIAS_PROMEDIO_ANOMALIA = 30
+FACTOR_ANOMALIA = 3
+SALIDA_MINIMA_ANOMALIA = 10
+
+
+def _configuracion():
+    configuracion = ConfiguracionSistema.objects.only(
+        'stock_minimo_global', 'alerta_stock_bajo', 'alerta_stock_critico'
+    ).first()
+    return configuracion or ConfiguracionSistema()
+
+
+def productos_con_nivel(configuracion=None, productos=None):
+    """Productos activos anotados con ``minimo_efectivo`` y ``nivel_alerta`` (None si el stock está bien)"""
+    configuracion = configuracion or _configuracion()
+    productos = Producto.objects.all() if productos is None else productos
+    productos = productos.filter(activo=True).annotate(
+        minimo_efectivo=Case(
+            When(stock_minimo=0, then=Value(configuracion.stock_minimo_global)),
+            default=F('stock_minimo'),
+            output_field=IntegerField(),
+        ),
+    )
+
+    niveles = []
+    if configuracion.alerta_stock_critico:
+        niveles += [
+            When(stock_actual=0, then=Value('sin_stock')),
+            When(stock_actual__lte=F('minimo_efectivo') / 2, then=Value('stock_critico')),
+        ]
+    if configuracion.alerta_stock_bajo:
+        niveles.append(When(stock_actual__lte=F('minimo_efectivo'), then=Value('stock_bajo')))
+    nivel = Case(*niveles, default=Value(None), output_field=CharField()) if niveles else Value(None, output_field=CharField())
+    return productos.annotate(nivel_alerta=nivel)
+
+
+def _salidas(desde, hasta=None):
+    """Subconsulta con las unidades que salieron de cada producto desde ``desde`` (y antes de ``hasta``)"""
+    salidas = MovimientoInventario.objects.filter(
+        producto=OuterRef('pk'), tipo_movimiento='salida', fecha_movimiento__gte=desde
+    )
+    if hasta is not None:
+        salidas = salidas.filter(fecha_movimiento__lt=hasta)
+    total = salidas.values('producto').annotate(total=Sum('cantidad')).values('total')[:1]
+    return Coalesce(Subquery(total, output_field=IntegerField()), Value(0))
+
+
+def movimientos_anomalos(productos=None):
+    """Productos activos cuyas salidas de hoy superan el umbral y aún no tienen el aviso del día"""
+    productos = Producto.objects.all() if productos is None else productos
+    inicio_hoy = timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time.min))
+    inicio_promedio = inicio_hoy - datetime.timedelta(days=DIAS_PROMEDIO_ANOMALIA)
+    return productos.filter(activo=True).annotate(
+        salida_hoy=_salidas(inicio_hoy),
+        salida_previa=_salidas(inicio_promedio, inicio_hoy),
+        # salida_hoy > FACTOR * salida_previa / DIAS, sin división entera en la base
+        exceso=F('salida_hoy') * DIAS_PROMEDIO_ANOMALIA - F('salida_previa') * FACTOR_ANOMALIA,
+    ).filter(
+        salida_hoy__gte=SALIDA_MINIMA_ANOMALIA, exceso__gt=0,
+    ).exclude(
+        Exists(AlertaInventario.objects.filter(
+            producto=OuterRef('pk'), tipo_alerta='movimiento_anomalo', fecha_alerta__gte=inicio_hoy
+        ))
+    )
+
+
+def evaluar_alertas(productos=None):
+    """
+    Crea las alertas de stock que falten y cierra las que ya no aplican.
+
+    ``productos`` limita la revisión (queryset o lista de ids); por defecto se
+    revisa todo el catálogo. Retorna un diccionario con ``creadas`` y
+    ``cerradas`` (solo alertas de stock; los movimientos anómalos no se cierran).
+    """
+    if productos is not None and not hasattr(productos, 'filter'):
+        productos = Producto.objects.filter(id__in=list(productos))
+    con_nivel = productos_con_nivel(productos=productos)
+
+    # Alertas abiertas cuyo tipo ya no es el nivel actual del producto
+    nivel_actual = con_nivel.filter(pk=OuterRef('producto_id')).values('nivel_alerta')[:1]
+    abiertas = AlertaInventario.objects.filter(leida=False, tipo_alerta__in=TIPOS_STOCK)
+    if productos is not None:
+        abiertas = abiertas.filter(producto__in=productos.values('pk'))
+    cerradas = abiertas.exclude(
+        tipo_alerta=Coalesce(Subquery(nivel_actual, output_field=CharField()), Value(''))
+    ).update(leida=True)
+
+    # Productos con nivel de alerta que aún no tienen una alerta abierta de ese nivel
+    pendientes = con_nivel.filter(nivel_alerta__isnull=False).exclude(
+        Exists(AlertaInventario.objects.filter(
+            producto=OuterRef('pk'), tipo_alerta=OuterRef('nivel_alerta'), leida=False
+        ))
+    ).values_list('id', 'codigo_producto', 'nombre', 'stock_actual', 'minimo_efectivo', 'nivel_alerta')
+
+    etiquetas = dict(AlertaInventario.TIPO_ALERTA)
+    nuevas = [
+        AlertaInventario(
+            producto_id=producto_id,
+            tipo_alerta=nivel,
+            mensaje=f'{etiquetas[nivel]}: {nombre} ({codigo}) tiene {stock} unidades; stock mínimo {minimo}.',
+        )
+        for producto_id, codigo, nombre, stock, minimo, nivel in pendientes.iterator(chunk_size=TAMANO_LOTE)
+    ]
+    anomalos = movimientos_anomalos(productos).values_list(
+        'id', 'codigo_producto', 'nombre', 'salida_hoy', 'salida_previa'
+    )
+    nuevas += [
+        AlertaInventario(
+            producto_id=producto_id,
+            tipo_alerta='movimiento_anomalo',
+            mensaje=(
+                f'{etiquetas["movimiento_anomalo"]}: hoy salieron {hoy} unidades de {nombre} ({codigo}); '
+                f'promedio diario de los últimos {DIAS_PROMEDIO_ANOMALIA} días: {previa / DIAS_PROMEDIO_ANOMALIA:.1f}.'
+            ),
+        )
+        for producto_id, codigo, nombre, hoy, previa in anomalos.iterator(chunk_size=TAMANO_LOTE)
+    ]
+    AlertaInventario.objects.bulk_create(nuevas, batch_size=TAMANO_LOTE)
+    return {'creadas': len(nuevas), 'cerradas': cerradas}
+
+
+@receiver(post_save, sender=ConfiguracionSistema)
+def reevaluar_al_cambiar_configuracion(sender, instance, raw=False, **kwargs):
+    # El stock mínimo global y las opciones de alerta afectan a todo el catálogo
+    if not raw:
+        transaction.on_commit(evaluar_alertas)
+
+
+def productos_con_alerta_abierta():
+    """Cantidad de productos con alguna alerta de stock sin leer"""
+    return AlertaInventario.objects.filter(
+        leida=False, tipo_alerta__in=TIPOS_STOCK
+    ).values('producto').distinct().count()
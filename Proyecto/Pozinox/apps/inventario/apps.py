@@ -5,3 +5,7 @@ class InventarioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.inventario'
     verbose_name = 'Gestión de Inventario'
+
+    def ready(self):
+        # Registrar la señal que reevalúa las alertas al cambiar la configuración
+        from . import alertas  # noqa: F401
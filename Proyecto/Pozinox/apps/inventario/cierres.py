@@ -0,0 +1,141 @@
+"""
+Stock histórico a partir de cierres periódicos.
+
+El comando ``generar_cierres_stock`` guarda en ``CierreStock`` el stock de cada
+producto al cierre de un día (diario o a fin de mes). El stock de un producto
+en cualquier instante es el de su último cierre anterior a ese instante más
+los movimientos de ``MovimientoInventario`` posteriores al cierre, sin
+recorrer el libro completo.
+
+Las consultas son por conjunto: ``stock_en`` anota el stock histórico de todos
+los productos en una sola consulta (con subconsultas correlacionadas que usan
+los índices por producto y fecha), y ``valorizacion`` lo suma en la misma.
+
+Solo se escribe un cierre para los productos que tuvieron movimientos desde su
+cierre anterior (o que aún no tienen uno); el resto sigue apoyándose en su
+último cierre, que sigue siendo válido.
+"""
+import datetime
+
+from django.db.models import (
+    Case, DecimalField, Exists, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.tienda.models import Producto
+
+from .models import CierreStock, MovimientoInventario
+
+
+def corte_del_dia(fecha):
+    """Instante en que cierra un día local (la medianoche siguiente)"""
+    siguiente = datetime.datetime.combine(fecha + datetime.timedelta(days=1), datetime.time.min)
+    return timezone.make_aware(siguiente)
+
+
+def _suma_movimientos(movimientos):
+    """Subconsulta con la suma de las variaciones de stock de ``movimientos`` por producto"""
+    return Subquery(
+        movimientos.order_by().values('producto')
+        .annotate(suma=Sum(F('cantidad_nueva') - F('cantidad_anterior')))
+        .values('suma')[:1],
+        output_field=IntegerField(),
+    )
+
+
+def stock_en(instante, productos=None):
+    """
+    Productos anotados con ``stock_historico`` (stock justo antes de ``instante``)
+    y ``precio_cierre`` (precio del cierre usado, o el actual si no hay cierre).
+    """
+    productos = Producto.objects.all() if productos is None else productos
+    cierres = CierreStock.objects.filter(producto=OuterRef('pk'), corte__lte=instante).order_by('-corte')
+    anteriores = MovimientoInventario.objects.filter(producto=OuterRef('pk'), fecha_movimiento__lt=instante)
+    primer_movimiento = MovimientoInventario.objects.filter(producto=OuterRef('pk')).order_by('fecha_movimiento', 'id')
+
+    productos = productos.filter(fecha_creacion__lt=instante).annotate(
+        cantidad_cierre=Subquery(cierres.values('cantidad')[:1]),
+        corte_cierre=Subquery(cierres.values('corte')[:1]),
+        precio_cierre=Coalesce(Subquery(cierres.values('precio_unitario')[:1]), F('precio_por_unidad')),
+        # Sin cierres se parte del stock previo al primer movimiento (o del
+        # actual si el producto nunca tuvo movimientos)
+        stock_base=Coalesce(
+            'cantidad_cierre',
+            Subquery(primer_movimiento.values('cantidad_anterior')[:1]),
+            F('stock_actual'),
+        ),
+        variacion=Case(
+            When(corte_cierre__isnull=True, then=_suma_movimientos(anteriores)),
+            default=_suma_movimientos(anteriores.filter(fecha_movimiento__gte=OuterRef('corte_cierre'))),
+            output_field=IntegerField(),
+        ),
+    )
+    return productos.annotate(
+        stock_historico=ExpressionWrapper(F('stock_base') + Coalesce('variacion', Value(0)), output_field=IntegerField())
+    )
+
+
+def stock_al(fecha, productos=None):
+    """``stock_en`` al cierre del día ``fecha``"""
+    return stock_en(corte_del_dia(fecha), productos)
+
+
+def stock_producto(producto, fecha):
+    """Stock de un producto al cierre del día ``fecha``"""
+    producto_id = getattr(producto, 'pk', producto)
+    fila = stock_al(fecha, Producto.objects.filter(pk=producto_id)).values('stock_historico').first()
+    return fila['stock_historico'] if fila else 0
+
+
+def valorizacion(fecha, productos=None):
+    """Unidades y valor total del inventario al cierre de ``fecha``, en una sola consulta"""
+    totales = stock_al(fecha, productos).aggregate(
+        unidades=Coalesce(Sum('stock_historico'), Value(0)),
+        valor=Coalesce(
+            Sum(ExpressionWrapper(F('stock_historico') * F('precio_cierre'),
+                                  output_field=DecimalField(max_digits=16, decimal_places=2))),
+            Value(0), output_field=DecimalField(max_digits=16, decimal_places=2),
+        ),
+    )
+    return totales
+
+
+def generar_cierres(fecha):
+    """
+    Guarda el cierre de ``fecha`` de los productos con movimientos desde su
+    cierre anterior; retorna la cantidad de cierres escritos.
+
+    Volver a generar un día reemplaza sus cierres.
+    """
+    corte = corte_del_dia(fecha)
+    cierre_previo = CierreStock.objects.filter(
+        producto=OuterRef('pk'), corte__lte=corte, fecha__lt=fecha
+    ).order_by('-corte')
+    movimientos = MovimientoInventario.objects.filter(producto=OuterRef('pk'), fecha_movimiento__lt=corte)
+
+    productos = stock_en(corte).annotate(
+        corte_previo=Subquery(cierre_previo.values('corte')[:1]),
+        con_movimientos=Exists(movimientos.filter(fecha_movimiento__gte=OuterRef('corte_previo'))),
+    ).filter(Q(corte_previo__isnull=True) | Q(con_movimientos=True))
+
+    cierres = [
+        CierreStock(producto_id=fila['id'], fecha=fecha, corte=corte,
+                    cantidad=max(fila['stock_historico'], 0), precio_unitario=fila['precio_por_unidad'])
+        for fila in productos.values('id', 'stock_historico', 'precio_por_unidad').iterator(chunk_size=2000)
+    ]
+    CierreStock.objects.bulk_create(
+        cierres, batch_size=500, update_conflicts=True,
+        unique_fields=['producto', 'fecha'], update_fields=['corte', 'cantidad', 'precio_unitario'],
+    )
+    return len(cierres)
+
+
+def compactar_cierres(antes_de):
+    """Elimina los cierres diarios anteriores a ``antes_de`` salvo los de fin de mes; retorna cuántos"""
+    fin_de_mes = [
+        fecha for fecha in CierreStock.objects.filter(fecha__lt=antes_de).dates('fecha', 'day')
+        if (fecha + datetime.timedelta(days=1)).day == 1
+    ]
+    eliminados, _ = CierreStock.objects.filter(fecha__lt=antes_de).exclude(fecha__in=fin_de_mes).delete()
+    return eliminados
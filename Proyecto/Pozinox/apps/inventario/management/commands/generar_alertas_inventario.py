@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventario.alertas import evaluar_alertas
+
+
+class Command(BaseCommand):
+    help = 'Revisa el stock de todos los productos y genera o cierra las alertas de inventario'
+
+    def handle(self, *args, **options):
+        resultado = evaluar_alertas()
+        self.stdout.write(self.style.SUCCESS(
+            f"Alertas creadas: {resultado['creadas']}, cerradas: {resultado['cerradas']}."
+        ))
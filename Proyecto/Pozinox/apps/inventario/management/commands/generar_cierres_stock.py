@@ -0,0 +1,44 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.inventario.cierres import compactar_cierres, generar_cierres
+
+
+class Command(BaseCommand):
+    help = 'Guarda el cierre de stock por producto de un día (por defecto, ayer) o de fin de mes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Día a cerrar (AAAA-MM-DD)')
+        parser.add_argument('--desde', help='Cerrar todos los días desde esta fecha hasta --fecha')
+        parser.add_argument('--mensual', action='store_true',
+                            help='Cerrar solo el último día del mes anterior a --fecha')
+        parser.add_argument('--compactar-dias', type=int, default=None,
+                            help='Eliminar cierres diarios más antiguos que N días (se conservan los de fin de mes)')
+
+    def _fecha(self, valor, nombre):
+        fecha = parse_date(valor)
+        if fecha is None:
+            raise CommandError(f'{nombre} inválida: {valor}')
+        return fecha
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        hasta = self._fecha(options['fecha'], '--fecha') if options['fecha'] else hoy - datetime.timedelta(days=1)
+        if options['mensual']:
+            hasta = hasta.replace(day=1) - datetime.timedelta(days=1)
+        if hasta >= hoy:
+            raise CommandError('Solo se pueden cerrar días ya terminados.')
+        desde = self._fecha(options['desde'], '--desde') if options['desde'] else hasta
+
+        fecha = desde
+        while fecha <= hasta:
+            escritos = generar_cierres(fecha)
+            self.stdout.write(self.style.SUCCESS(f'Cierre {fecha}: {escritos} productos.'))
+            fecha += datetime.timedelta(days=1)
+
+        if options['compactar_dias'] is not None:
+            eliminados = compactar_cierres(hoy - datetime.timedelta(days=options['compactar_dias']))
+            self.stdout.write(self.style.SUCCESS(f'Cierres diarios eliminados: {eliminados}.'))
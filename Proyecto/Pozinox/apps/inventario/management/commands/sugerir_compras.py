@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+
+class Command(BaseCommand):
+    help = 'Proyecta la demanda por producto y crea borradores de compra por proveedor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Usuario que figura como creador de las compras (por defecto, el primer superusuario)')
+        parser.add_argument('--hasta', help='Último día de historial a considerar (AAAA-MM-DD, por defecto ayer)')
+        parser.add_argument('--dias-historia', type=int, default=None, help='Días de historial de ventas (ventana larga de la demanda)')
+        parser.add_argument('--nivel-servicio', type=float, default=None, help='Probabilidad de no quebrar stock (0.5 a 0.999)')
+        parser.add_argument('--solo-calcular', action='store_true', help='Mostrar las sugerencias sin crear compras')
+
+    def handle(self, *args, **options):
+        try:
+            from apps.inventario import pronostico
+        except ImportError as e:
+            raise CommandError(f'El pronóstico de demanda requiere NumPy ({e}). Instálelo con: pip install numpy')
+
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = User.objects.filter(is_superuser=True).order_by('id').first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario para registrar las compras.')
+
+        hasta = None
+        if options['hasta']:
+            hasta = parse_date(options['hasta'])
+            if hasta is None:
+                raise CommandError(f"--hasta inválida: {options['hasta']}")
+        nivel = options['nivel_servicio'] or pronostico.NIVEL_SERVICIO
+        if not 0.5 <= nivel < 1:
+            raise CommandError('--nivel-servicio debe estar entre 0.5 y 0.999')
+
+        resultado = pronostico.sugerir_compras(
+            usuario,
+            hasta=hasta,
+            ventana_larga=options['dias_historia'] or pronostico.VENTANA_LARGA,
+            nivel_servicio=nivel,
+            crear=not options['solo_calcular'],
+        )
+
+        self.stdout.write(
+            f"Productos evaluados: {resultado['productos']}, con reposición sugerida: {resultado['sugeridos']}, "
+            f"sin proveedor conocido: {resultado['sin_proveedor']}"
+        )
+        if options['solo_calcular']:
+            for proveedor_id, lineas in resultado['compras']:
+                unidades = sum(cantidad for _, cantidad, _ in lineas)
+                self.stdout.write(f'  Proveedor {proveedor_id}: {len(lineas)} productos, {unidades} unidades')
+        else:
+            for compra in resultado['compras']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Borrador {compra.numero_orden} para {compra.proveedor}: ${compra.total:,.0f}'
+                ))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0001_initial'),
+        ('tienda', '0008_preferencia_mercadopago'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('corte', models.DateTimeField()),
+                ('cantidad', models.PositiveIntegerField()),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'verbose_name': 'Cierre de Stock',
+                'verbose_name_plural': 'Cierres de Stock',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['producto', 'fecha_movimiento'], name='movimiento_producto_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='cierrestock',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres_stock', to='tienda.producto'),
+        ),
+        migrations.AddIndex(
+            model_name='cierrestock',
+            index=models.Index(fields=['producto', '-corte'], name='cierre_producto_corte_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cierrestock',
+            unique_together={('producto', 'fecha')},
+        ),
+    ]
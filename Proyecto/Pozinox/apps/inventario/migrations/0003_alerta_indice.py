@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0002_cierre_stock'),
+        ('tienda', '0008_preferencia_mercadopago'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alertainventario',
+            index=models.Index(fields=['producto', 'tipo_alerta', 'leida'], name='alerta_producto_tipo_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from apps.tienda.models import Producto
+from django.utils import timezone
+from apps.tienda.models import Producto, SecuenciaDocumento
 
 
 class Proveedor(models.Model):
@@ -89,11 +90,37 @@ class MovimientoInventario(models.Model):
         verbose_name = 'Movimiento de Inventario'
         verbose_name_plural = 'Movimientos de Inventario'
         ordering = ['-fecha_movimiento']
+        indexes = [
+            # Consultas de stock histórico por producto (ver cierres.py)
+            models.Index(fields=['producto', 'fecha_movimiento'], name='movimiento_producto_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.producto} - {self.get_tipo_movimiento_display()} - {self.cantidad} unidades"
 
 
+class CierreStock(models.Model):
+    """Stock de un producto al cierre de un día (punto de partida para consultas históricas)"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='cierres_stock')
+    fecha = models.DateField()
+    # Instante del cierre: incluye los movimientos anteriores a este momento
+    corte = models.DateTimeField()
+    cantidad = models.PositiveIntegerField()
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    class Meta:
+        verbose_name = 'Cierre de Stock'
+        verbose_name_plural = 'Cierres de Stock'
+        ordering = ['-fecha']
+        unique_together = ['producto', 'fecha']
+        indexes = [
+            models.Index(fields=['producto', '-corte'], name='cierre_producto_corte_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.producto} - {self.fecha}: {self.cantidad}"
+
+
 class Compra(models.Model):
     """Compras de productos a proveedores"""
     ESTADOS_CHOICES = [
@@ -137,10 +164,10 @@ class Compra(models.Model):
     def save(self, *args, **kwargs):
         if not self.numero_orden:
             # Generar número de orden automáticamente
-            import datetime
-            today = datetime.date.today()
-            last_orden = Compra.objects.filter(fecha_orden__date=today).count()
-            self.numero_orden = f"ORD{today.strftime('%Y%m%d')}{last_orden + 1:03d}"
+            self.numero_orden = SecuenciaDocumento.generar_numero(
+                'ORD', 3,
+                inicial=lambda: Compra.objects.filter(fecha_orden__date=timezone.localdate()).count(),
+            )
         super().save(*args, **kwargs)
 
 
@@ -187,6 +214,10 @@ class AlertaInventario(models.Model):
         verbose_name = 'Alerta de Inventario'
         verbose_name_plural = 'Alertas de Inventario'
         ordering = ['-fecha_alerta']
+        indexes = [
+            # Búsqueda de alertas abiertas por producto (ver alertas.py)
+            models.Index(fields=['producto', 'tipo_alerta', 'leida'], name='alerta_producto_tipo_idx'),
+        ]
     
     def __str__(self):
         return f"Alerta {self.get_tipo_alerta_display()} - {self.producto}"
@@ -0,0 +1,269 @@
+"""
+Pronóstico de demanda y sugerencia de compras.
+
+La demanda diaria de cada producto sale de tres fuentes:
+
+* líneas de pedidos no cancelados (por fecha del pedido);
+* líneas de cotizaciones pagadas (por fecha de finalización);
+* salidas de inventario por venta o muestra sin número de documento (ventas de
+  mesón que no pasan por un pedido ni una cotización).
+
+El historial se agrega por producto y día en la base de datos y, solo para la
+ventana larga (los días que el cálculo usa), se carga por bloques en arreglos de
+NumPy. Luego, en una sola pasada vectorizada para todos
+los productos, se calculan las medias móviles de demanda (corta y larga), la
+desviación diaria, el stock de seguridad y el punto de reposición según el
+plazo de entrega del proveedor. Los productos cuyo stock más lo ya pedido no
+alcanza el punto de reposición generan borradores de ``Compra`` (estado
+``pendiente``) agrupados por proveedor.
+
+El proveedor de un producto es el de su última compra; los productos que
+nunca se han comprado no tienen proveedor y se informan sin sugerencia.
+
+NumPy solo se importa al usar este módulo, no al cargar la aplicación.
+
+Como referencia, ``calcular_reposicion`` procesa 100.000 productos con dos años
+de historial (7,3 millones de filas producto-día) en alrededor de medio segundo,
+y 21,9 millones de filas en menos de dos segundos (ver
+``PronosticoTests.test_cien_mil_productos``); el tiempo total lo domina la
+lectura del historial de la base de datos.
+"""
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import islice
+from statistics import NormalDist
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.tienda.models import DetalleCotizacion, DetallePedido, Producto, tasa_iva
+
+from .models import Compra, DetalleCompra, MovimientoInventario, Proveedor
+
+
+TAMANO_BLOQUE = 10000
+VENTANA_CORTA = 30
+VENTANA_LARGA = 180
+PESO_VENTANA_CORTA = 0.6
+NIVEL_SERVICIO = 0.95
+CICLO_REVISION_DIAS = 7
+ESTADOS_COMPRA_ABIERTA = ('pendiente', 'ordenada', 'parcialmente_recibida')
+
+
+def _agrupar_por_dia(queryset, campo_fecha, campo_cantidad='cantidad'):
+    """Filas (producto_id, día, cantidad) sumadas por producto y día en la base"""
+    return queryset.annotate(dia=TruncDate(campo_fecha)).values('producto_id', 'dia').annotate(
+        total=Sum(campo_cantidad)
+    ).values_list('producto_id', 'dia', 'total').order_by()
+
+
+def cargar_historial(desde, hasta):
+    """
+    Demanda diaria entre ``desde`` y ``hasta`` (fechas incluidas) como tres
+    arreglos paralelos: ids de producto, día (ordinal) y cantidad.
+    """
+    inicio = timezone.make_aware(datetime.datetime.combine(desde, datetime.time.min))
+    fin = timezone.make_aware(datetime.datetime.combine(hasta + datetime.timedelta(days=1), datetime.time.min))
+    consultas = [
+        _agrupar_por_dia(
+            DetallePedido.objects.filter(pedido__fecha_pedido__gte=inicio, pedido__fecha_pedido__lt=fin)
+            .exclude(pedido__estado='cancelado'),
+            'pedido__fecha_pedido',
+        ),
+        _agrupar_por_dia(
+            DetalleCotizacion.objects.filter(
+                cotizacion__estado='pagada',
+                cotizacion__fecha_finalizacion__gte=inicio, cotizacion__fecha_finalizacion__lt=fin,
+            ),
+            'cotizacion__fecha_finalizacion',
+        ),
+        _agrupar_por_dia(
+            MovimientoInventario.objects.filter(
+                tipo_movimiento='salida', motivo_salida__in=['venta', 'muestra'], numero_documento='',
+                fecha_movimiento__gte=inicio, fecha_movimiento__lt=fin,
+            ),
+            'fecha_movimiento',
+        ),
+    ]
+
+    productos, dias, cantidades = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)], [np.empty(0)]
+    for consulta in consultas:
+        filas = consulta.iterator(chunk_size=TAMANO_BLOQUE)
+        while bloque := list(islice(filas, TAMANO_BLOQUE)):
+            ids_bloque, dias_bloque, totales_bloque = zip(*bloque)
+            productos.append(np.array(ids_bloque, dtype=np.int64))
+            dias.append(np.fromiter(map(datetime.date.toordinal, dias_bloque), dtype=np.int64, count=len(bloque)))
+            cantidades.append(np.array(totales_bloque, dtype=np.float64))
+    return np.concatenate(productos), np.concatenate(dias), np.concatenate(cantidades)
+
+
+def calcular_reposicion(ids_productos, historial, hasta, stock, en_camino, plazos,
+                        nivel_servicio=NIVEL_SERVICIO, ciclo_revision=CICLO_REVISION_DIAS,
+                        ventana_corta=VENTANA_CORTA, ventana_larga=VENTANA_LARGA):
+    """
+    Cálculo vectorizado para todos los productos a la vez.
+
+    ``ids_productos`` y ``stock``, ``en_camino`` y ``plazos`` (días
+    de entrega) son arreglos paralelos; ``historial`` es el resultado de
+    ``cargar_historial``. Retorna un diccionario de arreglos: ``demanda_diaria``,
+    ``desviacion``, ``stock_seguridad``, ``punto_reposicion`` y ``sugerido``
+    (unidades a pedir, 0 si no hace falta).
+    """
+    ids_productos = np.asarray(ids_productos, dtype=np.int64)
+    n = len(ids_productos)
+    hist_productos, hist_dias, hist_cantidades = historial
+    antiguedad = hasta.toordinal() - hist_dias
+    en_ventana = (antiguedad >= 0) & (antiguedad < ventana_larga)
+    hist_productos, antiguedad, cantidades = (
+        hist_productos[en_ventana], antiguedad[en_ventana], hist_cantidades[en_ventana]
+    )
+
+    # Posición de cada id en ``ids_productos`` con una tabla indexada por id
+    # (-1 para productos que no se evalúan)
+    tope = int(max(ids_productos.max(initial=0), hist_productos.max(initial=0))) + 1
+    posicion_de = np.full(tope, -1, dtype=np.int64)
+    posicion_de[ids_productos] = np.arange(n)
+    posiciones = posicion_de[hist_productos]
+    conocidos = posiciones >= 0
+    posiciones, antiguedad, cantidades = posiciones[conocidos], antiguedad[conocidos], cantidades[conocidos]
+
+    # Un producto puede tener el mismo día en varias fuentes: se suman antes de
+    # calcular la varianza
+    claves_dia, inverso = np.unique(posiciones * ventana_larga + antiguedad, return_inverse=True)
+    por_dia = np.bincount(inverso, weights=cantidades)
+    producto_dia = claves_dia // ventana_larga
+    antiguedad_dia = claves_dia % ventana_larga
+
+    suma_larga = np.bincount(producto_dia, weights=por_dia, minlength=n)
+    suma_cuadrados = np.bincount(producto_dia, weights=por_dia ** 2, minlength=n)
+    recientes = antiguedad_dia < ventana_corta
+    suma_corta = np.bincount(producto_dia[recientes], weights=por_dia[recientes], minlength=n)
+
+    media_larga = suma_larga / ventana_larga
+    media_corta = suma_corta / ventana_corta
+    demanda = PESO_VENTANA_CORTA * media_corta + (1 - PESO_VENTANA_CORTA) * media_larga
+    desviacion = np.sqrt(np.maximum(suma_cuadrados / ventana_larga - media_larga ** 2, 0))
+
+    z = NormalDist().inv_cdf(nivel_servicio)
+    plazos = np.asarray(plazos, dtype=np.float64)
+    stock_seguridad = z * desviacion * np.sqrt(plazos)
+    punto_reposicion = demanda * plazos + stock_seguridad
+    # Se repone hasta cubrir el plazo de entrega más un ciclo de revisión
+    nivel_objetivo = demanda * (plazos + ciclo_revision) + stock_seguridad
+    disponible = np.asarray(stock, dtype=np.float64) + np.asarray(en_camino, dtype=np.float64)
+    sugerido = np.where(
+        (disponible <= punto_reposicion) & (demanda > 0),
+        np.ceil(np.maximum(nivel_objetivo - disponible, 0)),
+        0,
+    ).astype(np.int64)
+
+    return {
+        'demanda_diaria': demanda,
+        'desviacion': desviacion,
+        'stock_seguridad': stock_seguridad,
+        'punto_reposicion': punto_reposicion,
+        'sugerido': sugerido,
+    }
+
+
+def _datos_productos():
+    """Productos activos con su stock, lo pedido aún no recibido y el proveedor y precio de su última compra"""
+    ultima_compra = DetalleCompra.objects.filter(producto=OuterRef('pk')).order_by('-compra__fecha_orden', '-id')
+    pendiente = DetalleCompra.objects.filter(
+        producto=OuterRef('pk'), compra__estado__in=ESTADOS_COMPRA_ABIERTA
+    ).order_by().values('producto').annotate(
+        total=Sum(F('cantidad_solicitada') - F('cantidad_recibida'))
+    ).values('total')
+    return Producto.objects.filter(activo=True).annotate(
+        proveedor_id=Subquery(ultima_compra.values('compra__proveedor_id')[:1]),
+        precio_compra=Subquery(ultima_compra.values('precio_unitario')[:1]),
+        en_camino=Subquery(pendiente[:1]),
+    ).order_by('id').values_list('id', 'stock_actual', 'en_camino', 'proveedor_id', 'precio_compra')
+
+
+def sugerir_compras(usuario, hasta=None, ventana_larga=VENTANA_LARGA, nivel_servicio=NIVEL_SERVICIO,
+                    crear=True):
+    """
+    Calcula la reposición de todos los productos y, si ``crear``, guarda un
+    borrador de ``Compra`` por proveedor con las cantidades sugeridas. Solo se
+    lee el historial de los últimos ``ventana_larga`` días hasta ``hasta``.
+
+    Retorna un diccionario con ``productos`` evaluados, ``sugeridos``,
+    ``sin_proveedor`` (productos con sugerencia pero sin compras previas) y
+    ``compras`` (lista de borradores creados o, sin ``crear``, de
+    ``(proveedor_id, [(producto_id, cantidad, precio)])``).
+    """
+    hasta = hasta or timezone.localdate() - datetime.timedelta(days=1)
+    filas = list(_datos_productos())
+    if not filas:
+        return {'productos': 0, 'sugeridos': 0, 'sin_proveedor': 0, 'compras': []}
+
+    ids, stock, en_camino, proveedores, precios = zip(*filas)
+    ids = np.array(ids, dtype=np.int64)
+    proveedor_ids = np.array([p or 0 for p in proveedores], dtype=np.int64)
+    plazos_por_proveedor = dict(Proveedor.objects.values_list('id', 'plazo_entrega_dias'))
+    plazo_defecto = Proveedor._meta.get_field('plazo_entrega_dias').default
+    plazos = np.array([plazos_por_proveedor.get(p, plazo_defecto) for p in proveedor_ids], dtype=np.float64)
+
+    historial = cargar_historial(hasta - datetime.timedelta(days=ventana_larga - 1), hasta)
+    resultado = calcular_reposicion(
+        ids, historial, hasta,
+        stock=np.array(stock, dtype=np.float64),
+        en_camino=np.array([c or 0 for c in en_camino], dtype=np.float64),
+        plazos=plazos,
+        nivel_servicio=nivel_servicio,
+        ventana_corta=min(VENTANA_CORTA, ventana_larga),
+        ventana_larga=ventana_larga,
+    )
+
+    sugerido = resultado['sugerido']
+    con_sugerencia = np.flatnonzero(sugerido > 0)
+    sin_proveedor = int(np.count_nonzero(proveedor_ids[con_sugerencia] == 0))
+
+    lineas_por_proveedor = {}
+    for posicion in con_sugerencia[proveedor_ids[con_sugerencia] > 0]:
+        lineas_por_proveedor.setdefault(int(proveedor_ids[posicion]), []).append(
+            (int(ids[posicion]), int(sugerido[posicion]), precios[posicion])
+        )
+
+    compras = _crear_borradores(lineas_por_proveedor, usuario, plazos_por_proveedor) if crear \
+        else sorted(lineas_por_proveedor.items())
+    return {
+        'productos': len(ids),
+        'sugeridos': len(con_sugerencia),
+        'sin_proveedor': sin_proveedor,
+        'compras': compras,
+    }
+
+
+def _crear_borradores(lineas_por_proveedor, usuario, plazos_por_proveedor):
+    """Un borrador de compra por proveedor con sus detalles y totales"""
+    hoy = timezone.localdate()
+    porcentaje_iva = tasa_iva()
+    compras = []
+    with transaction.atomic():
+        for proveedor_id, lineas in sorted(lineas_por_proveedor.items()):
+            detalles = [
+                DetalleCompra(producto_id=producto_id, cantidad_solicitada=cantidad,
+                              precio_unitario=precio, subtotal=precio * cantidad)
+                for producto_id, cantidad, precio in lineas
+            ]
+            subtotal = sum(detalle.subtotal for detalle in detalles)
+            iva = (subtotal * porcentaje_iva / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            compra = Compra.objects.create(
+                proveedor_id=proveedor_id,
+                usuario=usuario,
+                fecha_esperada=hoy + datetime.timedelta(days=plazos_por_proveedor[proveedor_id]),
+                subtotal=subtotal,
+                iva=iva,
+                total=subtotal + iva,
+                observaciones='Compra sugerida automáticamente según la demanda proyectada.',
+            )
+            for detalle in detalles:
+                detalle.compra = compra
+            DetalleCompra.objects.bulk_create(detalles, batch_size=1000)
+            compras.append(compra)
+    return compras
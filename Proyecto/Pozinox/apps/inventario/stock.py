@@ -0,0 +1,229 @@
+"""
+Servicio de stock: único punto que modifica ``Producto.stock_actual``.
+
+Cada cambio de stock deja una fila en ``MovimientoInventario`` con la cantidad
+anterior y la nueva, en la misma transacción que actualiza el producto. Así el
+libro de movimientos siempre cuadra con el stock: la ``cantidad_nueva`` del
+último movimiento de un producto es su ``stock_actual``.
+
+``aplicar_movimientos`` recibe un lote de movimientos y lo aplica con una
+cantidad fija de consultas: bloquea todas las filas de productos involucradas
+(en orden de id, para no producir deadlocks), calcula los saldos en memoria y
+guarda con ``bulk_update`` / ``bulk_create``. El lote es todo o nada: si un
+movimiento falla (por ejemplo, stock insuficiente) no se aplica ninguno.
+``entrada``, ``salida``, ``ajuste`` y ``transferencia`` son atajos para un
+solo movimiento.
+
+Al confirmar cada lote se reevalúan las alertas de stock de los productos
+involucrados (ver ``alertas.py``).
+
+No hay bodegas en el modelo, así que una transferencia mueve unidades de un
+producto a otro (por ejemplo, al recodificar un artículo) y queda registrada
+como una salida en el origen y una entrada en el destino.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.tienda.cache import invalidar_catalogo
+from apps.tienda.models import Producto
+
+from .alertas import evaluar_alertas
+from .models import MovimientoInventario
+
+
+TIPOS = ('entrada', 'salida', 'ajuste', 'transferencia')
+
+
+class ErrorStock(Exception):
+    """Movimiento de stock inválido; el lote completo se descarta"""
+
+
+class StockInsuficiente(ErrorStock):
+    """La salida deja el stock de un producto bajo cero"""
+
+
+def _id(valor):
+    return getattr(valor, 'pk', valor)
+
+
+def _normalizar(numero, movimiento):
+    """Valida un movimiento del lote y lo retorna con ids y cantidades enteras"""
+    tipo = movimiento.get('tipo')
+    if tipo not in TIPOS:
+        raise ErrorStock(f'Movimiento {numero}: tipo inválido {tipo!r}')
+    try:
+        cantidad = int(movimiento.get('cantidad'))
+        producto_id = int(_id(movimiento.get('producto')))
+    except (TypeError, ValueError):
+        raise ErrorStock(f'Movimiento {numero}: producto y cantidad deben ser enteros')
+    if cantidad < 0 or (cantidad == 0 and tipo != 'ajuste'):
+        raise ErrorStock(f'Movimiento {numero}: la cantidad debe ser mayor a 0')
+
+    normalizado = {
+        'tipo': tipo,
+        'producto': producto_id,
+        'cantidad': cantidad,
+        'motivo': movimiento.get('motivo') or '',
+        'numero_documento': movimiento.get('numero_documento') or '',
+        'proveedor_id': _id(movimiento.get('proveedor')),
+        'observaciones': movimiento.get('observaciones') or '',
+    }
+    if tipo == 'transferencia':
+        try:
+            normalizado['destino'] = int(_id(movimiento.get('destino')))
+        except (TypeError, ValueError):
+            raise ErrorStock(f'Movimiento {numero}: la transferencia requiere un producto de destino')
+        if normalizado['destino'] == producto_id:
+            raise ErrorStock(f'Movimiento {numero}: el origen y el destino son el mismo producto')
+    return normalizado
+
+
+def _bloquear(ids):
+    """Bloquea las filas de los productos y las retorna por id"""
+    productos = Producto.objects.filter(id__in=ids).order_by('id').only('id', 'codigo_producto', 'stock_actual')
+    if connection.features.has_select_for_update:
+        productos = productos.select_for_update()
+    else:
+        # SQLite no bloquea filas: una escritura inicial toma el bloqueo de
+        # escritura de la base y serializa los lotes concurrentes
+        Producto.objects.filter(id__in=ids).update(stock_actual=F('stock_actual'))
+    return {producto.id: producto for producto in productos}
+
+
+def aplicar_movimientos(movimientos, usuario):
+    """
+    Aplica un lote de movimientos de stock en una transacción.
+
+    Cada movimiento es un diccionario con ``tipo`` (entrada, salida, ajuste o
+    transferencia), ``producto`` (id o instancia), ``cantidad`` (en un ajuste,
+    el stock contado) y opcionalmente ``motivo``, ``destino`` (transferencias),
+    ``numero_documento``, ``proveedor`` y ``observaciones``. Los movimientos se
+    aplican en orden. Retorna las filas de ``MovimientoInventario`` creadas.
+    """
+    pasos = [_normalizar(numero, movimiento) for numero, movimiento in enumerate(movimientos, start=1)]
+    if not pasos:
+        return []
+    ids = sorted({paso['producto'] for paso in pasos} | {paso['destino'] for paso in pasos if 'destino' in paso})
+
+    with transaction.atomic():
+        productos = _bloquear(ids)
+        faltantes = set(ids) - set(productos)
+        if faltantes:
+            raise ErrorStock(f'No existen los productos {sorted(faltantes)}')
+
+        registros = []
+
+        def registrar(producto, tipo, cantidad, nuevo, paso, motivo_entrada='', motivo_salida=''):
+            registros.append(MovimientoInventario(
+                producto_id=producto.id,
+                tipo_movimiento=tipo,
+                motivo_entrada=motivo_entrada,
+                motivo_salida=motivo_salida,
+                cantidad=cantidad,
+                cantidad_anterior=producto.stock_actual,
+                cantidad_nueva=nuevo,
+                numero_documento=paso['numero_documento'],
+                proveedor_id=paso['proveedor_id'],
+                usuario=usuario,
+                observaciones=paso['observaciones'],
+            ))
+            producto.stock_actual = nuevo
+
+        def descontar(producto, cantidad):
+            if cantidad > producto.stock_actual:
+                raise StockInsuficiente(
+                    f'Stock insuficiente de {producto.codigo_producto}: '
+                    f'hay {producto.stock_actual}, se requieren {cantidad}'
+                )
+            return producto.stock_actual - cantidad
+
+        for paso in pasos:
+            producto = productos[paso['producto']]
+            cantidad = paso['cantidad']
+            if paso['tipo'] == 'entrada':
+                registrar(producto, 'entrada', cantidad, producto.stock_actual + cantidad, paso,
+                          motivo_entrada=paso['motivo'] or 'compra')
+            elif paso['tipo'] == 'salida':
+                registrar(producto, 'salida', cantidad, descontar(producto, cantidad), paso,
+                          motivo_salida=paso['motivo'] or 'venta')
+            elif paso['tipo'] == 'ajuste':
+                # El motivo indica el sentido del ajuste
+                diferencia = cantidad - producto.stock_actual
+                motivo = {'motivo_entrada' if diferencia >= 0 else 'motivo_salida': 'ajuste_inventario'}
+                registrar(producto, 'ajuste', abs(diferencia), cantidad, paso, **motivo)
+            else:
+                destino = productos[paso['destino']]
+                registrar(producto, 'transferencia', cantidad, descontar(producto, cantidad), paso,
+                          motivo_salida='transferencia_salida')
+                registrar(destino, 'transferencia', cantidad, destino.stock_actual + cantidad, paso,
+                          motivo_entrada='transferencia_entrada')
+
+        ahora = timezone.now()
+        for producto in productos.values():
+            producto.fecha_actualizacion = ahora
+        Producto.objects.bulk_update(productos.values(), ['stock_actual', 'fecha_actualizacion'])
+        registros = MovimientoInventario.objects.bulk_create(registros)
+        # bulk_update no dispara las señales que invalidan el catálogo cacheado
+        transaction.on_commit(invalidar_catalogo)
+        transaction.on_commit(lambda: evaluar_alertas(ids))
+    return registros
+
+
+def registrar_inventario_inicial(productos, usuario, observaciones=''):
+    """
+    Registra el stock con que se crearon productos nuevos como entradas de
+    inventario inicial, con un solo ``bulk_create``.
+
+    Es para altas masivas: los productos deben haberse creado en la transacción
+    en curso (nadie más pudo moverlos), así que no se bloquean filas ni se
+    reescribe el stock. Retorna los movimientos creados.
+    """
+    registros = MovimientoInventario.objects.bulk_create([
+        MovimientoInventario(
+            producto_id=producto.pk,
+            tipo_movimiento='entrada',
+            motivo_entrada='inventario_inicial',
+            cantidad=producto.stock_actual,
+            cantidad_anterior=0,
+            cantidad_nueva=producto.stock_actual,
+            usuario=usuario,
+            observaciones=observaciones,
+        )
+        for producto in productos if producto.stock_actual
+    ])
+    if registros:
+        transaction.on_commit(invalidar_catalogo)
+    return registros
+
+
+def _aplicar_uno(producto, usuario, **movimiento):
+    registros = aplicar_movimientos([dict(movimiento, producto=producto)], usuario)
+    if isinstance(producto, Producto):
+        producto.stock_actual = registros[0].cantidad_nueva
+    return registros
+
+
+def entrada(producto, cantidad, usuario, motivo='compra', **referencias):
+    """Suma unidades al stock; retorna el movimiento"""
+    return _aplicar_uno(producto, usuario, tipo='entrada', cantidad=cantidad, motivo=motivo, **referencias)[0]
+
+
+def salida(producto, cantidad, usuario, motivo='venta', **referencias):
+    """Descuenta unidades del stock (``StockInsuficiente`` si no alcanzan); retorna el movimiento"""
+    return _aplicar_uno(producto, usuario, tipo='salida', cantidad=cantidad, motivo=motivo, **referencias)[0]
+
+
+def ajuste(producto, cantidad_nueva, usuario, **referencias):
+    """Fija el stock en ``cantidad_nueva`` (por ejemplo, tras un conteo físico); retorna el movimiento"""
+    return _aplicar_uno(producto, usuario, tipo='ajuste', cantidad=cantidad_nueva, **referencias)[0]
+
+
+def transferencia(origen, destino, cantidad, usuario, **referencias):
+    """Mueve unidades de un producto a otro; retorna los movimientos (salida, entrada)"""
+    salida_origen, entrada_destino = _aplicar_uno(
+        origen, usuario, tipo='transferencia', destino=destino, cantidad=cantidad, **referencias
+    )
+    if isinstance(destino, Producto):
+        destino.stock_actual = entrada_destino.cantidad_nueva
+    return salida_origen, entrada_destino
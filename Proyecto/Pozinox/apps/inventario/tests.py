@@ -1,3 +1,348 @@
-from django.test import TestCase
+import datetime
+import random
+import threading
+import time
+import unittest
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.tienda.models import CategoriaAcero, Producto
+from apps.usuarios.models import ConfiguracionSistema
+
+from . import alertas, cierres, stock
+from .models import AlertaInventario, CierreStock, Compra, DetalleCompra, MovimientoInventario, Proveedor
+
+try:
+    import numpy as np
+    from . import pronostico
+except ImportError:
+    np = None
+
+
+def crear_productos(cantidad, stock_inicial=0):
+    categoria = CategoriaAcero.objects.create(nombre='Planchas')
+    return [
+        Producto.objects.create(
+            nombre=f'Plancha {i}', codigo_producto=f'PL-{i}', categoria=categoria,
+            precio_por_unidad=Decimal('1000'), stock_actual=stock_inicial,
+        )
+        for i in range(cantidad)
+    ]
+
+
+class LibroInventarioMixin:
+    """Verifica que el libro de movimientos cuadre con el stock de cada producto"""
+
+    def assertLibroCuadra(self, productos, stock_inicial=0):
+        for producto in productos:
+            producto.refresh_from_db()
+            saldo = stock_inicial
+            for movimiento in MovimientoInventario.objects.filter(producto=producto).order_by('id'):
+                self.assertEqual(movimiento.cantidad_anterior, saldo)
+                saldo = movimiento.cantidad_nueva
+            self.assertEqual(saldo, producto.stock_actual)
+
+
+class StockTests(LibroInventarioMixin, TestCase):
+    """Servicio de movimientos de stock"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('bodega', 'bodega@pozinox.cl', 'clave')
+        self.origen, self.destino = crear_productos(2)
+
+    def test_movimientos_individuales(self):
+        stock.entrada(self.origen, 10, self.usuario, numero_documento='FAC-1')
+        stock.salida(self.origen, 3, self.usuario)
+        stock.transferencia(self.origen, self.destino, 2, self.usuario)
+        ajuste = stock.ajuste(self.destino, 1, self.usuario)
+
+        self.assertEqual(self.origen.stock_actual, 5)
+        self.assertEqual(self.destino.stock_actual, 1)
+        self.assertEqual((ajuste.cantidad, ajuste.motivo_salida), (1, 'ajuste_inventario'))
+        self.assertLibroCuadra([self.origen, self.destino])
+
+    def test_lote_es_todo_o_nada(self):
+        stock.entrada(self.origen, 5, self.usuario)
+        with self.assertRaises(stock.StockInsuficiente):
+            stock.aplicar_movimientos([
+                {'tipo': 'entrada', 'producto': self.destino.id, 'cantidad': 4},
+                {'tipo': 'salida', 'producto': self.origen.id, 'cantidad': 6},
+            ], self.usuario)
+
+        self.destino.refresh_from_db()
+        self.assertEqual(self.destino.stock_actual, 0)
+        self.assertEqual(MovimientoInventario.objects.count(), 1)
+
+    def test_consultas_no_dependen_del_tamano_del_lote(self):
+        def lote(tamano):
+            return [
+                {'tipo': 'entrada', 'producto': random.choice([self.origen, self.destino]), 'cantidad': 1}
+                for _ in range(tamano)
+            ]
+
+        with CaptureQueriesContext(connection) as pequeno:
+            stock.aplicar_movimientos(lote(5), self.usuario)
+        with CaptureQueriesContext(connection) as grande:
+            stock.aplicar_movimientos(lote(60), self.usuario)
+        self.assertEqual(len(pequeno), len(grande))
+        self.assertLibroCuadra([self.origen, self.destino])
+
+
+class CierreStockTests(TestCase):
+    """Stock histórico a partir de cierres y movimientos"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('bodega', 'bodega@pozinox.cl', 'clave')
+        self.productos = crear_productos(3)
+        Producto.objects.update(fecha_creacion=timezone.now() - datetime.timedelta(days=30))
+        self.hoy = timezone.localdate()
+
+    def mover(self, dias_atras, producto, tipo, cantidad):
+        movimiento = stock.aplicar_movimientos(
+            [{'tipo': tipo, 'producto': producto, 'cantidad': cantidad}], self.usuario
+        )[0]
+        instante = cierres.corte_del_dia(self.hoy - datetime.timedelta(days=dias_atras + 1)) + datetime.timedelta(hours=12)
+        MovimientoInventario.objects.filter(id=movimiento.id).update(fecha_movimiento=instante)
+
+    def test_stock_en_una_fecha_con_y_sin_cierres(self):
+        primero, segundo, _ = self.productos
+        self.mover(10, primero, 'entrada', 20)
+        self.mover(8, primero, 'salida', 5)
+        self.mover(3, primero, 'entrada', 7)
+        self.mover(2, segundo, 'entrada', 4)
+        esperado = {11: 0, 10: 20, 8: 15, 5: 15, 3: 22, 0: 22}
+
+        for dias, cantidad in esperado.items():
+            self.assertEqual(cierres.stock_producto(primero, self.hoy - datetime.timedelta(days=dias)), cantidad)
+
+        cierres.generar_cierres(self.hoy - datetime.timedelta(days=9))
+        cierres.generar_cierres(self.hoy - datetime.timedelta(days=4))
+        # El segundo cierre solo incluye al producto que se movió desde el primero
+        self.assertEqual(CierreStock.objects.filter(fecha=self.hoy - datetime.timedelta(days=4)).count(), 1)
+        for dias, cantidad in esperado.items():
+            self.assertEqual(cierres.stock_producto(primero, self.hoy - datetime.timedelta(days=dias)), cantidad)
+        self.assertEqual(cierres.stock_producto(segundo, self.hoy), 4)
+
+    def test_valorizacion_en_una_consulta(self):
+        for producto in self.productos:
+            self.mover(5, producto, 'entrada', 10)
+        self.mover(1, self.productos[0], 'salida', 4)
+        cierres.generar_cierres(self.hoy - datetime.timedelta(days=3))
+
+        with self.assertNumQueries(1):
+            totales = cierres.valorizacion(self.hoy)
+        self.assertEqual(totales['unidades'], 26)
+        self.assertEqual(totales['valor'], Decimal('26000'))
+
+
+class AlertaInventarioTests(TestCase):
+    """Motor de alertas de stock"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('bodega', 'bodega@pozinox.cl', 'clave')
+
+    def abiertas(self):
+        return sorted(AlertaInventario.objects.filter(leida=False).values_list('producto__codigo_producto', 'tipo_alerta'))
+
+    def test_revision_completa_sin_duplicados(self):
+        for producto, cantidad in zip(crear_productos(4), [0, 2, 5, 20]):
+            Producto.objects.filter(pk=producto.pk).update(stock_actual=cantidad, stock_minimo=5)
+
+        with self.assertNumQueries(5):
+            self.assertEqual(alertas.evaluar_alertas(), {'creadas': 3, 'cerradas': 0})
+        self.assertEqual(alertas.evaluar_alertas(), {'creadas': 0, 'cerradas': 0})
+        self.assertEqual(self.abiertas(), [
+            ('PL-0', 'sin_stock'), ('PL-1', 'stock_critico'), ('PL-2', 'stock_bajo'),
+        ])
+
+    def test_movimientos_actualizan_las_alertas(self):
+        producto = crear_productos(1)[0]
+        alertas.evaluar_alertas()
+        self.assertEqual(self.abiertas(), [('PL-0', 'sin_stock')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.entrada(producto, 4, self.usuario)
+        self.assertEqual(self.abiertas(), [('PL-0', 'stock_bajo')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.entrada(producto, 10, self.usuario)
+        self.assertEqual(self.abiertas(), [])
+
+    def test_respeta_la_configuracion(self):
+        crear_productos(1)
+        Producto.objects.update(stock_actual=4)
+        ConfiguracionSistema.objects.create(alerta_stock_bajo=False)
+        self.assertEqual(alertas.evaluar_alertas(), {'creadas': 0, 'cerradas': 0})
+
+    def test_cambiar_la_configuracion_revisa_el_catalogo(self):
+        crear_productos(2)
+        Producto.objects.update(stock_actual=4, stock_minimo=0)
+        alertas.evaluar_alertas()
+        self.assertEqual(self.abiertas(), [('PL-0', 'stock_bajo'), ('PL-1', 'stock_bajo')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            configuracion = ConfiguracionSistema.objects.create(stock_minimo_global=3)
+        self.assertEqual(self.abiertas(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            configuracion.stock_minimo_global = 8
+            configuracion.save()
+        self.assertEqual(self.abiertas(), [('PL-0', 'stock_critico'), ('PL-1', 'stock_critico')])
+
+    def test_salida_muy_superior_al_promedio(self):
+        normal, habitual, pequeno = crear_productos(3, stock_inicial=1000)
+        # Historial: 30 unidades en el mes de PL-0 (1 diaria) y 600 de PL-1 (20 diarias)
+        stock.salida(normal, 30, self.usuario)
+        stock.salida(habitual, 600, self.usuario)
+        MovimientoInventario.objects.update(fecha_movimiento=timezone.now() - datetime.timedelta(days=10))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.aplicar_movimientos([
+                {'tipo': 'salida', 'producto': normal, 'cantidad': 12},
+                {'tipo': 'salida', 'producto': habitual, 'cantidad': 40},
+                {'tipo': 'salida', 'producto': pequeno, 'cantidad': 5},
+            ], self.usuario)
+        self.assertEqual(self.abiertas(), [('PL-0', 'movimiento_anomalo')])
+
+        # Una sola alerta por día, aunque se marque como leída y sigan las salidas
+        AlertaInventario.objects.update(leida=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.salida(normal, 20, self.usuario)
+        self.assertEqual(AlertaInventario.objects.filter(tipo_alerta='movimiento_anomalo').count(), 1)
+        self.assertEqual(alertas.evaluar_alertas(), {'creadas': 0, 'cerradas': 0})
+
+
+@unittest.skipIf(np is None, 'El pronóstico de demanda requiere NumPy')
+class PronosticoTests(TestCase):
+    """Pronóstico de demanda y sugerencia de compras"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('bodega', 'bodega@pozinox.cl', 'clave')
+        self.hasta = timezone.localdate() - datetime.timedelta(days=1)
+
+    def test_calculo_vectorizado(self):
+        ids = np.array([3, 7, 9])
+        # 2 unidades diarias del producto 3 en los últimos 10 días (en dos
+        # fuentes el mismo día), 1 unidad del 7 hace 100 días y ventas de un
+        # producto que no se evalúa
+        dias = self.hasta.toordinal() - np.array(list(range(10)) + [0, 100, 0])
+        productos = np.array([3] * 10 + [3, 7, 5])
+        cantidades = np.array([2.0] * 10 + [2.0, 1.0, 50.0])
+
+        resultado = pronostico.calcular_reposicion(
+            ids, (productos, dias, cantidades), self.hasta,
+            stock=[0, 100, 0], en_camino=[0, 0, 0], plazos=[7, 7, 7], ventana_corta=10, ventana_larga=180,
+        )
+        demanda = resultado['demanda_diaria']
+        self.assertAlmostEqual(demanda[0], 0.6 * 22 / 10 + 0.4 * 22 / 180)
+        self.assertAlmostEqual(demanda[1], 0.4 / 180)
+        self.assertEqual(demanda[2], 0)
+        self.assertGreater(resultado['stock_seguridad'][0], 0)
+        self.assertEqual(list(resultado['sugerido'] > 0), [True, False, False])
+
+    def test_crea_borradores_por_proveedor(self):
+        vendido, sin_ventas, sin_proveedor = crear_productos(3, stock_inicial=0)
+        proveedor = Proveedor.objects.create(
+            nombre='Aceros Sur', razon_social='Aceros Sur SpA', rut='76.123.456-7', email='ventas@acerossur.cl',
+            telefono='221234567', direccion='Av. Industrial 100', comuna='Quilicura', ciudad='Santiago',
+            plazo_entrega_dias=5,
+        )
+        anterior = Compra.objects.create(proveedor=proveedor, usuario=self.usuario, fecha_esperada=self.hasta,
+                                         estado='completada')
+        for producto in (vendido, sin_ventas):
+            DetalleCompra.objects.create(compra=anterior, producto=producto, cantidad_solicitada=1,
+                                         cantidad_recibida=1, precio_unitario=Decimal('800'))
+
+        for producto in (vendido, sin_proveedor):
+            stock.entrada(producto, 500, self.usuario)
+            for dias in range(20):
+                movimiento = stock.salida(producto, 3, self.usuario)
+                MovimientoInventario.objects.filter(id=movimiento.id).update(
+                    fecha_movimiento=cierres.corte_del_dia(self.hasta - datetime.timedelta(days=dias + 1))
+                )
+        Producto.objects.filter(pk=vendido.pk).update(stock_actual=2)
+
+        with unittest.mock.patch.object(pronostico, 'cargar_historial', wraps=pronostico.cargar_historial) as cargar:
+            resultado = pronostico.sugerir_compras(self.usuario, hasta=self.hasta)
+        # Solo se lee la ventana larga, el historial que usa el cálculo
+        cargar.assert_called_once_with(self.hasta - datetime.timedelta(days=pronostico.VENTANA_LARGA - 1), self.hasta)
+        self.assertEqual((resultado['productos'], resultado['sugeridos'], resultado['sin_proveedor']), (3, 1, 0))
+        compra = resultado['compras'][0]
+        detalle = compra.detalles.get()
+        self.assertEqual((compra.proveedor, compra.estado, detalle.producto), (proveedor, 'pendiente', vendido))
+        self.assertEqual(compra.subtotal, detalle.cantidad_solicitada * Decimal('800'))
+
+        # Lo ya pedido cuenta como disponible: no se vuelve a sugerir
+        self.assertEqual(pronostico.sugerir_compras(self.usuario, hasta=self.hasta)['sugeridos'], 0)
+
+    def test_cien_mil_productos(self):
+        # Dos años de historial con ventas en uno de cada diez días por producto
+        azar = np.random.default_rng(0)
+        n, filas = 100_000, 7_300_000
+        historial = (
+            azar.integers(1, n + 1, filas),
+            self.hasta.toordinal() - azar.integers(0, 730, filas),
+            azar.integers(1, 20, filas).astype(np.float64),
+        )
+        inicio = time.perf_counter()
+        resultado = pronostico.calcular_reposicion(
+            np.arange(1, n + 1), historial, self.hasta,
+            stock=np.zeros(n), en_camino=np.zeros(n), plazos=np.full(n, 7.0),
+        )
+        self.assertLess(time.perf_counter() - inicio, 10)
+        self.assertEqual(len(resultado['sugerido']), n)
+
+
+class StockConcurrenciaTests(LibroInventarioMixin, TransactionTestCase):
+    """
+    Prueba de carga: muchos hilos moviendo stock de los mismos productos.
+
+    En PostgreSQL los serializa el bloqueo de las filas de productos; en SQLite
+    la transacción IMMEDIATE (ver DATABASES en settings) sobre la base de
+    pruebas en archivo.
+    """
+    HILOS = 16
+    LOTES_POR_HILO = 15
+    STOCK_INICIAL = 50
+
+    def test_libro_cuadra_con_el_stock(self):
+        usuario = User.objects.create_user('bodega', 'bodega@pozinox.cl', 'clave')
+        productos = crear_productos(4, stock_inicial=self.STOCK_INICIAL)
+        ids = [producto.id for producto in productos]
+        barrera = threading.Barrier(self.HILOS)
+        errores = []
+
+        def mover(semilla):
+            azar = random.Random(semilla)
+            try:
+                barrera.wait()
+                for _ in range(self.LOTES_POR_HILO):
+                    origen, destino = azar.sample(ids, 2)
+                    movimientos = [
+                        {'tipo': 'entrada', 'producto': origen, 'cantidad': azar.randint(1, 5)},
+                        {'tipo': 'transferencia', 'producto': origen, 'destino': destino, 'cantidad': 1},
+                        {'tipo': 'salida', 'producto': destino, 'cantidad': azar.randint(1, 5)},
+                    ]
+                    try:
+                        stock.aplicar_movimientos(movimientos, usuario)
+                    except stock.StockInsuficiente:
+                        pass
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=mover, args=(i,)) for i in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertTrue(MovimientoInventario.objects.exists())
+        self.assertLibroCuadra(productos, stock_inicial=self.STOCK_INICIAL)
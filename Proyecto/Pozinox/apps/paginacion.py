@@ -0,0 +1,241 @@
+"""
+Paginación por cursor (keyset / seek) para listados grandes.
+
+A diferencia de ``django.core.paginator.Paginator``, no usa ``OFFSET`` ni
+necesita un ``COUNT(*)``: cada página se obtiene filtrando por los valores de
+orden del último (o primer) registro de la página anterior, por lo que la
+página 500 cuesta lo mismo que la página 1 siempre que exista un índice sobre
+las columnas de orden.
+
+Los cursores son opacos: se firman con ``django.core.signing`` para que no se
+puedan manipular desde la URL.
+"""
+import datetime
+import json
+from decimal import Decimal
+
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
+from django.http import QueryDict
+
+
+SALT_CURSOR = 'apps.paginacion.cursor'
+
+
+def _codificar_valor(valor):
+    if isinstance(valor, datetime.datetime):
+        return {'dt': valor.isoformat()}
+    if isinstance(valor, datetime.date):
+        return {'d': valor.isoformat()}
+    if isinstance(valor, Decimal):
+        return {'dec': str(valor)}
+    return valor
+
+
+def _decodificar_valor(valor):
+    if isinstance(valor, dict):
+        if 'dt' in valor:
+            return datetime.datetime.fromisoformat(valor['dt'])
+        if 'd' in valor:
+            return datetime.date.fromisoformat(valor['d'])
+        if 'dec' in valor:
+            return Decimal(valor['dec'])
+    return valor
+
+
+def codificar_cursor(direccion, valores):
+    """Genera un cursor opaco a partir de la dirección ('n' o 'p') y los valores de orden"""
+    if valores is not None:
+        valores = [_codificar_valor(v) for v in valores]
+    return signing.dumps({'d': direccion, 'v': valores}, salt=SALT_CURSOR, compress=True)
+
+
+def decodificar_cursor(cursor):
+    """Retorna (direccion, valores) o None si el cursor es inválido"""
+    try:
+        datos = signing.loads(cursor, salt=SALT_CURSOR)
+        direccion = datos['d']
+        valores = datos['v']
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+    if direccion not in ('n', 'p'):
+        return None
+    if valores is not None:
+        valores = [_decodificar_valor(v) for v in valores]
+    return direccion, valores
+
+
+def estimar_total(queryset):
+    """
+    Estima la cantidad de filas sin recorrer la tabla.
+
+    En PostgreSQL usa ``pg_class.reltuples`` para la tabla completa o la
+    estimación del planificador (``EXPLAIN``) si hay filtros. En otros motores
+    recurre a ``count()``.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            fila = cursor.fetchone()
+            if fila and fila[0] >= 0:
+                return fila[0]
+
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class PaginaCursor:
+    """Página de resultados con enlaces a la página anterior y siguiente"""
+
+    def __init__(self, object_list, has_previous, has_next, cursor_anterior, cursor_siguiente,
+                 parametros, total=None, total_estimado=False):
+        self.object_list = object_list
+        self.has_previous = has_previous
+        self.has_next = has_next
+        self.cursor_anterior = cursor_anterior
+        self.cursor_siguiente = cursor_siguiente
+        self.total = total
+        self.total_estimado = total_estimado
+        self._parametros = parametros
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+    @property
+    def has_other_pages(self):
+        return self.has_previous or self.has_next
+
+    def _url(self, cursor):
+        parametros = self._parametros.copy()
+        parametros.pop('cursor', None)
+        parametros.pop('page', None)
+        if cursor:
+            parametros['cursor'] = cursor
+        consulta = parametros.urlencode()
+        return f'?{consulta}' if consulta else '?'
+
+    @property
+    def url_primera(self):
+        return self._url(None)
+
+    @property
+    def url_anterior(self):
+        return self._url(self.cursor_anterior)
+
+    @property
+    def url_siguiente(self):
+        return self._url(self.cursor_siguiente)
+
+    @property
+    def url_ultima(self):
+        return self._url(codificar_cursor('p', None))
+
+
+class PaginadorCursor:
+    """
+    Pagina un queryset por cursor.
+
+    ``orden`` es la lista de campos de orden (con '-' para descendente) y debe
+    terminar en un campo único, normalmente 'id', para que el orden sea total.
+    ``total`` puede ser None (no contar), 'estimado' o 'exacto'.
+    """
+
+    def __init__(self, queryset, orden, por_pagina, total=None):
+        self.queryset = queryset
+        self.orden = list(orden)
+        self.por_pagina = por_pagina
+        self.total = total
+
+    def _campos(self):
+        return [(campo.lstrip('-'), campo.startswith('-')) for campo in self.orden]
+
+    def _filtro_despues_de(self, valores, invertir):
+        """Condición (a > x) OR (a = x AND b > y) OR ... respetando la dirección de cada campo"""
+        condicion = Q()
+        iguales = Q()
+        for (campo, descendente), valor in zip(self._campos(), valores):
+            hacia_menor = descendente != invertir
+            lookup = 'lt' if hacia_menor else 'gt'
+            condicion |= iguales & Q(**{f'{campo}__{lookup}': valor})
+            iguales &= Q(**{campo: valor})
+        return condicion
+
+    def _orden_invertido(self):
+        return [campo[1:] if campo.startswith('-') else f'-{campo}' for campo in self.orden]
+
+    def _valores(self, objeto):
+        valores = []
+        for campo, _ in self._campos():
+            valor = objeto
+            for parte in campo.split('__'):
+                valor = getattr(valor, parte)
+            valores.append(valor)
+        return valores
+
+    def get_page(self, cursor=None, parametros=None):
+        decodificado = decodificar_cursor(cursor) if cursor else None
+        direccion, valores = decodificado or ('n', None)
+
+        queryset = self.queryset
+        if direccion == 'n':
+            if valores is not None:
+                queryset = queryset.filter(self._filtro_despues_de(valores, invertir=False))
+            filas = list(queryset.order_by(*self.orden)[:self.por_pagina + 1])
+            hay_mas = len(filas) > self.por_pagina
+            filas = filas[:self.por_pagina]
+            has_previous = valores is not None
+            has_next = hay_mas
+        else:
+            if valores is not None:
+                queryset = queryset.filter(self._filtro_despues_de(valores, invertir=True))
+            filas = list(queryset.order_by(*self._orden_invertido())[:self.por_pagina + 1])
+            hay_mas = len(filas) > self.por_pagina
+            filas = list(reversed(filas[:self.por_pagina]))
+            has_previous = hay_mas
+            has_next = valores is not None
+
+        cursor_anterior = codificar_cursor('p', self._valores(filas[0])) if filas and has_previous else None
+        cursor_siguiente = codificar_cursor('n', self._valores(filas[-1])) if filas and has_next else None
+
+        total = None
+        if self.total == 'exacto':
+            total = self.queryset.count()
+        elif self.total == 'estimado':
+            total = estimar_total(self.queryset)
+
+        return PaginaCursor(
+            filas,
+            has_previous=has_previous,
+            has_next=has_next,
+            cursor_anterior=cursor_anterior,
+            cursor_siguiente=cursor_siguiente,
+            parametros=parametros if parametros is not None else QueryDict(),
+            total=total,
+            total_estimado=self.total == 'estimado' and connection.vendor == 'postgresql',
+        )
+
+
+def paginar_por_cursor(request, queryset, orden, por_pagina, total=None):
+    """Atajo para las vistas: lee ``?cursor=`` y conserva el resto de los filtros en los enlaces"""
+    paginador = PaginadorCursor(queryset, orden, por_pagina, total=total)
+    return paginador.get_page(request.GET.get('cursor'), parametros=request.GET)
@@ -0,0 +1,134 @@
+"""
+Supabase Storage simulado en memoria.
+
+Reemplaza al cliente de ``supabase`` en ``SupabaseStorage`` (ver
+``apps/utils.py`` con ``SUPABASE_SIMULADO=True``) e implementa las
+operaciones de ``client.storage.from_(bucket)`` que usa el proyecto:
+``upload``, ``download``, ``remove``, ``list`` (por carpeta, paginado con
+``limit``/``offset`` como la API real) y ``get_public_url``.
+
+Permite probar y medir el backend de almacenamiento sin red ni credenciales:
+``llamadas()`` cuenta las operaciones recibidas y ``latencia`` simula el
+tiempo de ida y vuelta de cada una. El estado vive en el proceso y lo
+comparten todas las instancias, protegido por un lock.
+"""
+import hashlib
+import mimetypes
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from storage3.exceptions import StorageApiError
+
+
+URL_BASE = 'https://simulado.supabase.co'
+LIMITE_LISTADO = 100
+
+_lock = threading.Lock()
+_objetos = {}
+_llamadas = Counter()
+
+
+def llamadas():
+    """Cantidad de llamadas recibidas por operación"""
+    with _lock:
+        return dict(_llamadas)
+
+
+def reiniciar():
+    with _lock:
+        _objetos.clear()
+        _llamadas.clear()
+
+
+class BucketSimulado:
+    """Operaciones de archivos de un bucket (equivalente a ``SyncBucketProxy``)"""
+
+    def __init__(self, bucket, latencia):
+        self.bucket = bucket
+        self.latencia = latencia
+
+    def _llamada(self, operacion):
+        """Simula la ida y vuelta de red (fuera del lock) y cuenta la llamada"""
+        if self.latencia:
+            time.sleep(self.latencia)
+        with _lock:
+            _llamadas[operacion] += 1
+
+    def upload(self, path, file, file_options=None):
+        contenido = file if isinstance(file, bytes) else file.read()
+        tipo = (file_options or {}).get('content-type') or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self._llamada('upload')
+        with _lock:
+            clave = (self.bucket, path)
+            if clave in _objetos:
+                raise StorageApiError('The resource already exists', 'Duplicate', 409)
+            _objetos[clave] = {
+                'contenido': contenido,
+                'mimetype': tipo,
+                'eTag': f'"{hashlib.md5(contenido).hexdigest()}"',
+                'lastModified': datetime.now(timezone.utc).isoformat(),
+            }
+        return {'path': path, 'full_path': f'{self.bucket}/{path}'}
+
+    def download(self, path, options=None):
+        self._llamada('download')
+        with _lock:
+            objeto = _objetos.get((self.bucket, path))
+            if objeto is None:
+                raise StorageApiError('Object not found', 'not_found', 404)
+            return objeto['contenido']
+
+    def remove(self, paths):
+        self._llamada('remove')
+        with _lock:
+            eliminados = [path for path in paths if _objetos.pop((self.bucket, path), None) is not None]
+        return [{'name': path} for path in eliminados]
+
+    def list(self, path=None, options=None):
+        """Hijos directos de la carpeta ``path``: archivos con ``metadata`` y subcarpetas sin ella"""
+        opciones = {'limit': LIMITE_LISTADO, 'offset': 0, **(options or {})}
+        prefijo = f'{path.strip("/")}/' if path and path.strip('/') else ''
+        self._llamada('list')
+        with _lock:
+            items = {}
+            for (bucket, nombre), objeto in _objetos.items():
+                if bucket != self.bucket or not nombre.startswith(prefijo):
+                    continue
+                resto = nombre[len(prefijo):]
+                if '/' in resto:
+                    carpeta = resto.split('/', 1)[0]
+                    items.setdefault(carpeta, {'name': carpeta, 'id': None, 'metadata': None})
+                else:
+                    items[resto] = {
+                        'name': resto,
+                        'id': hashlib.md5(nombre.encode()).hexdigest(),
+                        'updated_at': objeto['lastModified'],
+                        'metadata': {
+                            'eTag': objeto['eTag'],
+                            'size': len(objeto['contenido']),
+                            'mimetype': objeto['mimetype'],
+                            'lastModified': objeto['lastModified'],
+                        },
+                    }
+        ordenados = [items[nombre] for nombre in sorted(items)]
+        return ordenados[opciones['offset']:opciones['offset'] + opciones['limit']]
+
+    def get_public_url(self, path, options=None):
+        return f'{URL_BASE}/storage/v1/object/public/{self.bucket}/{path}'
+
+
+class StorageSimulado:
+    def __init__(self, latencia):
+        self.latencia = latencia
+
+    def from_(self, bucket):
+        return BucketSimulado(bucket, self.latencia)
+
+
+class ClienteSupabaseSimulado:
+    """Sustituto de ``supabase.Client`` con solo la API de Storage"""
+
+    def __init__(self, latencia=0):
+        self.storage = StorageSimulado(latencia)
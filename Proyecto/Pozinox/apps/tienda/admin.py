@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Producto, CategoriaAcero, Cliente, Pedido, DetallePedido, Cotizacion, DetalleCotizacion
+from .models import Producto, CategoriaAcero, Cliente, Pedido, DetallePedido, Cotizacion, DetalleCotizacion, NotificacionPago, ArchivoContenido
 
 
 @admin.register(CategoriaAcero)
@@ -100,7 +100,8 @@ class CotizacionAdmin(admin.ModelAdmin):
             'fields': ('subtotal', 'iva', 'total')
         }),
         ('Pago', {
-            'fields': ('metodo_pago', 'pago_completado', 'mercadopago_preference_id', 'mercadopago_payment_id')
+            'fields': ('metodo_pago', 'pago_completado', 'mercadopago_preference_id', 'mercadopago_payment_id',
+                       'mercadopago_preference_huella', 'mercadopago_init_point')
         }),
         ('Observaciones', {
             'fields': ('observaciones',)
@@ -122,3 +123,22 @@ class DetalleCotizacionAdmin(admin.ModelAdmin):
     list_filter = ['cotizacion__estado']
     search_fields = ['cotizacion__numero_cotizacion', 'producto__nombre']
     ordering = ['-cotizacion__fecha_creacion']
+
+
+@admin.register(NotificacionPago)
+class NotificacionPagoAdmin(admin.ModelAdmin):
+    """Administración de la bandeja de notificaciones de MercadoPago"""
+    list_display = ['mercadopago_payment_id', 'estado', 'estado_pago', 'cotizacion', 'recibidas', 'intentos', 'fecha_recepcion']
+    list_filter = ['estado', 'estado_pago', 'tipo']
+    search_fields = ['mercadopago_payment_id', 'cotizacion__numero_cotizacion']
+    readonly_fields = ['payload', 'recibidas', 'fecha_recepcion', 'fecha_procesada', 'ultimo_error']
+    ordering = ['-fecha_recepcion']
+
+
+@admin.register(ArchivoContenido)
+class ArchivoContenidoAdmin(admin.ModelAdmin):
+    """Objetos deduplicados del almacenamiento y sus referencias (solo lectura)"""
+    list_display = ['nombre', 'tamano', 'referencias', 'fecha_creacion']
+    search_fields = ['nombre']
+    readonly_fields = ['nombre', 'tamano', 'referencias', 'fecha_creacion']
+    ordering = ['-referencias']
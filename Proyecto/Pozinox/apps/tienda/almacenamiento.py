@@ -0,0 +1,158 @@
+"""
+Almacenamiento deduplicado por contenido.
+
+``AlmacenamientoDeduplicado`` envuelve otro backend (``S3Boto3Storage`` o
+``apps.utils.SupabaseStorage``) y guarda cada archivo con un nombre derivado
+del SHA-256 de su contenido, ``<carpeta>/<2 caracteres>/<hash>.<ext>``. La
+tabla ``ArchivoContenido`` cuenta cuántas referencias tiene cada objeto:
+
+- Subir un archivo cuyo contenido ya existe solo incrementa el contador, sin
+  transferir nada (por ejemplo, la misma foto en varios productos de una
+  familia).
+- ``delete`` descuenta una referencia y solo elimina el objeto del backend
+  cuando se va la última.
+- Ambos bloquean la fila del objeto (``select_for_update``) mientras cambian
+  sus referencias, suben o eliminan el objeto, así un ``save`` del mismo
+  contenido no queda apuntando a un objeto que otro proceso está borrando.
+- ``exists`` y ``size`` responden desde la tabla, sin llamar al backend.
+
+Los archivos guardados antes de usar este almacenamiento no están en la tabla;
+para ellos todas las operaciones pasan directo al backend.
+
+``Producto.imagen`` usa ``almacenamiento_imagenes``, cuyo backend (S3 si está
+configurado, si no el directorio de media) se crea recién al primer uso, así
+importar los modelos no carga boto3.
+"""
+import hashlib
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, Storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject
+
+
+def _modelo():
+    return apps.get_model('tienda', 'ArchivoContenido')
+
+
+def huella_contenido(contenido):
+    """SHA-256 de un archivo de Django, leyéndolo por bloques (queda al inicio)"""
+    sha = hashlib.sha256()
+    for bloque in contenido.chunks():
+        sha.update(bloque)
+    contenido.seek(0)
+    return sha.hexdigest()
+
+
+@deconstructible(path='apps.tienda.almacenamiento.AlmacenamientoDeduplicado')
+class AlmacenamientoDeduplicado(Storage):
+    """Nombra los archivos por el hash de su contenido y cuenta sus referencias"""
+
+    # Cada save() toma una referencia que se devuelve con delete(), aunque el
+    # nombre resultante sea el mismo (ver apps/tienda/imagenes.py)
+    deduplica = True
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def nombre_contenido(self, name, huella):
+        carpeta = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(carpeta, huella[:2], f'{huella}{extension}').replace('\\', '/')
+
+    def _bloquear(self, nombre):
+        """Fila del objeto bloqueada hasta el fin de la transacción (None si no está registrado)"""
+        return _modelo().objects.select_for_update().filter(nombre=nombre).first()
+
+    def _tomar_referencia(self, nombre):
+        fila = self._bloquear(nombre)
+        if fila is None:
+            return False
+        _modelo().objects.filter(pk=fila.pk).update(referencias=F('referencias') + 1)
+        return True
+
+    def _save(self, name, content):
+        nombre = self.nombre_contenido(name, huella_contenido(content))
+        # Con la fila bloqueada, un delete() simultáneo del mismo nombre espera
+        # (o termina antes de que se lea la fila, y entonces se vuelve a subir)
+        with transaction.atomic():
+            if self._tomar_referencia(nombre):
+                return nombre
+
+            # Primero se sube y después se registra: si la fila existe, el objeto ya está
+            # en el backend. Puede existir sin fila si quedó de un borrado fallido.
+            if not self.backend.exists(nombre):
+                self.backend._save(nombre, content)
+            try:
+                with transaction.atomic():
+                    _modelo().objects.create(nombre=nombre, tamano=content.size, referencias=1)
+            except IntegrityError:
+                # Otro proceso subió y registró el mismo contenido al mismo tiempo
+                self._tomar_referencia(nombre)
+        return nombre
+
+    def delete(self, name):
+        """
+        Descuenta una referencia y, si era la última (o el archivo no estaba
+        registrado), elimina el objeto del backend antes de liberar la fila.
+        """
+        with transaction.atomic():
+            fila = self._bloquear(name)
+            if fila is not None and fila.referencias > 1:
+                _modelo().objects.filter(pk=fila.pk).update(referencias=F('referencias') - 1)
+                return
+            if fila is not None:
+                fila.delete()
+            # Si el backend falla se revierte el borrado de la fila
+            self.backend.delete(name)
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo sale del contenido en _save; no hay colisiones que evitar
+        return name
+
+    def generate_filename(self, filename):
+        return self.backend.generate_filename(filename)
+
+    def exists(self, name):
+        return _modelo().objects.filter(nombre=name).exists() or self.backend.exists(name)
+
+    def size(self, name):
+        tamano = _modelo().objects.filter(nombre=name).values_list('tamano', flat=True).first()
+        return self.backend.size(name) if tamano is None else tamano
+
+    def _open(self, name, mode='rb'):
+        return self.backend._open(name, mode)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+
+class _BackendImagenes(LazyObject):
+    """Backend de las imágenes de productos: S3 si está configurado o el directorio de media"""
+    def _setup(self):
+        if getattr(settings, 'USE_S3_STORAGE', False):
+            from storages.backends.s3boto3 import S3Boto3Storage
+            self._wrapped = S3Boto3Storage()
+        else:
+            self._wrapped = FileSystemStorage()
+
+
+_almacenamiento_imagenes = AlmacenamientoDeduplicado(_BackendImagenes())
+
+
+def almacenamiento_imagenes():
+    """Almacenamiento de ``Producto.imagen`` (las migraciones guardan esta función, no el backend)"""
+    return _almacenamiento_imagenes
@@ -5,3 +5,7 @@ class TiendaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.tienda'
     verbose_name = 'Tienda de Aceros'
+
+    def ready(self):
+        # Registrar señales que mantienen índices, facetas, caché e imágenes sincronizados
+        from . import busqueda, autocompletado, facetas, cache, pdf_cotizaciones, imagenes  # noqa: F401
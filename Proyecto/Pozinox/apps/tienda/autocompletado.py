@@ -0,0 +1,164 @@
+"""
+Índice en memoria para el autocompletado de productos por código y nombre.
+
+El índice se construye con una sola consulta y combina:
+
+- Una lista ordenada de claves (código compacto y palabras del nombre) para
+  búsquedas por prefijo con ``bisect``.
+- Un índice invertido de trigramas para tolerar errores de tipeo.
+- Un caché LRU de los prefijos consultados más recientemente.
+
+Se invalida con las señales de ``Producto`` en el proceso actual y se
+reconstruye como máximo cada ``TTL_SEGUNDOS`` para recoger cambios hechos por
+otros procesos.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .busqueda import normalizar, tokenizar
+from .models import Producto
+
+
+TTL_SEGUNDOS = 60
+TAMANO_CACHE = 512
+SIMILITUD_MINIMA = 0.4
+
+
+def compactar(texto):
+    """Normaliza y elimina todo lo que no sea alfanumérico (PL-304-2 -> pl3042)"""
+    return re.sub(r'[^a-z0-9]', '', normalizar(texto))
+
+
+def trigramas(palabra):
+    """Trigramas de una palabra con relleno al inicio y al final"""
+    palabra = f'  {palabra} '
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+class IndiceAutocompletado:
+    """Índice de prefijos y trigramas sobre los productos activos"""
+
+    def __init__(self, ttl=TTL_SEGUNDOS, tamano_cache=TAMANO_CACHE):
+        self.ttl = ttl
+        self.tamano_cache = tamano_cache
+        self._lock = threading.Lock()
+        self._construido_en = None
+        self._productos = []
+        self._claves = []
+        self._trigramas = {}
+        self._cache = OrderedDict()
+
+    def invalidar(self):
+        with self._lock:
+            self._construido_en = None
+
+    def _construir(self):
+        productos = list(
+            Producto.objects.filter(activo=True)
+            .order_by('codigo_producto')
+            .values_list('id', 'codigo_producto', 'nombre', 'precio_por_unidad', 'unidad_medida')
+        )
+        claves = []
+        indice_trigramas = {}
+        for posicion, (_, codigo, nombre, _, _) in enumerate(productos):
+            palabras = {compactar(codigo)} | set(tokenizar(nombre))
+            palabras.discard('')
+            for palabra in palabras:
+                claves.append((palabra, posicion))
+                for trigrama in trigramas(palabra):
+                    indice_trigramas.setdefault(trigrama, []).append(posicion)
+        claves.sort()
+
+        self._productos = productos
+        self._claves = claves
+        self._trigramas = indice_trigramas
+        self._cache.clear()
+        self._construido_en = time.monotonic()
+
+    def _vigente(self):
+        return self._construido_en is not None and time.monotonic() - self._construido_en < self.ttl
+
+    def _por_prefijo(self, prefijo, puntajes, puntaje):
+        indice = bisect_left(self._claves, (prefijo,))
+        while indice < len(self._claves):
+            clave, posicion = self._claves[indice]
+            if not clave.startswith(prefijo):
+                break
+            if puntajes.get(posicion, 0) < puntaje:
+                puntajes[posicion] = puntaje
+            indice += 1
+
+    def _por_trigramas(self, palabra, puntajes):
+        trigramas_consulta = trigramas(palabra)
+        coincidencias = Counter()
+        for trigrama in trigramas_consulta:
+            coincidencias.update(set(self._trigramas.get(trigrama, ())))
+        for posicion, compartidos in coincidencias.items():
+            similitud = compartidos / len(trigramas_consulta)
+            if similitud >= SIMILITUD_MINIMA and puntajes.get(posicion, 0) < similitud:
+                puntajes[posicion] = similitud
+
+    def buscar(self, texto, limite=10):
+        """Retorna hasta ``limite`` productos como diccionarios compactos"""
+        consulta = compactar(texto)
+        palabras = tokenizar(texto)
+        if not consulta:
+            return []
+
+        with self._lock:
+            if not self._vigente():
+                self._construir()
+
+            clave_cache = (consulta, ' '.join(palabras), limite)
+            if clave_cache in self._cache:
+                self._cache.move_to_end(clave_cache)
+                return self._cache[clave_cache]
+
+            puntajes = {}
+            # Coincidencia por prefijo del código completo (PL-304-2 -> pl3042...)
+            self._por_prefijo(consulta, puntajes, 3)
+            # Coincidencia por prefijo de todas las palabras de la consulta
+            if palabras:
+                por_palabra = []
+                for palabra in palabras:
+                    encontrados = {}
+                    self._por_prefijo(palabra, encontrados, 2)
+                    por_palabra.append(set(encontrados))
+                for posicion in set.intersection(*por_palabra):
+                    puntajes.setdefault(posicion, 2)
+            # Tolerancia a errores de tipeo
+            if len(puntajes) < limite:
+                for palabra in {consulta, *palabras}:
+                    self._por_trigramas(palabra, puntajes)
+
+            mejores = sorted(puntajes.items(), key=lambda item: (-item[1], item[0]))[:limite]
+            resultados = []
+            for posicion, _ in mejores:
+                producto_id, codigo, nombre, precio, unidad = self._productos[posicion]
+                resultados.append({
+                    'id': producto_id,
+                    'codigo': codigo,
+                    'nombre': nombre,
+                    'precio': float(precio),
+                    'unidad': unidad,
+                })
+
+            self._cache[clave_cache] = resultados
+            if len(self._cache) > self.tamano_cache:
+                self._cache.popitem(last=False)
+            return resultados
+
+
+indice_autocompletado = IndiceAutocompletado()
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_indice_autocompletado(sender, **kwargs):
+    indice_autocompletado.invalidar()
@@ -0,0 +1,290 @@
+"""
+Motor de búsqueda de texto completo para el catálogo de productos.
+
+Mantiene un índice de búsqueda sincronizado con la tabla de productos:
+
+- PostgreSQL (cuando existe DATABASE_URL): columna ``tsvector`` con índice GIN
+  y diccionario ``spanish`` para la derivación de palabras.
+- SQLite (fallback de desarrollo): tabla virtual FTS5 con tokens normalizados
+  y derivados por un stemmer español liviano.
+
+En ambos casos el texto se pliega a minúsculas sin tildes antes de indexarse,
+de modo que "acero inóxidable" encuentra "Acero Inoxidable".
+"""
+import re
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Producto
+
+
+TABLA_POSTGRES = 'tienda_producto_busqueda'
+TABLA_SQLITE = 'tienda_producto_fts'
+
+# Palabras vacías que no aportan a la relevancia (solo para SQLite, PostgreSQL
+# usa las del diccionario 'spanish')
+PALABRAS_VACIAS = {
+    'a', 'al', 'con', 'de', 'del', 'e', 'el', 'en', 'la', 'las', 'lo', 'los',
+    'o', 'para', 'por', 'sin', 'su', 'un', 'una', 'unos', 'unas', 'y',
+}
+
+# Sufijos ordenados del más largo al más corto
+SUFIJOS = (
+    'amientos', 'imientos', 'amiento', 'imiento', 'aciones', 'uciones',
+    'adoras', 'adores', 'ancias', 'idades', 'istas', 'ables', 'ibles',
+    'mente', 'acion', 'ucion', 'adora', 'ancia', 'idad', 'able', 'ible',
+    'ador', 'ista', 'osos', 'osas', 'ivos', 'ivas', 'ados', 'adas', 'idos',
+    'idas', 'oso', 'osa', 'ivo', 'iva', 'ado', 'ada', 'ido', 'ida',
+    'es', 'os', 'as', 's', 'o', 'a', 'e',
+)
+
+
+def normalizar(texto):
+    """Convierte el texto a minúsculas y elimina tildes y diéresis"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return texto.lower()
+
+
+def tokenizar(texto):
+    """Separa el texto normalizado en palabras alfanuméricas"""
+    return re.findall(r'[a-z0-9]+', normalizar(texto))
+
+
+def derivar(palabra):
+    """Stemmer español simplificado: elimina un sufijo conservando al menos 3 letras"""
+    if palabra.isdigit():
+        return palabra
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def terminos_codigo(codigo):
+    """Partes del código de producto más su forma compacta (PL-304-2 -> pl 304 2 pl3042)"""
+    partes = tokenizar(codigo)
+    if len(partes) > 1:
+        partes.append(''.join(partes))
+    return ' '.join(partes)
+
+
+class _BackendPostgres:
+    """Índice tsvector + GIN en PostgreSQL"""
+
+    def crear(self, cursor):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLA_POSTGRES} (
+                producto_id bigint PRIMARY KEY REFERENCES tienda_producto(id) ON DELETE CASCADE,
+                documento tsvector NOT NULL
+            )
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {TABLA_POSTGRES}_gin
+            ON {TABLA_POSTGRES} USING gin(documento)
+        """)
+
+    def eliminar(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLA_POSTGRES}")
+
+    def indexar(self, cursor, productos):
+        filas = [
+            (p.pk, normalizar(p.nombre), terminos_codigo(p.codigo_producto), normalizar(p.descripcion))
+            for p in productos
+        ]
+        cursor.executemany(f"""
+            INSERT INTO {TABLA_POSTGRES} (producto_id, documento)
+            VALUES (%s,
+                setweight(to_tsvector('spanish', %s), 'A') ||
+                setweight(to_tsvector('simple', %s), 'A') ||
+                setweight(to_tsvector('spanish', %s), 'B'))
+            ON CONFLICT (producto_id) DO UPDATE SET documento = EXCLUDED.documento
+        """, filas)
+
+    def desindexar(self, cursor, producto_id):
+        cursor.execute(f"DELETE FROM {TABLA_POSTGRES} WHERE producto_id = %s", [producto_id])
+
+    def consulta(self, tokens):
+        return ' & '.join(f'{t}:*' for t in tokens)
+
+    def filtro(self, consulta):
+        return RawSQL(
+            f"SELECT producto_id FROM {TABLA_POSTGRES} "
+            f"WHERE documento @@ to_tsquery('spanish', %s)",
+            [consulta],
+        )
+
+    def relevancia(self, consulta):
+        return RawSQL(
+            f"SELECT ts_rank_cd(documento, to_tsquery('spanish', %s)) FROM {TABLA_POSTGRES} "
+            f"WHERE producto_id = tienda_producto.id",
+            [consulta],
+        )
+
+
+class _BackendSQLite:
+    """Índice FTS5 en SQLite con tokens plegados y derivados"""
+
+    def crear(self, cursor):
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_SQLITE}
+            USING fts5(nombre, codigo, descripcion, tokenize = 'unicode61 remove_diacritics 2')
+        """)
+
+    def eliminar(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLA_SQLITE}")
+
+    def _terminos(self, texto):
+        terminos = []
+        for palabra in tokenizar(texto):
+            if palabra in PALABRAS_VACIAS:
+                continue
+            terminos.append(palabra)
+            raiz = derivar(palabra)
+            if raiz != palabra:
+                terminos.append(raiz)
+        return ' '.join(terminos)
+
+    def indexar(self, cursor, productos):
+        productos = list(productos)
+        cursor.executemany(
+            f"DELETE FROM {TABLA_SQLITE} WHERE rowid = %s",
+            [(p.pk,) for p in productos],
+        )
+        cursor.executemany(
+            f"INSERT INTO {TABLA_SQLITE} (rowid, nombre, codigo, descripcion) VALUES (%s, %s, %s, %s)",
+            [
+                (p.pk, self._terminos(p.nombre), terminos_codigo(p.codigo_producto), self._terminos(p.descripcion))
+                for p in productos
+            ],
+        )
+
+    def desindexar(self, cursor, producto_id):
+        cursor.execute(f"DELETE FROM {TABLA_SQLITE} WHERE rowid = %s", [producto_id])
+
+    def consulta(self, tokens):
+        partes = []
+        for token in tokens:
+            if token in PALABRAS_VACIAS:
+                continue
+            raiz = derivar(token)
+            if raiz != token:
+                partes.append(f'("{token}"* OR "{raiz}"*)')
+            else:
+                partes.append(f'"{token}"*')
+        return ' AND '.join(partes)
+
+    def filtro(self, consulta):
+        return RawSQL(
+            f"SELECT rowid FROM {TABLA_SQLITE} WHERE {TABLA_SQLITE} MATCH %s",
+            [consulta],
+        )
+
+    def relevancia(self, consulta):
+        # bm25 devuelve valores menores para mejores coincidencias; se invierte el signo
+        return RawSQL(
+            f"SELECT -bm25({TABLA_SQLITE}, 10.0, 8.0, 1.0) FROM {TABLA_SQLITE} "
+            f"WHERE {TABLA_SQLITE} MATCH %s AND rowid = tienda_producto.id",
+            [consulta],
+        )
+
+
+def obtener_backend(conexion=None):
+    """Retorna el backend de índice adecuado para la base de datos, o None si no hay soporte"""
+    vendor = (conexion or connection).vendor
+    if vendor == 'postgresql':
+        return _BackendPostgres()
+    if vendor == 'sqlite':
+        return _BackendSQLite()
+    return None
+
+
+def buscar_productos(queryset, texto):
+    """
+    Filtra el queryset de productos por texto y lo ordena por relevancia.
+
+    El queryset resultante queda anotado con ``relevancia``.
+    """
+    tokens = tokenizar(texto)
+    backend = obtener_backend()
+    consulta = backend.consulta(tokens) if backend and tokens else ''
+
+    if not consulta:
+        # Sin términos indexables (o sin backend): búsqueda simple
+        return queryset.filter(
+            Q(nombre__icontains=texto) |
+            Q(descripcion__icontains=texto) |
+            Q(codigo_producto__icontains=texto)
+        )
+
+    return queryset.filter(
+        id__in=backend.filtro(consulta)
+    ).annotate(
+        relevancia=backend.relevancia(consulta)
+    ).order_by('-relevancia', 'nombre')
+
+
+def indexar_productos(productos):
+    """Agrega o actualiza productos en el índice de búsqueda"""
+    backend = obtener_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.indexar(cursor, productos)
+
+
+def desindexar_producto(producto_id):
+    """Elimina un producto del índice de búsqueda"""
+    backend = obtener_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.desindexar(cursor, producto_id)
+
+
+def reconstruir_indice(productos=None, tamano_lote=500):
+    """
+    Reconstruye el índice completo a partir de la tabla de productos.
+
+    Todo ocurre en una transacción (ambos motores admiten DDL transaccional):
+    si falla a medias, queda el índice anterior.
+    """
+    backend = obtener_backend()
+    if backend is None:
+        return 0
+    if productos is None:
+        productos = Producto.objects.all()
+    productos = productos.only('id', 'nombre', 'descripcion', 'codigo_producto').order_by('id')
+
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        backend.eliminar(cursor)
+        backend.crear(cursor)
+        lote = []
+        for producto in productos.iterator(chunk_size=tamano_lote):
+            lote.append(producto)
+            if len(lote) >= tamano_lote:
+                backend.indexar(cursor, lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            backend.indexar(cursor, lote)
+            total += len(lote)
+    return total
+
+
+# Señales para mantener el índice sincronizado con los productos
+@receiver(post_save, sender=Producto)
+def indexar_producto_guardado(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar_productos([instance])
+
+
+@receiver(post_delete, sender=Producto)
+def desindexar_producto_eliminado(sender, instance, **kwargs):
+    desindexar_producto(instance.pk)
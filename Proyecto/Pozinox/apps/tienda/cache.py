@@ -0,0 +1,147 @@
+"""
+Caché de páginas y fragmentos del catálogo público.
+
+Todas las claves incluyen un número de versión del catálogo que se incrementa
+con cada alta, modificación o baja de ``Producto`` o ``CategoriaAcero``. Al
+cambiar la versión, las entradas anteriores dejan de consultarse y expiran
+solas, por lo que nunca se muestran precios desactualizados.
+
+Las páginas y fragmentos viven en el caché ``default`` (por defecto la memoria
+de cada proceso); solo la versión y la fecha del último cambio se guardan en el
+caché ``compartido``, para que la invalidación hecha por un comando de gestión
+llegue a los procesos web. Cada proceso relee esos dos valores como mucho cada
+``CACHE_VERSION_CATALOGO_SEGUNDOS``: un cambio hecho en otro proceso puede tardar
+ese tiempo en verse, a cambio de no consultar el caché compartido en cada petición.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import Producto, CategoriaAcero
+
+
+CLAVE_VERSION = 'catalogo:version'
+CLAVE_MODIFICADO = 'catalogo:modificado'
+
+
+# (leído en, versión, fecha del último cambio) según el caché compartido
+_estado = (None, None, None)
+
+
+def _estado_catalogo():
+    """Versión y fecha del último cambio, releídas del caché compartido si el valor local venció"""
+    global _estado
+    leido_en, version, modificado = _estado
+    ahora = time.monotonic()
+    if leido_en is None or ahora - leido_en >= settings.CACHE_VERSION_CATALOGO_SEGUNDOS:
+        compartido = caches['compartido']
+        valores = compartido.get_many([CLAVE_VERSION, CLAVE_MODIFICADO])
+        version, modificado = valores.get(CLAVE_VERSION), valores.get(CLAVE_MODIFICADO)
+        if version is None:
+            # Versión nueva y única para no reutilizar páginas antiguas si la clave fue desalojada
+            compartido.add(CLAVE_VERSION, time.time_ns(), None)
+            compartido.add(CLAVE_MODIFICADO, timezone.now(), None)
+            version = compartido.get(CLAVE_VERSION, time.time_ns())
+            modificado = compartido.get(CLAVE_MODIFICADO)
+        _estado = (ahora, version, modificado)
+    return version, modificado
+
+
+def version_catalogo():
+    """Versión actual del catálogo"""
+    return _estado_catalogo()[0]
+
+
+def invalidar_catalogo():
+    """Cambia la versión del catálogo, invalidando todas las entradas cacheadas"""
+    global _estado
+    version, modificado = time.time_ns(), timezone.now()
+    caches['compartido'].set_many({CLAVE_VERSION: version, CLAVE_MODIFICADO: modificado}, None)
+    _estado = (time.monotonic(), version, modificado)
+
+
+def catalogo_modificado():
+    """Fecha del último cambio del catálogo registrado por las señales (o None)"""
+    return _estado_catalogo()[1]
+
+
+def clave_catalogo(*partes):
+    """Clave de caché asociada a la versión actual del catálogo"""
+    return ':'.join(['catalogo', str(version_catalogo())] + [str(p) for p in partes])
+
+
+def categorias_activas():
+    """Lista de categorías activas, cacheada hasta el próximo cambio del catálogo"""
+    clave = clave_catalogo('categorias_activas')
+    categorias = cache.get(clave)
+    if categorias is None:
+        categorias = list(CategoriaAcero.objects.filter(activa=True))
+        cache.set(clave, categorias, settings.CACHE_TIMEOUT_CATALOGO)
+    return categorias
+
+
+def cachear_para_anonimos(prefijo):
+    """
+    Decorador que cachea la respuesta completa de una vista para visitantes anónimos.
+
+    No se cachean respuestas con cookies (por ejemplo CSRF) ni peticiones con
+    mensajes pendientes, para no mezclar datos entre visitantes.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if (
+                request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated
+                or 'messages' in request.COOKIES
+            ):
+                return vista(request, *args, **kwargs)
+
+            ruta = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            clave = clave_catalogo('vista', prefijo, ruta)
+            respuesta = cache.get(clave)
+            if respuesta is None:
+                respuesta = vista(request, *args, **kwargs)
+                if respuesta.status_code == 200 and not respuesta.streaming and not respuesta.cookies:
+                    cache.set(clave, respuesta, settings.CACHE_TIMEOUT_CATALOGO)
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def respuesta_condicional(vista):
+    """
+    Decorador de GET condicional (ETag / Last-Modified) para vistas del catálogo.
+
+    Los validadores salen de la versión del catálogo y de la fecha de su
+    último cambio, que ``invalidar_catalogo`` guarda en el caché con cada alta,
+    modificación o baja: no se consulta la base de datos, así un cliente que
+    ya tiene la página recibe 304 y una página cacheada se sirve sin consultas.
+    """
+    def etag(request, *args, **kwargs):
+        base = f'{version_catalogo()}:{request.user.pk or 0}:{request.get_full_path()}'
+        return hashlib.md5(base.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        # La página cambia según el usuario; Last-Modified solo es confiable para anónimos
+        if request.user.is_authenticated:
+            return None
+        return catalogo_modificado()
+
+    return condition(etag_func=etag, last_modified_func=last_modified)(vista)
+
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=CategoriaAcero)
+@receiver(post_delete, sender=CategoriaAcero)
+def invalidar_catalogo_por_cambio(sender, **kwargs):
+    invalidar_catalogo()
@@ -0,0 +1,45 @@
+"""
+Captcha de suma sin estado para el formulario de contacto.
+
+El desafío (los dos sumandos y un identificador aleatorio) viaja en un token
+firmado con ``TimestampSigner`` dentro del propio formulario, por lo que
+mostrar la página no escribe nada en la sesión ni en la base de datos y el
+inicio puede cachearse. Al validar se comprueba la firma, la antigüedad del
+token y que no se haya intentado antes (marca en el caché compartido entre procesos).
+"""
+import random
+import secrets
+
+from django.core import signing
+from django.core.cache import caches
+
+
+SALT_CAPTCHA = 'apps.tienda.captcha.suma'
+VIGENCIA_SEGUNDOS = 60 * 30
+
+
+def generar_desafio():
+    """Retorna (suma_a, suma_b, token) para mostrar en el formulario"""
+    suma_a = random.randint(1, 9)
+    suma_b = random.randint(1, 9)
+    token = signing.TimestampSigner(salt=SALT_CAPTCHA).sign_object({
+        'a': suma_a,
+        'b': suma_b,
+        'n': secrets.token_urlsafe(8),
+    })
+    return suma_a, suma_b, token
+
+
+def verificar_desafio(token, respuesta, vigencia=VIGENCIA_SEGUNDOS):
+    """True si el token es válido, no expiró, no se había usado y la respuesta es correcta"""
+    try:
+        datos = signing.TimestampSigner(salt=SALT_CAPTCHA).unsign_object(token or '', max_age=vigencia)
+        esperado = int(datos['a']) + int(datos['b'])
+        respuesta = int(respuesta)
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return False
+
+    # Cada token admite un solo intento mientras siga vigente (evita probar todas las sumas)
+    if not caches['compartido'].add(f"captcha:usado:{datos['n']}", True, vigencia):
+        return False
+    return respuesta == esperado
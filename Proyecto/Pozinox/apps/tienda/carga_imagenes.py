@@ -0,0 +1,156 @@
+"""
+Carga masiva de imágenes de productos desde un directorio.
+
+Cada archivo se asocia al producto cuyo ``codigo_producto`` coincide con su
+nombre sin extensión (sin distinguir mayúsculas), por ejemplo
+``PL-304-2.jpg``. Las subidas se hacen en paralelo en un pool de hilos acotado
+y, con el backend S3, los archivos desde ``umbral_multipart`` bytes se suben en
+partes (multipart). Con ``FileSystemStorage`` se copian por bloques.
+
+``Producto.imagen_hash`` guarda el SHA-256 de la imagen actual (también lo
+registra ``ProductoForm``), así un archivo igual al que el producto ya tiene no
+se vuelve a subir. Cada producto se actualiza apenas termina su subida, por lo
+que una carga interrumpida se reanuda volviendo a ejecutarla: lo ya subido se
+salta por hash.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from django.core.files import File
+from django.db import close_old_connections
+from django.db.models.functions import Lower
+from django.utils import timezone
+from PIL import Image
+
+from .almacenamiento import huella_contenido
+from .cache import invalidar_catalogo
+from .imagenes import eliminar_archivos, procesar_producto
+from .models import Producto
+
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+HILOS = 8
+UMBRAL_MULTIPART = 8 * 1024 * 1024
+PARTES_EN_PARALELO = 4
+TAMANO_CONSULTA = 500
+
+
+def almacenamiento_para_carga(storage, umbral_multipart=UMBRAL_MULTIPART):
+    """
+    Copia del almacenamiento S3 configurada para subir en partes los archivos
+    desde ``umbral_multipart`` bytes. Otros almacenamientos se usan tal cual.
+    """
+    if getattr(storage, 'deduplica', False):
+        return type(storage)(almacenamiento_para_carga(storage.backend, umbral_multipart))
+    if not hasattr(storage, 'transfer_config'):
+        return storage
+    from boto3.s3.transfer import TransferConfig
+
+    _, args, kwargs = storage.deconstruct()
+    # __class__ y no type(): el backend puede venir envuelto en un LazyObject
+    return storage.__class__(*args, **{**kwargs, 'transfer_config': TransferConfig(
+        multipart_threshold=umbral_multipart,
+        multipart_chunksize=umbral_multipart,
+        max_concurrency=PARTES_EN_PARALELO,
+    )})
+
+
+def _productos_por_codigo(codigos):
+    """``{código en minúsculas: (id, imagen, imagen_hash)}`` para los códigos dados"""
+    claves = sorted({codigo.lower() for codigo in codigos})
+    productos = {}
+    for inicio in range(0, len(claves), TAMANO_CONSULTA):
+        consulta = Producto.objects.annotate(clave=Lower('codigo_producto')).filter(
+            clave__in=claves[inicio:inicio + TAMANO_CONSULTA]
+        ).order_by().values_list('clave', 'id', 'imagen', 'imagen_hash')
+        productos.update((clave, datos) for clave, *datos in consulta)
+    return productos
+
+
+def cargar_imagenes(directorio, storage=None, hilos=HILOS, umbral_multipart=UMBRAL_MULTIPART,
+                    generar_variantes=True, progreso=None):
+    """
+    Sube las imágenes de ``directorio`` (y sus subdirectorios) a los productos
+    con el mismo código.
+
+    ``storage`` es por defecto el del campo ``Producto.imagen``. ``progreso`` es
+    una función opcional que recibe el resultado parcial tras cada archivo.
+    Retorna un diccionario con ``archivos``, ``subidos``, ``sin_cambios``,
+    ``bytes``, ``segundos``, ``sin_producto`` (nombres de archivo) y ``errores``
+    (lista de ``{archivo, error}``).
+    """
+    campo = Producto._meta.get_field('imagen')
+    destino = almacenamiento_para_carga(storage or campo.storage, umbral_multipart)
+    rutas = sorted(
+        ruta for ruta in Path(directorio).rglob('*')
+        if ruta.is_file() and ruta.suffix.lower() in EXTENSIONES
+    )
+    productos = _productos_por_codigo(ruta.stem for ruta in rutas)
+
+    resultado = {
+        'archivos': len(rutas), 'subidos': 0, 'sin_cambios': 0, 'bytes': 0, 'segundos': 0.0,
+        'sin_producto': [], 'errores': [],
+    }
+    pendientes = {}
+    for ruta in rutas:
+        clave = ruta.stem.lower()
+        if clave not in productos:
+            resultado['sin_producto'].append(ruta.name)
+        elif clave in pendientes:
+            resultado['errores'].append({'archivo': ruta.name, 'error': f'Ya se cargó {pendientes[clave].name} para este código.'})
+        else:
+            pendientes[clave] = ruta
+
+    def cargar(ruta, producto_id, imagen_actual, huella_actual):
+        try:
+            with open(ruta, 'rb') as abierto:
+                archivo = File(abierto, name=ruta.name)
+                huella = huella_contenido(archivo)
+                if huella == huella_actual:
+                    return False, 0
+                Image.open(archivo).verify()
+                archivo.seek(0)
+                nombre = destino.save(campo.generate_filename(None, ruta.name), archivo)
+            # Se registra de inmediato: una carga interrumpida retoma desde aquí
+            Producto.objects.filter(pk=producto_id).update(
+                imagen=nombre, imagen_hash=huella, fecha_actualizacion=timezone.now()
+            )
+            if imagen_actual:
+                # Con deduplicación solo se descuenta su referencia
+                eliminar_archivos(destino, [imagen_actual])
+            if generar_variantes:
+                try:
+                    procesar_producto(producto_id, storage=destino)
+                except Exception:
+                    logger.exception('Error al generar las variantes de imagen del producto %s', producto_id)
+            return True, ruta.stat().st_size
+        finally:
+            close_old_connections()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, hilos), thread_name_prefix='carga-imagenes') as ejecutor:
+        futuros = {
+            ejecutor.submit(cargar, ruta, *productos[clave]): ruta
+            for clave, ruta in pendientes.items()
+        }
+        for futuro in as_completed(futuros):
+            try:
+                subido, tamano = futuro.result()
+            except Exception as e:
+                resultado['errores'].append({'archivo': futuros[futuro].name, 'error': str(e)})
+            else:
+                resultado['subidos' if subido else 'sin_cambios'] += 1
+                resultado['bytes'] += tamano
+            resultado['segundos'] = time.perf_counter() - inicio
+            if progreso:
+                progreso(resultado)
+
+    if resultado['subidos']:
+        # update() no dispara señales
+        invalidar_catalogo()
+    resultado['errores'].sort(key=lambda error: error['archivo'])
+    return resultado
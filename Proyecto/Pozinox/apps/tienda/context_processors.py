@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .cache import version_catalogo
+
+
+def catalogo(request):
+    """Versión del catálogo y tiempo de expiración para los fragmentos {% cache %}"""
+    return {
+        'version_catalogo': SimpleLazyObject(version_catalogo),
+        'cache_timeout_catalogo': settings.CACHE_TIMEOUT_CATALOGO,
+    }
@@ -0,0 +1,103 @@
+"""
+Exportación masiva de PDF de cotizaciones en un ZIP transmitido por partes.
+
+Las cotizaciones se recorren por bloques. Los PDF que ya están en el
+almacenamiento (cotizaciones cerradas) se leen de ahí y los faltantes se
+generan en paralelo en un ``ProcessPoolExecutor`` con la misma plantilla de la
+descarga individual (``pdf_plantilla.renderizar_pdf``). Cada PDF se agrega al
+ZIP apenas está listo y los bytes se entregan al cliente de inmediato, así que
+en memoria solo vive un bloque de PDF a la vez.
+
+Los procesos se inician con ``spawn``: un ``fork`` del servidor copiaría sus
+hilos, conexiones a la base de datos y sockets abiertos. ``pdf_plantilla`` no
+depende de Django, así que los procesos nuevos solo importan ReportLab.
+"""
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .pdf_cotizaciones import ESTADOS_CACHEABLES, almacenamiento_pdf, datos_cotizacion, huella, nombre_archivo
+from .pdf_plantilla import renderizar_pdf
+
+
+TAMANO_BLOQUE = 16
+
+
+class _SalidaZip:
+    """Archivo de solo escritura que acumula lo escrito hasta que se extrae"""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def extraer(self):
+        contenido = b''.join(self._partes)
+        self._partes = []
+        return contenido
+
+
+def _pdfs_bloque(bloque, ejecutor):
+    """Lista de (cotización, bytes del PDF) en el mismo orden del bloque"""
+    resultados = [None] * len(bloque)
+    pendientes = []
+    for posicion, cotizacion in enumerate(bloque):
+        datos = datos_cotizacion(cotizacion)
+        hash_contenido = huella(datos)
+        cacheable = cotizacion.estado in ESTADOS_CACHEABLES
+        nombre = nombre_archivo(hash_contenido)
+        if cacheable and almacenamiento_pdf.exists(nombre):
+            with almacenamiento_pdf.open(nombre, 'rb') as archivo:
+                resultados[posicion] = archivo.read()
+        else:
+            pendientes.append((posicion, datos, nombre if cacheable else None))
+
+    generados = ejecutor.map(renderizar_pdf, [datos for _, datos, _ in pendientes])
+    for (posicion, _, nombre), pdf in zip(pendientes, generados):
+        resultados[posicion] = pdf
+        if nombre:
+            # Queda en el caché para la próxima descarga o exportación
+            almacenamiento_pdf.save(nombre, ContentFile(pdf))
+    return list(zip(bloque, resultados))
+
+
+def _bloques(queryset):
+    bloque = []
+    for cotizacion in queryset.iterator(chunk_size=TAMANO_BLOQUE * 4):
+        bloque.append(cotizacion)
+        if len(bloque) == TAMANO_BLOQUE:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def generar_zip(cotizaciones, procesos=None):
+    """
+    Generador con los bytes de un ZIP con un PDF por cotización.
+
+    ``cotizaciones`` es un queryset; se recorre por bloques precargando los
+    detalles y productos de cada bloque.
+    """
+    procesos = procesos or getattr(settings, 'PDF_EXPORTACION_PROCESOS', None) or min(4, os.cpu_count() or 1)
+    cotizaciones = cotizaciones.select_related('usuario').prefetch_related('detalles__producto')
+
+    salida = _SalidaZip()
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as ejecutor, \
+            zipfile.ZipFile(salida, mode='w', compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+        for bloque in _bloques(cotizaciones):
+            for cotizacion, pdf in _pdfs_bloque(bloque, ejecutor):
+                archivo_zip.writestr(f'Cotizacion_{cotizacion.numero_cotizacion}.pdf', pdf)
+                yield salida.extraer()
+    # Directorio central del ZIP, escrito al cerrar el archivo
+    yield salida.extraer()
@@ -0,0 +1,196 @@
+"""
+Motor de facetas del catálogo público.
+
+Los conteos de productos activos por tipo de acero, categoría, rango de grosor
+y rango de precio se guardan en ``ConteoFaceta`` y se actualizan de forma
+incremental (con ``F()``) cada vez que un producto se crea, modifica o
+elimina. Así el catálogo muestra todos los conteos con una sola consulta en
+lugar de un ``GROUP BY`` por faceta en cada visita.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Producto, ConteoFaceta
+
+
+# Rangos (clave, mínimo incluido, máximo excluido, etiqueta)
+RANGOS_GROSOR = [
+    ('0-1', Decimal('0'), Decimal('1'), 'Hasta 1 mm'),
+    ('1-3', Decimal('1'), Decimal('3'), '1 a 3 mm'),
+    ('3-6', Decimal('3'), Decimal('6'), '3 a 6 mm'),
+    ('6-12', Decimal('6'), Decimal('12'), '6 a 12 mm'),
+    ('12+', Decimal('12'), None, 'Más de 12 mm'),
+]
+
+RANGOS_PRECIO = [
+    ('0-10000', Decimal('0'), Decimal('10000'), 'Hasta $10.000'),
+    ('10000-50000', Decimal('10000'), Decimal('50000'), '$10.000 a $50.000'),
+    ('50000-100000', Decimal('50000'), Decimal('100000'), '$50.000 a $100.000'),
+    ('100000-500000', Decimal('100000'), Decimal('500000'), '$100.000 a $500.000'),
+    ('500000+', Decimal('500000'), None, 'Más de $500.000'),
+]
+
+
+def _rango(valor, rangos):
+    if valor is None:
+        return None
+    for clave, minimo, maximo, _ in rangos:
+        if valor >= minimo and (maximo is None or valor < maximo):
+            return clave
+    return None
+
+
+def valores_faceta(producto):
+    """Pares (faceta, valor) en los que cuenta un producto; vacío si está inactivo"""
+    if not producto.activo:
+        return []
+    pares = [
+        ('tipo', producto.tipo_acero),
+        ('categoria', str(producto.categoria_id)),
+    ]
+    grosor = _rango(producto.grosor, RANGOS_GROSOR)
+    if grosor:
+        pares.append(('grosor', grosor))
+    precio = _rango(producto.precio_por_unidad, RANGOS_PRECIO)
+    if precio:
+        pares.append(('precio', precio))
+    return pares
+
+
+def aplicar_delta(delta):
+    """Suma o resta cantidades a los conteos; ``delta`` es {(faceta, valor): cambio}"""
+    for (faceta, valor), cambio in delta.items():
+        if not cambio:
+            continue
+        actualizados = ConteoFaceta.objects.filter(faceta=faceta, valor=valor).update(
+            cantidad=F('cantidad') + cambio
+        )
+        if not actualizados:
+            conteo, _ = ConteoFaceta.objects.get_or_create(faceta=faceta, valor=valor)
+            ConteoFaceta.objects.filter(pk=conteo.pk).update(cantidad=F('cantidad') + cambio)
+
+
+def obtener_conteos():
+    """Todos los conteos en una consulta: {faceta: {valor: cantidad}}"""
+    conteos = defaultdict(dict)
+    for faceta, valor, cantidad in ConteoFaceta.objects.filter(cantidad__gt=0).values_list(
+        'faceta', 'valor', 'cantidad'
+    ):
+        conteos[faceta][valor] = cantidad
+    return conteos
+
+
+def reconstruir_conteos():
+    """Recalcula todos los conteos desde la tabla de productos"""
+    conteo = Counter()
+    productos = Producto.objects.filter(activo=True).only(
+        'activo', 'tipo_acero', 'categoria_id', 'grosor', 'precio_por_unidad'
+    )
+    for producto in productos.iterator(chunk_size=2000):
+        conteo.update(valores_faceta(producto))
+
+    with transaction.atomic():
+        ConteoFaceta.objects.all().delete()
+        ConteoFaceta.objects.bulk_create(
+            ConteoFaceta(faceta=faceta, valor=valor, cantidad=cantidad)
+            for (faceta, valor), cantidad in conteo.items()
+        )
+    return len(conteo)
+
+
+def _filtro_rango(campo, clave, rangos):
+    for clave_rango, minimo, maximo, _ in rangos:
+        if clave_rango == clave:
+            condicion = Q(**{f'{campo}__gte': minimo})
+            if maximo is not None:
+                condicion &= Q(**{f'{campo}__lt': maximo})
+            return condicion
+    return None
+
+
+def filtrar_productos(queryset, parametros):
+    """Aplica los filtros de facetas (?tipo=, ?categoria=, ?grosor=, ?precio=) al queryset"""
+    seleccion = {
+        'tipo': parametros.getlist('tipo'),
+        'categoria': parametros.get('categoria') or '',
+        'grosor': parametros.get('grosor') or '',
+        'precio': parametros.get('precio') or '',
+    }
+
+    tipos_validos = [t for t in seleccion['tipo'] if t in dict(Producto.TIPOS_ACERO)]
+    seleccion['tipo'] = tipos_validos
+    if tipos_validos:
+        queryset = queryset.filter(tipo_acero__in=tipos_validos)
+
+    if seleccion['categoria'].isdigit():
+        queryset = queryset.filter(categoria_id=seleccion['categoria'])
+    else:
+        seleccion['categoria'] = ''
+
+    for faceta, campo, rangos in (
+        ('grosor', 'grosor', RANGOS_GROSOR),
+        ('precio', 'precio_por_unidad', RANGOS_PRECIO),
+    ):
+        condicion = _filtro_rango(campo, seleccion[faceta], rangos)
+        if condicion is not None:
+            queryset = queryset.filter(condicion)
+        else:
+            seleccion[faceta] = ''
+
+    return queryset, seleccion
+
+
+def construir_facetas(conteos, seleccion, categorias):
+    """Estructura lista para el template con etiqueta, cantidad y estado de cada opción"""
+    def opciones(faceta, valores):
+        return [
+            {
+                'valor': valor,
+                'etiqueta': etiqueta,
+                'cantidad': conteos.get(faceta, {}).get(valor, 0),
+                'activo': valor in seleccion[faceta] if isinstance(seleccion[faceta], list)
+                else valor == seleccion[faceta],
+            }
+            for valor, etiqueta in valores
+        ]
+
+    return {
+        'tipo': opciones('tipo', Producto.TIPOS_ACERO),
+        'categoria': opciones('categoria', [(str(c.id), c.nombre) for c in categorias]),
+        'grosor': opciones('grosor', [(r[0], r[3]) for r in RANGOS_GROSOR]),
+        'precio': opciones('precio', [(r[0], r[3]) for r in RANGOS_PRECIO]),
+    }
+
+
+# Señales para mantener los conteos actualizados de forma incremental
+@receiver(pre_save, sender=Producto)
+def recordar_facetas_anteriores(sender, instance, raw=False, **kwargs):
+    instance._facetas_anteriores = []
+    if raw or not instance.pk:
+        return
+    anterior = Producto.objects.filter(pk=instance.pk).only(
+        'activo', 'tipo_acero', 'categoria_id', 'grosor', 'precio_por_unidad'
+    ).first()
+    if anterior is not None:
+        instance._facetas_anteriores = valores_faceta(anterior)
+
+
+@receiver(post_save, sender=Producto)
+def actualizar_facetas_guardado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    delta = Counter(valores_faceta(instance))
+    delta.subtract(getattr(instance, '_facetas_anteriores', []))
+    aplicar_delta(delta)
+
+
+@receiver(post_delete, sender=Producto)
+def actualizar_facetas_eliminado(sender, instance, **kwargs):
+    delta = Counter()
+    delta.subtract(valores_faceta(instance))
+    aplicar_delta(delta)
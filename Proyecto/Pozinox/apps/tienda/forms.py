@@ -1,4 +1,6 @@
 from django import forms
+from django.core.validators import FileExtensionValidator
+from .almacenamiento import huella_contenido
 from .models import Producto, CategoriaAcero
 
 
@@ -47,8 +49,29 @@ class CategoriaForm(forms.ModelForm):
         return nombre
 
 
+def validar_stock_minimo(stock_minimo):
+    if stock_minimo is not None and stock_minimo < 0:
+        raise forms.ValidationError('El stock mínimo no puede ser negativo.')
+    return stock_minimo
+
+
+def validar_precio_por_unidad(precio):
+    if precio is not None and precio <= 0:
+        raise forms.ValidationError('El precio debe ser mayor a 0.')
+    return precio
+
+
+# Reglas de ProductoForm que no consultan la base (las usa también la importación masiva)
+REGLAS_PRODUCTO = {
+    'stock_minimo': validar_stock_minimo,
+    'precio_por_unidad': validar_precio_por_unidad,
+}
+
+
 class ProductoForm(forms.ModelForm):
     """Formulario para crear y editar productos"""
+    # Stock que se mostró al abrir el formulario: al editar solo se aplica la diferencia
+    stock_mostrado = forms.IntegerField(required=False, widget=forms.HiddenInput)
     
     class Meta:
         model = Producto
@@ -170,6 +193,9 @@ class ProductoForm(forms.ModelForm):
         
         # Queries para el dropdown de categorías
         self.fields['categoria'].queryset = CategoriaAcero.objects.filter(activa=True)
+        
+        if self.instance.pk:
+            self.fields['stock_mostrado'].initial = self.instance.stock_actual
     
     def clean_codigo_producto(self):
         codigo = self.cleaned_data.get('codigo_producto')
@@ -183,13 +209,45 @@ class ProductoForm(forms.ModelForm):
         return codigo
     
     def clean_stock_minimo(self):
-        stock_minimo = self.cleaned_data.get('stock_minimo')
-        if stock_minimo is not None and stock_minimo < 0:
-            raise forms.ValidationError('El stock mínimo no puede ser negativo.')
-        return stock_minimo
+        return validar_stock_minimo(self.cleaned_data.get('stock_minimo'))
+    
+    def diferencia_stock(self):
+        """Unidades que el usuario sumó (o restó, si es negativo) al stock mostrado"""
+        mostrado = self.cleaned_data.get('stock_mostrado')
+        if mostrado is None:
+            mostrado = self.initial.get('stock_actual') or 0
+        return self.cleaned_data['stock_actual'] - mostrado
     
     def clean_precio_por_unidad(self):
-        precio = self.cleaned_data.get('precio_por_unidad')
-        if precio is not None and precio <= 0:
-            raise forms.ValidationError('El precio debe ser mayor a 0.')
-        return precio
+        return validar_precio_por_unidad(self.cleaned_data.get('precio_por_unidad'))
+    
+    def save(self, commit=True):
+        producto = super().save(commit=False)
+        if 'imagen' in self.changed_data:
+            # Hash de la imagen nueva, para que la carga masiva no vuelva a subirla
+            imagen = self.cleaned_data.get('imagen')
+            producto.imagen_hash = huella_contenido(imagen) if imagen else ''
+        if commit:
+            producto.save()
+            self._save_m2m()
+        return producto
+
+
+class ImportacionProductosForm(forms.Form):
+    """Formulario para importar productos desde una planilla CSV o XLSX"""
+    archivo = forms.FileField(
+        label='Planilla (CSV o XLSX)',
+        validators=[FileExtensionValidator(['csv', 'xlsx'])],
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+    registrar_movimientos = forms.BooleanField(
+        label='Registrar los cambios de stock como movimientos de inventario',
+        required=False,
+        initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+    simular = forms.BooleanField(
+        label='Solo validar (no guardar cambios)',
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
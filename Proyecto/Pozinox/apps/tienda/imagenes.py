@@ -0,0 +1,191 @@
+"""
+Variantes reducidas de las imágenes de productos.
+
+Al guardar un producto con una imagen nueva se encola (después del commit, en
+un pool de hilos) la generación de sus variantes: una versión WebP y otra JPEG
+por cada ancho de ``ANCHOS_VARIANTES``, sin agrandar imágenes más pequeñas. Se
+guardan junto al original en el mismo almacenamiento del campo ``imagen`` y sus
+nombres quedan en ``Producto.variantes_imagen`` junto con el nombre del
+original del que salieron, así las plantillas nunca consultan el
+almacenamiento: si el producto cambió de imagen y sus variantes aún no se
+generan, se muestra el original.
+
+Las plantillas las usan con el tag ``{% imagen_producto %}`` (ver
+``templatetags/imagenes_producto.py``), que arma un ``<picture>`` con
+``srcset``. El comando ``generar_variantes_imagenes`` genera las faltantes de
+los productos existentes.
+"""
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidar_catalogo
+from .models import Producto
+
+
+logger = logging.getLogger(__name__)
+
+ANCHOS_VARIANTES = (160, 320, 640)
+FORMATOS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='imagenes-productos')
+
+
+def _preparar(original):
+    """Imagen orientada según EXIF, en RGB o RGBA y ya reducida al decodificar si es JPEG"""
+    from PIL import ImageOps
+
+    # Un JPEG se puede decodificar directamente a escala 1/2, 1/4 u 1/8
+    original.draft('RGB', (max(ANCHOS_VARIANTES),) * 2)
+    imagen = ImageOps.exif_transpose(original)
+    if imagen.mode in ('RGB', 'RGBA'):
+        return imagen
+    transparente = imagen.mode in ('LA', 'PA') or 'transparency' in imagen.info
+    return imagen.convert('RGBA' if transparente else 'RGB')
+
+
+def _sin_transparencia(imagen):
+    from PIL import Image
+
+    if imagen.mode != 'RGBA':
+        return imagen
+    fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+    fondo.paste(imagen, mask=imagen.getchannel('A'))
+    return fondo
+
+
+def generar_variantes(archivo, nombre, storage):
+    """
+    Genera y guarda las variantes de la imagen ``archivo`` (cuyo nombre en el
+    almacenamiento es ``nombre``). Retorna ``{formato: {ancho: nombre}}``.
+
+    El nombre de cada variante incluye el hash de su contenido, así volver a
+    generarla (un reintento o dos trabajos del mismo producto) no sube un
+    archivo duplicado.
+    """
+    # Pillow se importa al procesar, no al cargar la aplicación (este módulo registra señales)
+    from PIL import Image
+
+    base = os.path.splitext(nombre)[0]
+    variantes = {formato: {} for formato in FORMATOS}
+    with Image.open(archivo) as original:
+        imagen = _preparar(original)
+        ancho_original, alto_original = imagen.size
+        anchos = [ancho for ancho in ANCHOS_VARIANTES if ancho <= ancho_original] or [ancho_original]
+
+        # De mayor a menor, reduciendo cada variante desde la anterior
+        for ancho in sorted(anchos, reverse=True):
+            alto = max(1, round(alto_original * ancho / ancho_original))
+            if imagen.size != (ancho, alto):
+                imagen = imagen.resize((ancho, alto), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            for formato, (formato_pil, extension, opciones) in FORMATOS.items():
+                salida = io.BytesIO()
+                (imagen if formato == 'webp' else _sin_transparencia(imagen)).save(salida, formato_pil, **opciones)
+                contenido = salida.getvalue()
+                nombre_variante = f'{base}-{ancho}w-{hashlib.sha256(contenido).hexdigest()[:12]}.{extension}'
+                # Un almacenamiento deduplicado cuenta una referencia por cada save()
+                if getattr(storage, 'deduplica', False) or not storage.exists(nombre_variante):
+                    nombre_variante = storage.save(nombre_variante, ContentFile(contenido))
+                variantes[formato][str(ancho)] = nombre_variante
+    return variantes
+
+
+def nombres_variantes(variantes_imagen):
+    """Nombres de archivo registrados en ``Producto.variantes_imagen``"""
+    return {
+        nombre
+        for formato in FORMATOS
+        for nombre in (variantes_imagen or {}).get(formato, {}).values()
+    }
+
+
+def variantes_vigentes(producto):
+    """Variantes de la imagen actual del producto, o None si aún no se generan"""
+    variantes = producto.variantes_imagen or {}
+    if not producto.imagen or variantes.get('origen') != producto.imagen.name:
+        return None
+    return variantes
+
+
+def eliminar_archivos(storage, nombres):
+    """Elimina archivos del almacenamiento, registrando (sin propagar) los errores"""
+    for nombre in nombres:
+        try:
+            storage.delete(nombre)
+        except Exception:
+            logger.warning('No se pudo eliminar el archivo %s', nombre)
+
+
+def procesar_producto(producto_id, forzar=False, storage=None):
+    """
+    Genera las variantes de la imagen actual del producto si faltan (o siempre
+    con ``forzar``) y elimina las de su imagen anterior. Retorna True si se
+    generaron. ``storage`` reemplaza al del campo ``imagen``.
+    """
+    producto = Producto.objects.only('id', 'imagen', 'variantes_imagen').filter(pk=producto_id).first()
+    if producto is None or not producto.imagen:
+        return False
+    if not forzar and variantes_vigentes(producto) is not None:
+        return False
+
+    origen = producto.imagen.name
+    storage = storage or producto.imagen.storage
+    with storage.open(origen, 'rb') as archivo:
+        variantes = generar_variantes(archivo, origen, storage)
+    nuevas = nombres_variantes(variantes)
+
+    # Solo se registran si la imagen no cambió mientras se generaban
+    actualizado = Producto.objects.filter(pk=producto_id, imagen=origen).update(
+        variantes_imagen={'origen': origen, **variantes}
+    )
+    anteriores = nombres_variantes(producto.variantes_imagen)
+    if not actualizado:
+        eliminar_archivos(storage, nuevas)
+        return False
+    # Sin deduplicación, una variante idéntica conserva su nombre y no se debe borrar
+    eliminar_archivos(storage, anteriores if getattr(storage, 'deduplica', False) else anteriores - nuevas)
+    # update() no dispara señales; las tarjetas cacheadas deben tomar las variantes
+    invalidar_catalogo()
+    return True
+
+
+def _procesar_en_segundo_plano(producto_id):
+    try:
+        procesar_producto(producto_id)
+    except Exception:
+        logger.exception('Error al generar las variantes de imagen del producto %s', producto_id)
+    finally:
+        close_old_connections()
+
+
+def programar_generacion(producto_id):
+    """Encola la generación de variantes en el pool de hilos, después del commit"""
+    transaction.on_commit(lambda: _ejecutor.submit(_procesar_en_segundo_plano, producto_id))
+
+
+@receiver(post_save, sender=Producto)
+def generar_variantes_al_guardar(sender, instance, raw=False, **kwargs):
+    if raw or not instance.imagen or not getattr(settings, 'IMAGENES_VARIANTES_EN_SEGUNDO_PLANO', True):
+        return
+    if variantes_vigentes(instance) is None:
+        programar_generacion(instance.id)
+
+
+@receiver(post_delete, sender=Producto)
+def eliminar_imagenes_del_producto(sender, instance, **kwargs):
+    if not instance.imagen:
+        return
+    storage = instance.imagen.storage
+    nombres = {instance.imagen.name} | nombres_variantes(instance.variantes_imagen)
+    transaction.on_commit(lambda: eliminar_archivos(storage, nombres))
@@ -0,0 +1,348 @@
+"""
+Importación masiva del catálogo desde planillas CSV o XLSX.
+
+La planilla se lee fila por fila (sin cargarla completa en memoria) y se
+procesa en lotes. Cada fila se valida con los campos de ``ProductoForm`` y las
+reglas de ``REGLAS_PRODUCTO``, sin consultas por fila:
+
+* la categoría se busca (por nombre o id) en un diccionario precargado con las
+  categorías activas, igual que el desplegable del formulario;
+* los productos existentes de cada lote se precargan por ``codigo_producto``
+  en una sola consulta; la unicidad del código no se valida porque un código
+  existente significa actualizar ese producto.
+
+Las columnas que no vienen en la planilla conservan el valor del producto
+existente (o el valor por defecto del modelo en los productos nuevos), de modo
+que una lista de precios con solo código y precio actualiza únicamente el
+precio. Los números escritos como texto siguen la costumbre de las planillas en
+español: la coma es el separador decimal y el punto el de miles ("1.234,56",
+"10.000", "1,5"); un punto seguido de otra cantidad de dígitos que tres se toma
+como decimal ("2.5"). Las celdas numéricas de un XLSX se usan tal cual. Cada lote se guarda con un ``bulk_create(update_conflicts=True)``
+sobre ``codigo_producto`` en su propia transacción; las filas con errores se
+omiten y quedan en el reporte con su número de fila.
+
+Con ``registrar_movimientos`` el stock no se escribe directamente: el stock
+inicial de los productos nuevos entra como movimiento de inventario inicial y
+los cambios en los existentes como ajustes (ver ``inventario.stock``), para
+que el libro de movimientos siga cuadrando.
+
+``bulk_create`` no dispara las señales de ``Producto``, así que cada lote se
+indexa para la búsqueda y al terminar se recalculan las facetas y se invalidan
+el catálogo cacheado y el autocompletado.
+
+Leer XLSX requiere ``openpyxl``.
+"""
+import csv
+import io
+import itertools
+import re
+
+from django import forms
+from django.db import transaction
+
+from apps.inventario import stock
+from apps.inventario.alertas import evaluar_alertas
+
+from .autocompletado import indice_autocompletado
+from .busqueda import indexar_productos, normalizar
+from .cache import invalidar_catalogo
+from .facetas import reconstruir_conteos
+from .forms import REGLAS_PRODUCTO, ProductoForm
+from .models import CategoriaAcero, Producto
+
+
+TAMANO_LOTE = 1000
+COLUMNAS = [campo for campo in ProductoForm.Meta.fields if campo != 'imagen']
+CAMPOS_NUMERICOS = {
+    campo for campo in COLUMNAS
+    if isinstance(ProductoForm.base_fields[campo], (forms.IntegerField, forms.DecimalField))
+}
+ALIAS = {
+    'codigo': 'codigo_producto',
+    'sku': 'codigo_producto',
+    'precio': 'precio_por_unidad',
+    'stock': 'stock_actual',
+    'unidad': 'unidad_medida',
+    'tipo': 'tipo_acero',
+}
+OBSERVACION_MOVIMIENTOS = 'Importación de productos'
+VALORES_FALSOS = {'0', 'no', 'n', 'false', 'falso', 'inactivo'}
+
+
+class ErrorImportacion(Exception):
+    """La planilla no se puede importar (formato o encabezados inválidos)"""
+
+
+def _clave(texto):
+    """Encabezado o valor normalizado: minúsculas sin tildes y con guiones bajos"""
+    return re.sub(r'[^a-z0-9]+', '_', normalizar(str(texto))).strip('_')
+
+
+def _texto(valor):
+    """Celda como texto (los números de Excel llegan como int o float)"""
+    if valor is None:
+        return ''
+    if isinstance(valor, float):
+        return f'{valor:.6f}'.rstrip('0').rstrip('.')
+    return str(valor).strip()
+
+
+def _numero(texto):
+    """Número escrito en una planilla en español, con punto decimal: '1.234,56' -> '1234.56'"""
+    texto = texto.replace(' ', '')
+    if ',' in texto:
+        return texto.replace('.', '').replace(',', '.')
+    if re.fullmatch(r'[-+]?\d{1,3}(\.\d{3})+', texto):
+        # Solo separadores de miles
+        return texto.replace('.', '')
+    return texto
+
+
+def _filas_csv(archivo, codificacion):
+    texto = io.TextIOWrapper(archivo, encoding=codificacion, newline='')
+    primera = texto.readline()
+    try:
+        dialecto = csv.Sniffer().sniff(primera, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    return csv.reader(itertools.chain([primera], texto), dialecto)
+
+
+def _filas_xlsx(archivo):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ErrorImportacion('Para importar archivos XLSX se requiere openpyxl (pip install openpyxl).')
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def leer_planilla(archivo, nombre, codificacion='utf-8-sig'):
+    """
+    Abre una planilla CSV o XLSX (según la extensión de ``nombre``) y retorna
+    ``(encabezados, columnas, filas)``: el campo de ``Producto`` de cada columna
+    (None si no se reconoce) y un iterador de ``(número de fila, valores)``.
+    """
+    archivo = getattr(archivo, 'file', archivo)
+    extension = nombre.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        filas = _filas_csv(archivo, codificacion)
+    elif extension == 'xlsx':
+        filas = _filas_xlsx(archivo)
+    else:
+        raise ErrorImportacion('El archivo debe ser CSV o XLSX.')
+
+    try:
+        encabezados = next(filas)
+    except StopIteration:
+        raise ErrorImportacion('La planilla está vacía.')
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ErrorImportacion(f'No se pudo leer la planilla: {e}')
+
+    # Se aceptan los nombres de campo, las etiquetas de ProductoForm y algunos alias
+    conocidos = dict(ALIAS)
+    for campo, definicion in ProductoForm().fields.items():
+        if campo in COLUMNAS:
+            conocidos[_clave(campo)] = campo
+            conocidos[_clave(definicion.label)] = campo
+    columnas = [conocidos.get(_clave(encabezado)) if encabezado is not None else None for encabezado in encabezados]
+    if 'codigo_producto' not in columnas:
+        raise ErrorImportacion('La planilla no tiene una columna con el código de producto.')
+    return encabezados, columnas, enumerate(filas, start=2)
+
+
+class ValidadorProducto:
+    """
+    Valida los datos de un producto con los campos de ``ProductoForm`` y las
+    reglas de ``REGLAS_PRODUCTO`` sin hacer consultas.
+    """
+
+    def __init__(self):
+        campos = ProductoForm().fields
+        self.campos = {campo: campos[campo] for campo in COLUMNAS if campo != 'categoria'}
+        self.categorias = {}
+        for categoria in CategoriaAcero.objects.filter(activa=True).only('id', 'nombre'):
+            self.categorias[_clave(categoria.nombre)] = categoria.id
+            self.categorias[str(categoria.id)] = categoria.id
+        self.tipos_acero = {_clave(etiqueta): valor for valor, etiqueta in Producto.TIPOS_ACERO}
+
+    def validar(self, valores, parcial=False):
+        """
+        Retorna ``(datos, errores)``: los valores limpios y una lista de mensajes.
+
+        Con ``parcial`` solo se validan los campos presentes en ``valores``.
+        """
+        datos, errores = {}, []
+        for campo, definicion in self.campos.items():
+            if parcial and campo not in valores:
+                continue
+            valor = valores.get(campo)
+            if campo == 'tipo_acero':
+                valor = self.tipos_acero.get(_clave(valor), valor)
+            elif campo == 'activo' and isinstance(valor, str):
+                valor = valor != '' and _clave(valor) not in VALORES_FALSOS
+            elif isinstance(definicion, (forms.IntegerField, forms.DecimalField)) and isinstance(valor, str):
+                valor = _numero(valor)
+            try:
+                datos[campo] = definicion.clean(valor)
+                if campo in REGLAS_PRODUCTO:
+                    datos[campo] = REGLAS_PRODUCTO[campo](datos[campo])
+            except forms.ValidationError as e:
+                errores.append(f'{campo}: {" ".join(e.messages)}')
+
+        if not parcial or 'categoria' in valores:
+            categoria = _clave(valores.get('categoria') or '')
+            if categoria in self.categorias:
+                datos['categoria_id'] = self.categorias[categoria]
+            else:
+                errores.append(f'categoria: «{valores.get("categoria") or ""}» no existe o no está activa.')
+        return datos, errores
+
+
+def _valores_existentes(codigos):
+    """Productos existentes de un lote por código, con los campos importables"""
+    campos = ['id'] + ['categoria_id' if campo == 'categoria' else campo for campo in COLUMNAS]
+    filas = Producto.objects.filter(codigo_producto__in=codigos).order_by().values(*campos)
+    return {fila['codigo_producto']: fila for fila in filas}
+
+
+def _valores_por_defecto():
+    valores = {}
+    for campo in COLUMNAS:
+        definicion = Producto._meta.get_field(campo)
+        if definicion.has_default():
+            valores[campo] = definicion.get_default()
+    return valores
+
+
+def _guardar_lote(validos, actualizar, usuario, registrar_movimientos, resultado):
+    """Guarda un lote validado con un upsert por código y registra los cambios de stock"""
+    productos = []
+    for _, datos, existente in validos:
+        producto = Producto(**{campo: valor for campo, valor in datos.items() if campo != 'id'})
+        if registrar_movimientos and existente is not None:
+            # El stock de los existentes cambia con un ajuste
+            producto.stock_actual = existente['stock_actual']
+        productos.append(producto)
+
+    with transaction.atomic():
+        Producto.objects.bulk_create(
+            productos, update_conflicts=True, unique_fields=['codigo_producto'], update_fields=actualizar,
+        )
+        nuevos = [codigo for codigo, _, existente in validos if existente is None]
+        ids = dict(Producto.objects.filter(codigo_producto__in=nuevos).values_list('codigo_producto', 'id')) \
+            if nuevos else {}
+
+        creados, ajustes = [], []
+        for producto, (codigo, datos, existente) in zip(productos, validos):
+            if existente is None:
+                producto.pk = ids[codigo]
+                creados.append(producto)
+            else:
+                producto.pk = existente['id']
+                if datos['stock_actual'] != existente['stock_actual']:
+                    ajustes.append({'tipo': 'ajuste', 'producto': producto.pk, 'cantidad': datos['stock_actual'],
+                                    'observaciones': OBSERVACION_MOVIMIENTOS})
+        if registrar_movimientos:
+            resultado['movimientos'] += len(
+                stock.registrar_inventario_inicial(creados, usuario, OBSERVACION_MOVIMIENTOS)
+            )
+            resultado['movimientos'] += len(stock.aplicar_movimientos(ajustes, usuario))
+        indexar_productos(productos)
+        ids_lote = [producto.pk for producto in productos]
+        transaction.on_commit(lambda: evaluar_alertas(ids_lote))
+
+    resultado['creados'] += len(creados)
+    resultado['actualizados'] += len(validos) - len(creados)
+
+
+def importar_productos(archivo, nombre, usuario, registrar_movimientos=True, simular=False,
+                       tamano_lote=TAMANO_LOTE, codificacion='utf-8-sig'):
+    """
+    Importa (crea o actualiza por código) los productos de una planilla.
+
+    Con ``simular`` solo valida. Retorna un diccionario con ``filas`` leídas,
+    ``creados``, ``actualizados``, ``movimientos`` de stock registrados,
+    ``columnas_ignoradas`` y ``errores`` (diccionarios con ``fila``,
+    ``codigo_producto`` y ``error``).
+    """
+    encabezados, columnas, filas = leer_planilla(archivo, nombre, codificacion)
+    resultado = {
+        'filas': 0, 'creados': 0, 'actualizados': 0, 'movimientos': 0, 'errores': [],
+        'columnas_ignoradas': [str(encabezado) for encabezado, campo in zip(encabezados, columnas)
+                               if campo is None and encabezado not in (None, '')],
+    }
+    validador = ValidadorProducto()
+    por_defecto = _valores_por_defecto()
+    # Solo se actualizan las columnas de la planilla; con movimientos, el stock
+    # lo cambia el servicio de stock y no el upsert
+    actualizar = [
+        campo for campo in dict.fromkeys(columnas)
+        if campo and campo != 'codigo_producto' and not (registrar_movimientos and campo == 'stock_actual')
+    ] + ['fecha_actualizacion']
+    vistos = {}
+    lote = []
+
+    def procesar(lote):
+        existentes = _valores_existentes([codigo for _, codigo, _ in lote])
+        validos = []
+        for numero, codigo, valores in lote:
+            existente = existentes.get(codigo)
+            if existente is None:
+                datos, errores = validador.validar({**por_defecto, **valores})
+            else:
+                # Lo que ya está guardado es válido: solo se validan las columnas de la planilla
+                datos, errores = validador.validar(valores, parcial=True)
+                datos = {**existente, **datos}
+            if errores:
+                resultado['errores'].append({'fila': numero, 'codigo_producto': codigo, 'error': '; '.join(errores)})
+            else:
+                validos.append((codigo, datos, existente))
+        if simular:
+            for _, _, existente in validos:
+                resultado['creados' if existente is None else 'actualizados'] += 1
+        elif validos:
+            _guardar_lote(validos, actualizar, usuario, registrar_movimientos, resultado)
+
+    for numero, celdas in filas:
+        valores = {}
+        for campo, celda in zip(columnas, celdas):
+            if campo in CAMPOS_NUMERICOS and isinstance(celda, (int, float)) and not isinstance(celda, bool):
+                valores[campo] = celda
+            elif campo:
+                valores[campo] = _texto(celda)
+        if not any(valores.values()):
+            continue
+        resultado['filas'] += 1
+        codigo = valores.get('codigo_producto', '')
+        if codigo in vistos:
+            resultado['errores'].append({
+                'fila': numero, 'codigo_producto': codigo,
+                'error': f'Código repetido (ya aparece en la fila {vistos[codigo]}).',
+            })
+            continue
+        if codigo:
+            vistos[codigo] = numero
+        lote.append((numero, codigo, valores))
+        if len(lote) >= tamano_lote:
+            procesar(lote)
+            lote = []
+    if lote:
+        procesar(lote)
+
+    resultado['errores'].sort(key=lambda error: error['fila'])
+    if not simular and (resultado['creados'] or resultado['actualizados']):
+        reconstruir_conteos()
+        invalidar_catalogo()
+        indice_autocompletado.invalidar()
+    return resultado
+
+
+def escribir_reporte(errores, destino):
+    """Escribe los errores de una importación como CSV (fila, código, error)"""
+    escritor = csv.DictWriter(destino, fieldnames=['fila', 'codigo_producto', 'error'])
+    escritor.writeheader()
+    escritor.writerows(errores)
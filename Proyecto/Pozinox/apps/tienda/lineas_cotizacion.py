@@ -0,0 +1,161 @@
+"""
+Carga masiva de líneas en una cotización.
+
+Recibe listas de 50 a 200 ítems (JSON o texto CSV pegado) y las agrega a la
+cotización con una cantidad fija de consultas: se validan todos los productos
+en una sola consulta, se cargan las líneas existentes en otra y se insertan o
+actualizan con ``bulk_create`` / ``bulk_update`` dentro de una transacción.
+Los totales se recalculan una sola vez al final.
+"""
+import re
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Producto, Cotizacion, DetalleCotizacion
+
+
+MAX_LINEAS = 500
+
+
+def bloquear_si_editable(cotizacion_id):
+    """
+    Bloquea la fila de la cotización (llamar dentro de una transacción) y la
+    retorna si sigue en borrador, o None si se finalizó entretanto.
+    """
+    cotizacion = Cotizacion.objects.select_for_update().get(pk=cotizacion_id)
+    return cotizacion if cotizacion.estado == 'borrador' else None
+
+
+def parsear_csv(texto):
+    """
+    Convierte texto pegado en líneas ``{'codigo_producto', 'cantidad', 'linea'}``.
+
+    Cada fila es ``código,cantidad`` (también acepta ``;`` o tabulación). Si se
+    omite la cantidad se asume 1. Una primera fila sin cantidad numérica se
+    trata como encabezado.
+    """
+    lineas = []
+    for numero, fila in enumerate((texto or '').splitlines(), start=1):
+        if not fila.strip():
+            continue
+        partes = [p.strip() for p in re.split(r'[,;\t]', fila)]
+        cantidad = partes[1] if len(partes) > 1 and partes[1] else '1'
+        if numero == 1 and not cantidad.lstrip('-').isdigit():
+            continue
+        lineas.append({'codigo_producto': partes[0], 'cantidad': cantidad, 'linea': numero})
+    return lineas
+
+
+def _normalizar(lineas):
+    """Valida el formato de cada línea; retorna (válidas, errores)"""
+    validas, errores = [], []
+    for numero, linea in enumerate(lineas, start=1):
+        if not isinstance(linea, dict):
+            errores.append({'linea': numero, 'error': 'Formato de línea inválido'})
+            continue
+        # Las líneas de CSV conservan su número de fila en el texto original
+        numero = linea.get('linea', numero)
+
+        try:
+            cantidad = int(linea.get('cantidad', 1))
+        except (TypeError, ValueError):
+            cantidad = 0
+        if cantidad <= 0:
+            errores.append({'linea': numero, 'error': 'La cantidad debe ser un entero mayor a 0'})
+            continue
+
+        producto_id = linea.get('producto_id')
+        codigo = str(linea.get('codigo_producto') or '').strip()
+        if producto_id not in (None, ''):
+            try:
+                producto_id = int(producto_id)
+            except (TypeError, ValueError):
+                errores.append({'linea': numero, 'error': f'producto_id inválido: {producto_id}'})
+                continue
+            validas.append((numero, 'id', producto_id, cantidad))
+        elif codigo:
+            validas.append((numero, 'codigo', codigo, cantidad))
+        else:
+            errores.append({'linea': numero, 'error': 'Falta producto_id o codigo_producto'})
+    return validas, errores
+
+
+def agregar_lineas(cotizacion, lineas):
+    """
+    Agrega (o suma cantidades a) muchas líneas de una cotización.
+
+    Las líneas con errores se informan y se omiten; el resto se guarda en una
+    sola transacción. Retorna un diccionario con ``creadas``, ``actualizadas``
+    y ``errores`` (lista de ``{'linea', 'error'}``).
+    """
+    if len(lineas) > MAX_LINEAS:
+        return {'creadas': 0, 'actualizadas': 0,
+                'errores': [{'linea': None, 'error': f'Máximo {MAX_LINEAS} líneas por carga'}]}
+
+    validas, errores = _normalizar(lineas)
+
+    # Validar todos los productos referenciados en una sola consulta
+    ids = {valor for _, tipo, valor, _ in validas if tipo == 'id'}
+    codigos = {valor for _, tipo, valor, _ in validas if tipo == 'codigo'}
+    productos = Producto.objects.filter(
+        Q(id__in=ids) | Q(codigo_producto__in=codigos), activo=True
+    ).only('id', 'codigo_producto', 'precio_por_unidad')
+    por_id = {}
+    por_codigo = {}
+    for producto in productos:
+        por_id[producto.id] = producto
+        por_codigo[producto.codigo_producto] = producto
+
+    # Sumar cantidades por producto (la misma referencia puede repetirse)
+    cantidades = OrderedDict()
+    for numero, tipo, valor, cantidad in validas:
+        producto = por_id.get(valor) if tipo == 'id' else por_codigo.get(valor)
+        if producto is None:
+            referencia = 'ID' if tipo == 'id' else 'código'
+            errores.append({'linea': numero, 'error': f'Producto con {referencia} {valor} no existe o no está activo'})
+            continue
+        cantidades[producto.id] = cantidades.get(producto.id, 0) + cantidad
+
+    errores.sort(key=lambda e: e['linea'] or 0)
+    if not cantidades:
+        return {'creadas': 0, 'actualizadas': 0, 'errores': errores}
+
+    with transaction.atomic():
+        # Bloquear la cotización serializa la carga con otras ediciones de líneas y con
+        # su finalización; el estado se vuelve a verificar ya con la fila bloqueada
+        cotizacion = bloquear_si_editable(cotizacion.pk)
+        if cotizacion is None:
+            return {'creadas': 0, 'actualizadas': 0,
+                    'errores': [{'linea': None, 'error': 'La cotización ya no está en borrador'}]}
+        existentes = {
+            detalle.producto_id: detalle
+            for detalle in DetalleCotizacion.objects.filter(
+                cotizacion=cotizacion, producto_id__in=list(cantidades)
+            )
+        }
+
+        nuevas, actualizadas = [], []
+        for producto_id, cantidad in cantidades.items():
+            detalle = existentes.get(producto_id)
+            if detalle is not None:
+                detalle.cantidad += cantidad
+                detalle.subtotal = detalle.precio_unitario * detalle.cantidad
+                actualizadas.append(detalle)
+            else:
+                precio = por_id[producto_id].precio_por_unidad
+                nuevas.append(DetalleCotizacion(
+                    cotizacion=cotizacion,
+                    producto_id=producto_id,
+                    cantidad=cantidad,
+                    precio_unitario=precio,
+                    subtotal=precio * cantidad,
+                ))
+
+        # bulk_create / bulk_update no llaman a save(): los totales se recalculan una vez
+        DetalleCotizacion.objects.bulk_create(nuevas, batch_size=500)
+        DetalleCotizacion.objects.bulk_update(actualizadas, ['cantidad', 'subtotal'], batch_size=500)
+        cotizacion.calcular_totales()
+
+    return {'creadas': len(nuevas), 'actualizadas': len(actualizadas), 'errores': errores}
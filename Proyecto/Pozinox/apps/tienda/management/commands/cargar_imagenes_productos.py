@@ -0,0 +1,55 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tienda.carga_imagenes import HILOS, UMBRAL_MULTIPART, cargar_imagenes
+
+
+class Command(BaseCommand):
+    help = 'Sube en paralelo las imágenes de un directorio a los productos con el mismo código (CODIGO.jpg)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directorio', help='Directorio con las imágenes (se recorren también los subdirectorios)')
+        parser.add_argument('--hilos', type=int, default=HILOS, help='Subidas en paralelo')
+        parser.add_argument('--umbral-multipart-mb', type=int, default=UMBRAL_MULTIPART // (1024 * 1024),
+                            help='Tamaño desde el que S3 sube los archivos en partes')
+        parser.add_argument('--sin-variantes', action='store_true',
+                            help='No generar las variantes reducidas (se pueden generar después con generar_variantes_imagenes)')
+        parser.add_argument('--cada', type=int, default=50, help='Mostrar el avance cada N archivos')
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['directorio']):
+            raise CommandError(f"No existe el directorio {options['directorio']}.")
+
+        def progreso(resultado):
+            procesados = resultado['subidos'] + resultado['sin_cambios'] + len(resultado['errores'])
+            if procesados % options['cada'] == 0:
+                self.stdout.write(
+                    f"  {procesados} archivos, {resultado['bytes'] / 1024 / 1024:.1f} MB "
+                    f"en {resultado['segundos']:.1f}s"
+                )
+
+        resultado = cargar_imagenes(
+            options['directorio'],
+            hilos=options['hilos'],
+            umbral_multipart=options['umbral_multipart_mb'] * 1024 * 1024,
+            generar_variantes=not options['sin_variantes'],
+            progreso=progreso,
+        )
+
+        segundos = resultado['segundos'] or 1e-9
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['archivos']} archivos: {resultado['subidos']} subidos, "
+            f"{resultado['sin_cambios']} sin cambios, {len(resultado['sin_producto'])} sin producto. "
+            f"{resultado['bytes'] / 1024 / 1024:.1f} MB en {resultado['segundos']:.1f}s "
+            f"({resultado['subidos'] / segundos:.1f} archivos/s, {resultado['bytes'] / 1024 / 1024 / segundos:.1f} MB/s)."
+        ))
+        if resultado['sin_producto']:
+            self.stdout.write(self.style.WARNING(
+                f"Sin producto con ese código: {', '.join(resultado['sin_producto'][:20])}"
+                + (' ...' if len(resultado['sin_producto']) > 20 else '')
+            ))
+        if resultado['errores']:
+            self.stdout.write(self.style.ERROR(f"{len(resultado['errores'])} archivos con errores."))
+            for error in resultado['errores'][:20]:
+                self.stdout.write(f"  {error['archivo']}: {error['error']}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.tienda.models import Cotizacion
+from apps.tienda.pdf_cotizaciones import ESTADOS_CACHEABLES, generar_pdf_almacenado
+
+
+class Command(BaseCommand):
+    help = 'Genera y guarda los PDF faltantes de las cotizaciones finalizadas o pagadas'
+
+    def handle(self, *args, **options):
+        ids = Cotizacion.objects.filter(estado__in=ESTADOS_CACHEABLES).values_list('id', flat=True)
+        total = 0
+        for cotizacion_id in ids.iterator():
+            generar_pdf_almacenado(cotizacion_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'PDF verificados para {total} cotizaciones.'))
@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.tienda.imagenes import procesar_producto
+from apps.tienda.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo las variantes WebP/JPEG faltantes de las imágenes de productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=4,
+                            help='Productos procesados en paralelo (Pillow y el almacenamiento liberan el GIL)')
+        parser.add_argument('--forzar', action='store_true',
+                            help='Regenerar también las variantes que ya existen')
+
+    def handle(self, *args, **options):
+        productos = Producto.objects.exclude(imagen='').exclude(imagen__isnull=True).values_list(
+            'id', 'imagen', 'variantes_imagen'
+        )
+        ids = [
+            producto_id for producto_id, imagen, variantes in productos.iterator()
+            if options['forzar'] or (variantes or {}).get('origen') != imagen
+        ]
+
+        def procesar(producto_id):
+            try:
+                return procesar_producto(producto_id, forzar=options['forzar']), None
+            except Exception as e:
+                return False, f'Producto {producto_id}: {e}'
+            finally:
+                close_old_connections()
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, options['hilos'])) as ejecutor:
+            resultados = list(ejecutor.map(procesar, ids))
+        errores = [error for _, error in resultados if error]
+        for error in errores:
+            self.stderr.write(error)
+
+        generados = sum(generado for generado, _ in resultados)
+        self.stdout.write(self.style.SUCCESS(
+            f'Variantes generadas para {generados} de {len(ids)} productos pendientes '
+            f'en {time.perf_counter() - inicio:.1f}s ({len(errores)} errores).'
+        ))
@@ -0,0 +1,59 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tienda.importacion import TAMANO_LOTE, ErrorImportacion, escribir_reporte, importar_productos
+
+
+class Command(BaseCommand):
+    help = 'Crea o actualiza productos por código desde una planilla CSV o XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta de la planilla (.csv o .xlsx)')
+        parser.add_argument('--usuario', help='Usuario que registra los movimientos de stock (por defecto, el primer superusuario)')
+        parser.add_argument('--sin-movimientos', action='store_true',
+                            help='Escribir el stock directamente, sin registrar movimientos de inventario')
+        parser.add_argument('--simular', action='store_true', help='Solo validar la planilla, sin guardar')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Filas por lote')
+        parser.add_argument('--codificacion', default='utf-8-sig', help='Codificación de los CSV (por ejemplo, latin-1)')
+        parser.add_argument('--reporte', help='Guardar los errores en este archivo CSV')
+
+    def handle(self, *args, **options):
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = User.objects.filter(is_superuser=True).order_by('id').first()
+        if usuario is None and not options['sin_movimientos']:
+            raise CommandError('No se encontró el usuario para registrar los movimientos de stock.')
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importar_productos(
+                    archivo, options['archivo'], usuario,
+                    registrar_movimientos=not options['sin_movimientos'],
+                    simular=options['simular'],
+                    tamano_lote=options['lote'],
+                    codificacion=options['codificacion'],
+                )
+        except (OSError, ErrorImportacion) as e:
+            raise CommandError(str(e))
+
+        if resultado['columnas_ignoradas']:
+            self.stdout.write(self.style.WARNING(
+                f"Columnas no reconocidas (ignoradas): {', '.join(resultado['columnas_ignoradas'])}"
+            ))
+        prefijo = 'Simulación: ' if options['simular'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefijo}{resultado['filas']} filas, {resultado['creados']} productos creados, "
+            f"{resultado['actualizados']} actualizados, {resultado['movimientos']} movimientos de stock."
+        ))
+
+        errores = resultado['errores']
+        if errores:
+            self.stdout.write(self.style.ERROR(f'{len(errores)} filas con errores.'))
+            if options['reporte']:
+                with open(options['reporte'], 'w', newline='', encoding='utf-8') as destino:
+                    escribir_reporte(errores, destino)
+                self.stdout.write(f"Reporte de errores: {options['reporte']}")
+            else:
+                for error in errores[:20]:
+                    self.stdout.write(f"  Fila {error['fila']} ({error['codigo_producto'] or 'sin código'}): {error['error']}")
@@ -0,0 +1,93 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Se ejecuta en un proceso nuevo: carga la aplicación WSGI y atiende una petición
+PRIMERA_PETICION = '''
+import json, sys, time
+inicio = time.perf_counter()
+from Pozinox.wsgi import application
+cargada = time.perf_counter()
+from django.test import RequestFactory
+respuesta = {}
+def start_response(estado, cabeceras, exc_info=None):
+    respuesta['estado'] = int(estado.split()[0])
+environ = RequestFactory().get(sys.argv[1], HTTP_HOST=sys.argv[2]).environ
+cuerpo = application(environ, start_response)
+b''.join(cuerpo)
+cuerpo.close()
+print(json.dumps({'carga': cargada - inicio, 'primera': time.perf_counter() - inicio, **respuesta}))
+'''
+
+LINEA_IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de importación al iniciar Django y el tiempo hasta la primera petición WSGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5, help='Procesos medidos (se reporta la mediana)')
+        parser.add_argument('--url', default='/', help='Ruta de la primera petición')
+        parser.add_argument('--top', type=int, default=15, help='Paquetes más costosos a mostrar')
+
+    def _ejecutar(self, *argumentos):
+        entorno = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'Pozinox.settings')}
+        inicio = time.perf_counter()
+        proceso = subprocess.run(
+            [sys.executable, *argumentos], cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True,
+        )
+        if proceso.returncode:
+            raise CommandError(proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else 'El proceso falló')
+        return proceso, time.perf_counter() - inicio
+
+    def costo_importaciones(self):
+        """Microsegundos por paquete de primer nivel (suma del tiempo propio de sus módulos) al cargar la app WSGI"""
+        proceso, _ = self._ejecutar('-X', 'importtime', '-c', 'import Pozinox.wsgi')
+        paquetes = Counter()
+        for linea in proceso.stderr.splitlines():
+            coincidencia = LINEA_IMPORTTIME.match(linea)
+            if coincidencia:
+                paquetes[coincidencia.group(4).split('.')[0]] += int(coincidencia.group(1))
+        return paquetes
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if h and '*' not in h and not h.startswith('.')), 'localhost')
+
+        muestras = []
+        for _ in range(max(1, options['repeticiones'])):
+            proceso, total = self._ejecutar('-c', PRIMERA_PETICION, options['url'], host)
+            muestras.append({**json.loads(proceso.stdout.strip().splitlines()[-1]), 'proceso': total})
+
+        paquetes = self.costo_importaciones()
+        total_importaciones = sum(paquetes.values()) / 1000
+        self.stdout.write(f'Importaciones al cargar la aplicación WSGI: {total_importaciones:.0f} ms')
+        for paquete, microsegundos in paquetes.most_common(options['top']):
+            self.stdout.write(f'  {microsegundos / 1000:8.1f} ms  {paquete}')
+
+        # Sin estado: la aplicación no llegó a llamar a start_response
+        sin_respuesta = sum(muestra.get('estado') is None for muestra in muestras)
+        estados = sorted({muestra['estado'] for muestra in muestras if muestra.get('estado') is not None})
+        if sin_respuesta:
+            self.stdout.write(self.style.ERROR(
+                f"{sin_respuesta} de {len(muestras)} procesos terminaron sin responder a {options['url']}."
+            ))
+        if sin_respuesta or any(estado >= 500 for estado in estados):
+            # Un error acorta la respuesta y falsea la medición (p. ej. migraciones sin aplicar)
+            self.stdout.write(self.style.WARNING(
+                f"La petición a {options['url']} respondió con error; revise el log o ejecute 'migrate' antes de medir."
+            ))
+        mediana = {clave: statistics.median(m[clave] for m in muestras) * 1000 for clave in ('carga', 'primera', 'proceso')}
+        self.stdout.write(self.style.SUCCESS(
+            f"Mediana de {len(muestras)} procesos: aplicación cargada en {mediana['carga']:.0f} ms, "
+            f"primera respuesta a {options['url']} en {mediana['primera']:.0f} ms "
+            f"(proceso completo {mediana['proceso']:.0f} ms, estado HTTP {', '.join(map(str, estados)) or 'sin respuesta'})."
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.tienda.pagos import procesar_notificaciones
+
+
+class Command(BaseCommand):
+    help = 'Consulta en MercadoPago los pagos notificados y concilia las cotizaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help='Cantidad de notificaciones por lote')
+        parser.add_argument('--continuo', action='store_true', help='Seguir revisando la cola indefinidamente')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera cuando la cola está vacía')
+
+    def handle(self, *args, **options):
+        while True:
+            resultado = procesar_notificaciones(tamano_lote=options['lote'])
+            if any(resultado.values()):
+                self.stdout.write(self.style.SUCCESS(
+                    f"Procesadas: {resultado['procesadas']}, reintentos: {resultado['reintentos']}, "
+                    f"fallidas: {resultado['fallidas']}"
+                ))
+            if not options['continuo']:
+                break
+            if not any(resultado.values()):
+                time.sleep(options['intervalo'])
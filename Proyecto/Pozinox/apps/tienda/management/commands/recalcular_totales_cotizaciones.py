@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.tienda.models import Cotizacion
+
+
+class Command(BaseCommand):
+    help = 'Verifica los totales de las cotizaciones contra sus detalles y corrige las diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-verificar', action='store_true', help='Informar diferencias sin corregirlas')
+
+    def handle(self, *args, **options):
+        corregir = not options['solo_verificar']
+        inconsistentes = Cotizacion.recalcular_totales(corregir=corregir)
+        for cotizacion in inconsistentes[:20]:
+            self.stdout.write(f'  {cotizacion.numero_cotizacion}: total correcto ${cotizacion.total:,.0f}')
+        if not inconsistentes:
+            self.stdout.write(self.style.SUCCESS('Todos los totales de cotizaciones son consistentes.'))
+        elif corregir:
+            self.stdout.write(self.style.SUCCESS(f'Totales corregidos en {len(inconsistentes)} cotizaciones.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(inconsistentes)} cotizaciones con totales inconsistentes.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.tienda.facetas import reconstruir_conteos
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los conteos de facetas del catálogo desde la tabla de productos'
+
+    def handle(self, *args, **options):
+        total = reconstruir_conteos()
+        self.stdout.write(self.style.SUCCESS(f'Conteos de facetas recalculados: {total} valores.'))
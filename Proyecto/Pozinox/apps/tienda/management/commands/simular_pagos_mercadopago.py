@@ -0,0 +1,101 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import RequestFactory, override_settings
+
+from apps.tienda import mercadopago_simulado
+from apps.tienda.models import Cotizacion, NotificacionPago
+from apps.tienda.pagos import obtener_sdk, procesar_notificaciones
+from apps.tienda.views import webhook_mercadopago
+
+
+class Command(BaseCommand):
+    help = 'Prueba de carga del flujo de pagos contra la API simulada de MercadoPago'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pagos', type=int, default=200, help='Cantidad de cotizaciones pagadas')
+        parser.add_argument('--duplicados', type=int, default=3, help='Avisos enviados por cada pago')
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos que envían los webhooks')
+        parser.add_argument('--lote', type=int, default=50, help='Notificaciones por lote del procesador')
+        parser.add_argument('--conservar', action='store_true', help='No borrar los datos de prueba al terminar')
+
+    def handle(self, *args, **options):
+        if not settings.MERCADOPAGO_SIMULADO:
+            raise CommandError('Defina MERCADOPAGO_SIMULADO=True: esta prueba no debe llegar a la API real.')
+
+        usuario, _ = User.objects.get_or_create(
+            username='simulacion_mercadopago', defaults={'email': 'simulacion@pozinox.cl'}
+        )
+        cotizaciones = [
+            Cotizacion.objects.create(usuario=usuario, estado='finalizada', subtotal=Decimal('10000'),
+                                      iva=Decimal('1900'), total=Decimal('11900'))
+            for _ in range(options['pagos'])
+        ]
+        payment_ids = [
+            mercadopago_simulado.registrar_pago(c.numero_cotizacion, c.subtotal) for c in cotizaciones
+        ]
+
+        # Cada pago se notifica varias veces, como hace MercadoPago al reintentar
+        fabrica = RequestFactory()
+        avisos = payment_ids * options['duplicados']
+
+        def enviar(payment_id):
+            try:
+                request = fabrica.post(
+                    '/pagos/mercadopago/webhook/',
+                    data=json.dumps({'action': 'payment.updated', 'type': 'payment', 'data': {'id': payment_id}}),
+                    content_type='application/json',
+                )
+                return webhook_mercadopago(request).status_code
+            finally:
+                close_old_connections()
+
+        # Solo la bandeja: la conciliación se mide aparte, con el procesador por lotes
+        inicio = time.perf_counter()
+        with override_settings(MERCADOPAGO_CONCILIACION_INMEDIATA=False), \
+                ThreadPoolExecutor(max_workers=options['hilos']) as ejecutor:
+            respuestas = list(ejecutor.map(enviar, avisos))
+        tiempo_webhooks = time.perf_counter() - inicio
+
+        consultas_antes = mercadopago_simulado.llamadas()['GET']
+        sdk = obtener_sdk()
+        inicio = time.perf_counter()
+        totales = {'procesadas': 0, 'reintentos': 0, 'fallidas': 0}
+        while True:
+            resultado = procesar_notificaciones(tamano_lote=options['lote'], sdk=sdk)
+            if not any(resultado.values()):
+                break
+            for clave, valor in resultado.items():
+                totales[clave] += valor
+        tiempo_proceso = time.perf_counter() - inicio
+
+        ids = [c.id for c in cotizaciones]
+        pagadas = Cotizacion.objects.filter(id__in=ids, estado='pagada', pago_completado=True).count()
+        notificaciones = NotificacionPago.objects.filter(mercadopago_payment_id__in=payment_ids)
+
+        self.stdout.write(
+            f"Webhooks: {len(avisos)} en {tiempo_webhooks:.2f}s "
+            f"({len(avisos) / tiempo_webhooks:.0f}/s), respuestas no 200: {sum(r != 200 for r in respuestas)}"
+        )
+        self.stdout.write(
+            f"Notificaciones en la bandeja: {notificaciones.count()} para {len(payment_ids)} pagos; "
+            f"consultas a la API: {mercadopago_simulado.llamadas()['GET'] - consultas_antes}"
+        )
+        self.stdout.write(
+            f"Procesamiento: {totales['procesadas']} procesadas, {totales['reintentos']} reintentos, "
+            f"{totales['fallidas']} fallidas en {tiempo_proceso:.2f}s"
+        )
+
+        if not options['conservar']:
+            notificaciones.delete()
+            Cotizacion.objects.filter(id__in=ids).delete()
+
+        if pagadas != len(cotizaciones):
+            raise CommandError(f'Solo {pagadas} de {len(cotizaciones)} cotizaciones quedaron pagadas')
+        self.stdout.write(self.style.SUCCESS(f'{pagadas} cotizaciones conciliadas sin duplicados.'))
@@ -0,0 +1,44 @@
+"""
+Cliente HTTP para el SDK de MercadoPago con una sesión persistente.
+
+Se importa solo al crear el SDK (ver ``pagos.obtener_sdk``).
+"""
+import logging
+
+import requests
+from mercadopago.http.http_client import HttpClient
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+
+logger = logging.getLogger(__name__)
+
+
+class ClienteHttpPersistente(HttpClient):
+    """
+    ``HttpClient`` del SDK que reutiliza una sesión de ``requests``.
+
+    El cliente original crea una sesión (y un handshake TLS) por llamada; este
+    mantiene un pool de conexiones abiertas para todo el proceso. Solo se
+    reintentan solas las consultas GET: reintentar un POST podría crear una
+    preferencia duplicada.
+    """
+
+    def __init__(self, tamano_pool=10, reintentos=2):
+        self.sesion = requests.Session()
+        self.sesion.mount('https://', HTTPAdapter(
+            pool_connections=tamano_pool,
+            pool_maxsize=tamano_pool,
+            max_retries=Retry(total=reintentos, backoff_factor=0.3, allowed_methods=['GET'],
+                              status_forcelist=[429, 500, 502, 503, 504]),
+        ))
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        respuesta = self.sesion.request(method, url, **kwargs)
+        resultado = {'status': respuesta.status_code, 'response': None}
+        if respuesta.status_code != 204 and respuesta.content:
+            try:
+                resultado['response'] = respuesta.json()
+            except ValueError:
+                logger.warning('Respuesta no JSON de MercadoPago (%s %s)', method, url)
+        return resultado
@@ -0,0 +1,94 @@
+"""
+API de MercadoPago simulada en memoria.
+
+Se conecta al SDK oficial como ``http_client`` (ver ``pagos.obtener_sdk`` con
+``MERCADOPAGO_SIMULADO=True``) y responde las rutas que usa la tienda:
+
+* ``POST /checkout/preferences``: crea una preferencia con ``id`` e ``init_point``.
+* ``GET /v1/payments/<id>``: retorna el pago registrado con ``registrar_pago``
+  o 404 si no existe.
+
+Permite probar y someter a carga el flujo completo de pagos (preferencia,
+webhook, conciliación) sin red ni credenciales. El estado vive en el proceso,
+protegido por un lock para que lo usen varios hilos a la vez.
+"""
+import itertools
+import json
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+from mercadopago.http.http_client import HttpClient
+
+
+_lock = threading.Lock()
+_pagos = {}
+_preferencias = {}
+_contador_pagos = itertools.count(9_000_000_001)
+_llamadas = {'GET': 0, 'POST': 0, 'PUT': 0, 'DELETE': 0}
+
+
+def registrar_pago(external_reference, monto, estado='approved', payment_id=None):
+    """Crea un pago en la API simulada y retorna su id (como texto)"""
+    with _lock:
+        payment_id = str(payment_id or next(_contador_pagos))
+        _pagos[payment_id] = {
+            'id': int(payment_id),
+            'status': estado,
+            'status_detail': 'accredited' if estado == 'approved' else estado,
+            'external_reference': external_reference,
+            'transaction_amount': float(monto),
+            'currency_id': 'CLP',
+            'date_created': time.strftime('%Y-%m-%dT%H:%M:%S.000-04:00'),
+        }
+    return payment_id
+
+
+def cambiar_estado_pago(payment_id, estado):
+    with _lock:
+        _pagos[str(payment_id)]['status'] = estado
+
+
+def llamadas():
+    """Cantidad de llamadas recibidas por método HTTP"""
+    with _lock:
+        return dict(_llamadas)
+
+
+def reiniciar():
+    with _lock:
+        _pagos.clear()
+        _preferencias.clear()
+        for metodo in _llamadas:
+            _llamadas[metodo] = 0
+
+
+class ClienteHttpSimulado(HttpClient):
+    """Reemplazo de ``HttpClient`` que responde desde memoria"""
+
+    def __init__(self, latencia=0):
+        self.latencia = latencia
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        if self.latencia:
+            time.sleep(self.latencia)
+        ruta = urlparse(url).path.rstrip('/')
+        with _lock:
+            _llamadas[method] += 1
+
+            if method == 'POST' and ruta == '/checkout/preferences':
+                datos = json.loads(kwargs.get('data') or '{}')
+                preference_id = f'SIM-{uuid.uuid4().hex}'
+                preferencia = dict(datos, id=preference_id,
+                                   init_point=f'https://sandbox.mercadopago.simulado/checkout?pref_id={preference_id}')
+                _preferencias[preference_id] = preferencia
+                return {'status': 201, 'response': preferencia}
+
+            if method == 'GET' and ruta.startswith('/v1/payments/'):
+                pago = _pagos.get(ruta.rsplit('/', 1)[1])
+                if pago is None:
+                    return {'status': 404, 'response': {'message': 'Payment not found', 'status': 404}}
+                return {'status': 200, 'response': dict(pago)}
+
+        return {'status': 404, 'response': {'message': f'Ruta no simulada: {method} {ruta}', 'status': 404}}
@@ -0,0 +1,39 @@
+# Índice de búsqueda de texto completo (tsvector + GIN en PostgreSQL, FTS5 en SQLite)
+
+from django.db import migrations
+
+
+def crear_indice(apps, schema_editor):
+    from apps.tienda.busqueda import obtener_backend
+
+    backend = obtener_backend(schema_editor.connection)
+    if backend is None:
+        return
+
+    Producto = apps.get_model('tienda', 'Producto')
+    with schema_editor.connection.cursor() as cursor:
+        backend.crear(cursor)
+        productos = Producto.objects.only('id', 'nombre', 'descripcion', 'codigo_producto')
+        backend.indexar(cursor, productos.iterator())
+
+
+def eliminar_indice(apps, schema_editor):
+    from apps.tienda.busqueda import obtener_backend
+
+    backend = obtener_backend(schema_editor.connection)
+    if backend is None:
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        backend.eliminar(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0002_alter_producto_imagen_cotizacion_detallecotizacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
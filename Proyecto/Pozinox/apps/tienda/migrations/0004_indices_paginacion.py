@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0003_indice_busqueda_productos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['usuario', '-fecha_creacion', '-id'], name='cotizacion_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'nombre', 'id'], name='producto_catalogo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='producto_recientes_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:09
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def calcular_conteos(apps, schema_editor):
+    from apps.tienda.facetas import valores_faceta
+
+    Producto = apps.get_model('tienda', 'Producto')
+    ConteoFaceta = apps.get_model('tienda', 'ConteoFaceta')
+    conteo = Counter()
+    for producto in Producto.objects.filter(activo=True).iterator():
+        conteo.update(valores_faceta(producto))
+    ConteoFaceta.objects.bulk_create(
+        ConteoFaceta(faceta=faceta, valor=valor, cantidad=cantidad)
+        for (faceta, valor), cantidad in conteo.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0004_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoFaceta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('faceta', models.CharField(max_length=20)),
+                ('valor', models.CharField(max_length=50)),
+                ('cantidad', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Conteo de Faceta',
+                'verbose_name_plural': 'Conteos de Facetas',
+                'unique_together': {('faceta', 'valor')},
+            },
+        ),
+        migrations.RunPython(calcular_conteos, migrations.RunPython.noop),
+    ]
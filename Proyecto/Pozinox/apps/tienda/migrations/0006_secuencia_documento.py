@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0005_conteofaceta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefijo', models.CharField(max_length=10)),
+                ('fecha', models.DateField()),
+                ('ultimo', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Documento',
+                'verbose_name_plural': 'Secuencias de Documentos',
+                'unique_together': {('prefijo', 'fecha')},
+            },
+        ),
+    ]
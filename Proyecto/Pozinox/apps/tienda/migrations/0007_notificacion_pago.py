@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0006_secuencia_documento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mercadopago_payment_id', models.CharField(max_length=100, unique=True)),
+                ('tipo', models.CharField(blank=True, max_length=50)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('recibidas', models.PositiveIntegerField(default=1)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesada', 'Procesada'), ('fallida', 'Fallida')], default='pendiente', max_length=10)),
+                ('estado_pago', models.CharField(blank=True, max_length=30)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_recepcion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_procesada', models.DateTimeField(blank=True, null=True)),
+                ('cotizacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notificaciones_pago', to='tienda.cotizacion')),
+            ],
+            options={
+                'verbose_name': 'Notificación de Pago',
+                'verbose_name_plural': 'Notificaciones de Pago',
+                'ordering': ['-fecha_recepcion'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='notificacion_pago_cola_idx')],
+            },
+        ),
+    ]
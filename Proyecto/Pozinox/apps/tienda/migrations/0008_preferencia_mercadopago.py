@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0007_notificacion_pago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cotizacion',
+            name='mercadopago_init_point',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='cotizacion',
+            name='mercadopago_preference_huella',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
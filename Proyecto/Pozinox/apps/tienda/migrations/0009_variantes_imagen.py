@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0008_preferencia_mercadopago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='variantes_imagen',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0009_variantes_imagen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='imagen_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:01
+
+import apps.tienda.almacenamiento
+import storages.backends.s3
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0010_imagen_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoContenido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True)),
+                ('tamano', models.PositiveBigIntegerField()),
+                ('referencias', models.PositiveIntegerField(default=1)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archivo por Contenido',
+                'verbose_name_plural': 'Archivos por Contenido',
+            },
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen',
+            field=models.ImageField(blank=True, null=True, storage=apps.tienda.almacenamiento.AlmacenamientoDeduplicado(storages.backends.s3.S3Storage()), upload_to='productos/'),
+        ),
+    ]
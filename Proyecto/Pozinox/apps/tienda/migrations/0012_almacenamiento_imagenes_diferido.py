@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:05
+
+import apps.tienda.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0011_archivo_contenido'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen',
+            field=models.ImageField(blank=True, null=True, storage=apps.tienda.almacenamiento.almacenamiento_imagenes, upload_to='productos/'),
+        ),
+    ]
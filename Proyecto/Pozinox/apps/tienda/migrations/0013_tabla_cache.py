@@ -0,0 +1,20 @@
+# Tabla del caché en base de datos (caché 'compartido' por defecto, ver CACHES en settings)
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def crear_tabla_cache(apps, schema_editor):
+    # No hace nada si la tabla ya existe o si el caché usa otro backend
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0012_almacenamiento_imagenes_diferido'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla_cache, migrations.RunPython.noop),
+    ]
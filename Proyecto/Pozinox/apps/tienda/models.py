@@ -1,8 +1,28 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.conf import settings
-from storages.backends.s3boto3 import S3Boto3Storage
-from decimal import Decimal
+from django.core.cache import caches
+from django.utils import timezone
+from .almacenamiento import almacenamiento_imagenes
+from decimal import Decimal, ROUND_HALF_UP
+from apps.usuarios.models import ConfiguracionSistema
+
+
+CLAVE_CACHE_IVA = 'configuracion:iva_porcentaje'
+
+
+def tasa_iva():
+    """Porcentaje de IVA de ConfiguracionSistema (19% si no hay configuración)"""
+    porcentaje = caches['compartido'].get(CLAVE_CACHE_IVA)
+    if porcentaje is None:
+        porcentaje = ConfiguracionSistema.objects.values_list('iva_porcentaje', flat=True).first()
+        porcentaje = Decimal(porcentaje) if porcentaje is not None else Decimal('19')
+        caches['compartido'].set(CLAVE_CACHE_IVA, porcentaje, None)
+    return porcentaje
 
 
 class CategoriaAcero(models.Model):
@@ -52,7 +72,12 @@ class Producto(models.Model):
     unidad_medida = models.CharField(max_length=20, default='unidad')
     
     # Metadatos
-    imagen = models.ImageField(upload_to='productos/', null=True, blank=True, storage=S3Boto3Storage())
+    # Las fotos repetidas se guardan una sola vez (ver apps/tienda/almacenamiento.py)
+    imagen = models.ImageField(upload_to='productos/', null=True, blank=True, storage=almacenamiento_imagenes)
+    # Nombres de las variantes reducidas de la imagen (ver apps/tienda/imagenes.py)
+    variantes_imagen = models.JSONField(default=dict, blank=True, editable=False)
+    # SHA-256 de la imagen actual, para no volver a subir la misma (ver apps/tienda/carga_imagenes.py)
+    imagen_hash = models.CharField(max_length=64, blank=True, editable=False)
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
@@ -61,6 +86,11 @@ class Producto(models.Model):
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
         ordering = ['categoria', 'nombre']
+        indexes = [
+            # Índices para la paginación por cursor del catálogo y del panel admin
+            models.Index(fields=['categoria', 'nombre', 'id'], name='producto_catalogo_idx'),
+            models.Index(fields=['-fecha_creacion', '-id'], name='producto_recientes_idx'),
+        ]
     
     def __str__(self):
         return f"{self.codigo_producto} - {self.nombre}"
@@ -70,6 +100,84 @@ class Producto(models.Model):
         return self.stock_actual <= self.stock_minimo
 
 
+class ArchivoContenido(models.Model):
+    """Objeto del almacenamiento nombrado por el hash de su contenido y cuántas referencias lo usan"""
+    nombre = models.CharField(max_length=255, unique=True)
+    tamano = models.PositiveBigIntegerField()
+    referencias = models.PositiveIntegerField(default=1)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Archivo por Contenido'
+        verbose_name_plural = 'Archivos por Contenido'
+
+    def __str__(self):
+        return f"{self.nombre} ({self.referencias} referencias)"
+
+
+class ConteoFaceta(models.Model):
+    """Conteo precalculado de productos activos por valor de faceta (tipo, categoría, grosor, precio)"""
+    faceta = models.CharField(max_length=20)
+    valor = models.CharField(max_length=50)
+    cantidad = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Conteo de Faceta'
+        verbose_name_plural = 'Conteos de Facetas'
+        unique_together = ['faceta', 'valor']
+
+    def __str__(self):
+        return f"{self.faceta}={self.valor}: {self.cantidad}"
+
+
+class SecuenciaDocumento(models.Model):
+    """Contador diario por prefijo para numerar cotizaciones, pedidos y compras"""
+    prefijo = models.CharField(max_length=10)
+    fecha = models.DateField()
+    ultimo = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Secuencia de Documento'
+        verbose_name_plural = 'Secuencias de Documentos'
+        unique_together = ['prefijo', 'fecha']
+    
+    def __str__(self):
+        return f"{self.prefijo} {self.fecha}: {self.ultimo}"
+    
+    @classmethod
+    def siguiente(cls, prefijo, fecha=None, inicial=None):
+        """
+        Reserva y retorna el siguiente correlativo del día para ``prefijo``.
+        
+        La fila del contador se bloquea con ``select_for_update`` mientras se
+        incrementa, así dos procesos nunca obtienen el mismo número. ``inicial``
+        es una función opcional que entrega el valor de partida cuando el
+        contador del día aún no existe (por ejemplo, documentos ya creados).
+        """
+        fecha = fecha or timezone.localdate()
+        with transaction.atomic():
+            secuencia = cls.objects.select_for_update().filter(prefijo=prefijo, fecha=fecha).first()
+            if secuencia is None:
+                try:
+                    with transaction.atomic():
+                        secuencia = cls.objects.create(
+                            prefijo=prefijo, fecha=fecha, ultimo=inicial() if inicial else 0
+                        )
+                except IntegrityError:
+                    # Otro proceso creó el contador del día al mismo tiempo
+                    secuencia = cls.objects.select_for_update().get(prefijo=prefijo, fecha=fecha)
+            secuencia.ultimo += 1
+            secuencia.save(update_fields=['ultimo'])
+        return secuencia.ultimo
+    
+    @classmethod
+    def generar_numero(cls, prefijo, digitos, inicial=None):
+        """Número de documento con formato PREFIJO + AAAAMMDD + correlativo"""
+        fecha = timezone.localdate()
+        correlativo = cls.siguiente(prefijo, fecha, inicial)
+        return f"{prefijo}{fecha.strftime('%Y%m%d')}{correlativo:0{digitos}d}"
+
+
 class Cliente(models.Model):
     """Clientes de la tienda Pozinox"""
     TIPO_CLIENTE = [
@@ -160,10 +268,10 @@ class Pedido(models.Model):
     def save(self, *args, **kwargs):
         if not self.numero_pedido:
             # Generar número de pedido automáticamente
-            import datetime
-            today = datetime.date.today()
-            last_pedido = Pedido.objects.filter(fecha_pedido__date=today).count()
-            self.numero_pedido = f"POZ{today.strftime('%Y%m%d')}{last_pedido + 1:03d}"
+            self.numero_pedido = SecuenciaDocumento.generar_numero(
+                'POZ', 3,
+                inicial=lambda: Pedido.objects.filter(fecha_pedido__date=timezone.localdate()).count(),
+            )
         super().save(*args, **kwargs)
 
 
@@ -227,6 +335,9 @@ class Cotizacion(models.Model):
     # MercadoPago
     mercadopago_preference_id = models.CharField(max_length=100, blank=True, null=True)
     mercadopago_payment_id = models.CharField(max_length=100, blank=True, null=True)
+    # Huella del contenido de la preferencia: si no cambia se reutiliza (ver pagos.py)
+    mercadopago_preference_huella = models.CharField(max_length=64, blank=True)
+    mercadopago_init_point = models.URLField(max_length=500, blank=True)
     
     # Observaciones
     observaciones = models.TextField(blank=True)
@@ -235,6 +346,9 @@ class Cotizacion(models.Model):
         verbose_name = 'Cotización'
         verbose_name_plural = 'Cotizaciones'
         ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['usuario', '-fecha_creacion', '-id'], name='cotizacion_usuario_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"Cotización {self.numero_cotizacion} - {self.usuario.username}"
@@ -242,19 +356,72 @@ class Cotizacion(models.Model):
     def save(self, *args, **kwargs):
         if not self.numero_cotizacion:
             # Generar número de cotización automáticamente
-            import datetime
-            today = datetime.date.today()
-            last_cotizacion = Cotizacion.objects.filter(fecha_creacion__date=today).count()
-            self.numero_cotizacion = f"COT{today.strftime('%Y%m%d')}{last_cotizacion + 1:04d}"
+            self.numero_cotizacion = SecuenciaDocumento.generar_numero(
+                'COT', 4,
+                inicial=lambda: Cotizacion.objects.filter(fecha_creacion__date=timezone.localdate()).count(),
+            )
         super().save(*args, **kwargs)
     
+    @staticmethod
+    def _totales(subtotal, porcentaje_iva):
+        """(iva, total) redondeados a 2 decimales para un subtotal dado"""
+        # Mitad hacia arriba, igual que Round() en SQL (ver aplicar_delta_subtotal)
+        iva = (subtotal * porcentaje_iva / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return iva, subtotal + iva
+    
     def calcular_totales(self):
         """Calcula los totales de la cotización basándose en los detalles"""
-        detalles = self.detalles.all()
-        self.subtotal = sum(detalle.subtotal for detalle in detalles) if detalles else Decimal('0')
-        self.iva = self.subtotal * Decimal('0.19')  # IVA del 19%
-        self.total = self.subtotal + self.iva
-        self.save()
+        self.subtotal = self.detalles.aggregate(suma=Sum('subtotal'))['suma'] or Decimal('0')
+        self.iva, self.total = self._totales(self.subtotal, tasa_iva())
+        self.save(update_fields=['subtotal', 'iva', 'total', 'fecha_actualizacion'])
+    
+    @classmethod
+    def aplicar_delta_subtotal(cls, cotizacion_id, delta):
+        """
+        Suma ``delta`` al subtotal de la cotización con una sola sentencia UPDATE.
+        
+        IVA y total se recalculan en la misma sentencia a partir del nuevo
+        subtotal, de modo que nunca quedan desfasados aunque haya escrituras
+        concurrentes sobre la misma cotización.
+        """
+        if not delta:
+            return
+        factor = tasa_iva() / 100
+        nuevo_subtotal = F('subtotal') + Value(delta, output_field=models.DecimalField())
+        iva = Round(nuevo_subtotal * factor, 2)
+        cls.objects.filter(pk=cotizacion_id).update(
+            subtotal=nuevo_subtotal,
+            iva=iva,
+            total=nuevo_subtotal + iva,
+            fecha_actualizacion=timezone.now(),
+        )
+    
+    @classmethod
+    def recalcular_totales(cls, queryset=None, corregir=True):
+        """
+        Verifica (y opcionalmente corrige) los totales de muchas cotizaciones.
+        
+        Suma los detalles de todas las cotizaciones en una sola consulta agregada
+        y guarda las diferencias con ``bulk_update``. Retorna las cotizaciones
+        que estaban inconsistentes.
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        porcentaje = tasa_iva()
+        cotizaciones = queryset.annotate(
+            suma_detalles=Coalesce(Sum('detalles__subtotal'), Value(Decimal('0')))
+        ).only('id', 'numero_cotizacion', 'subtotal', 'iva', 'total')
+        
+        inconsistentes = []
+        for cotizacion in cotizaciones.iterator(chunk_size=2000):
+            subtotal = Decimal(cotizacion.suma_detalles).quantize(Decimal('0.01'))
+            iva, total = cls._totales(subtotal, porcentaje)
+            if (cotizacion.subtotal, cotizacion.iva, cotizacion.total) != (subtotal, iva, total):
+                cotizacion.subtotal, cotizacion.iva, cotizacion.total = subtotal, iva, total
+                inconsistentes.append(cotizacion)
+        
+        if corregir and inconsistentes:
+            cls.objects.bulk_update(inconsistentes, ['subtotal', 'iva', 'total'], batch_size=500)
+        return inconsistentes
 
 
 class DetalleCotizacion(models.Model):
@@ -276,6 +443,61 @@ class DetalleCotizacion(models.Model):
     def save(self, *args, **kwargs):
         # Calcular subtotal
         self.subtotal = self.precio_unitario * self.cantidad
-        super().save(*args, **kwargs)
-        # Actualizar totales de la cotización
-        self.cotizacion.calcular_totales()
\ No newline at end of file
+        with transaction.atomic():
+            # Subtotal anterior (bloqueado) para aplicar solo la diferencia a la cotización
+            anterior = None
+            if self.pk:
+                anterior = DetalleCotizacion.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values_list('subtotal', flat=True).first()
+            super().save(*args, **kwargs)
+            Cotizacion.aplicar_delta_subtotal(self.cotizacion_id, self.subtotal - (anterior or Decimal('0')))
+
+
+class NotificacionPago(models.Model):
+    """Bandeja de entrada de notificaciones de MercadoPago (una fila por pago)"""
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesada', 'Procesada'),
+        ('fallida', 'Fallida'),
+    ]
+    
+    mercadopago_payment_id = models.CharField(max_length=100, unique=True)
+    tipo = models.CharField(max_length=50, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    recibidas = models.PositiveIntegerField(default=1)
+    
+    # Resultado de la consulta a MercadoPago
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='pendiente')
+    estado_pago = models.CharField(max_length=30, blank=True)
+    cotizacion = models.ForeignKey(
+        Cotizacion, on_delete=models.SET_NULL, null=True, blank=True, related_name='notificaciones_pago'
+    )
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    
+    fecha_recepcion = models.DateTimeField(auto_now_add=True)
+    fecha_procesada = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Notificación de Pago'
+        verbose_name_plural = 'Notificaciones de Pago'
+        ordering = ['-fecha_recepcion']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='notificacion_pago_cola_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Pago {self.mercadopago_payment_id} ({self.get_estado_display()})"
+
+
+# Señales para mantener los totales de cotizaciones sin recalcularlos completos
+@receiver(post_delete, sender=DetalleCotizacion)
+def descontar_detalle_cotizacion(sender, instance, **kwargs):
+    Cotizacion.aplicar_delta_subtotal(instance.cotizacion_id, -instance.subtotal)
+
+
+@receiver(post_save, sender=ConfiguracionSistema)
+def invalidar_tasa_iva(sender, **kwargs):
+    caches['compartido'].delete(CLAVE_CACHE_IVA)
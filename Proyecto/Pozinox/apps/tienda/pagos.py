@@ -0,0 +1,341 @@
+"""
+Integración con MercadoPago: preferencias de pago y conciliación.
+
+Todo el proceso comparte un solo SDK con una sesión HTTP persistente
+(``obtener_sdk``), en vez de abrir una conexión nueva en cada llamada. El SDK
+se importa recién al crearlo, así importar este módulo (y las vistas) no lo
+carga.
+
+Las preferencias se identifican por una huella de su contenido (ítems, montos,
+URLs y comprador). Si la cotización ya tiene una preferencia con la misma
+huella se reutiliza sin llamar a la API; los clics simultáneos sobre la misma
+cotización se serializan con un bloqueo de su fila.
+
+El webhook solo llama a ``registrar_notificacion``, que deja el aviso en la
+bandeja ``NotificacionPago`` (una fila por ``mercadopago_payment_id``, así que
+los reenvíos de MercadoPago no duplican trabajo) y responde de inmediato.
+Después del commit el pago se consulta en un pool de hilos
+(``MERCADOPAGO_CONCILIACION_INMEDIATA``): se pide con ``sdk.payment().get`` y,
+si está aprobado y el monto coincide, la cotización se marca como pagada. Lo
+que falle queda en la bandeja para el comando
+``procesar_notificaciones_mercadopago`` (servicio ``pagos`` de
+docker-compose), que la revisa por lotes y reintenta los errores de la API con
+espera exponencial hasta ``MERCADOPAGO_MAX_INTENTOS``.
+
+Igual que la cola de correos, al tomar un lote se posterga su
+``proximo_intento`` (arriendo) para que dos procesos no consulten el mismo pago
+a la vez y un proceso caído no deje notificaciones bloqueadas.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Case, F, Value, When
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Cotizacion, NotificacionPago
+
+
+logger = logging.getLogger(__name__)
+
+ARRIENDO_SEGUNDOS = 120
+ESPERA_BASE_SEGUNDOS = 15
+ESPERA_MAXIMA_SEGUNDOS = 3600
+# Errores de la API que vale la pena reintentar (404: el pago aún no es visible)
+ESTADOS_HTTP_REINTENTABLES = {404, 429, 500, 502, 503, 504}
+
+
+class ErrorPago(Exception):
+    """La API de MercadoPago rechazó la operación"""
+
+
+_sdks = {}
+_lock_sdk = threading.Lock()
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pagos')
+
+
+def _crear_sdk():
+    import mercadopago
+
+    if settings.MERCADOPAGO_SIMULADO:
+        from .mercadopago_simulado import ClienteHttpSimulado
+        return mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN or 'TEST-SIMULADO',
+                               http_client=ClienteHttpSimulado())
+    if not settings.MERCADOPAGO_ACCESS_TOKEN:
+        raise ImproperlyConfigured('MERCADOPAGO_ACCESS_TOKEN no está configurado')
+    from .mercadopago_http import ClienteHttpPersistente
+    return mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN, http_client=ClienteHttpPersistente())
+
+
+def obtener_sdk():
+    """SDK de MercadoPago compartido por el proceso (contra la API simulada si ``MERCADOPAGO_SIMULADO``)"""
+    clave = (settings.MERCADOPAGO_ACCESS_TOKEN, settings.MERCADOPAGO_SIMULADO)
+    sdk = _sdks.get(clave)
+    if sdk is None:
+        with _lock_sdk:
+            sdk = _sdks.get(clave)
+            if sdk is None:
+                sdk = _sdks[clave] = _crear_sdk()
+    return sdk
+
+
+def datos_preferencia(cotizacion, request):
+    """Contenido de la preferencia de pago de una cotización"""
+    detalles = cotizacion.detalles.select_related('producto').order_by('id')
+    return {
+        "items": [
+            {
+                "title": detalle.producto.nombre,
+                "quantity": detalle.cantidad,
+                "unit_price": float(detalle.precio_unitario),
+                "currency_id": "CLP",  # Peso chileno
+            }
+            for detalle in detalles
+        ],
+        "back_urls": {
+            "success": request.build_absolute_uri(reverse('pago_exitoso', args=[cotizacion.id])),
+            "failure": request.build_absolute_uri(reverse('pago_fallido', args=[cotizacion.id])),
+            "pending": request.build_absolute_uri(reverse('pago_pendiente', args=[cotizacion.id])),
+        },
+        "auto_return": "approved",
+        "external_reference": cotizacion.numero_cotizacion,
+        "notification_url": request.build_absolute_uri(reverse('webhook_mercadopago')),
+        "statement_descriptor": "Pozinox",
+        "payer": {
+            "name": request.user.first_name,
+            "surname": request.user.last_name,
+            "email": request.user.email,
+        },
+    }
+
+
+def huella_preferencia(datos):
+    """Hash estable del contenido de una preferencia"""
+    serializado = json.dumps(datos, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serializado.encode()).hexdigest()
+
+
+def obtener_init_point(cotizacion, datos):
+    """
+    URL de pago de la cotización; crea la preferencia solo si su contenido cambió.
+
+    La creación se hace con la fila de la cotización bloqueada: un segundo clic
+    simultáneo espera al primero y encuentra su preferencia ya guardada.
+    """
+    huella = huella_preferencia(datos)
+    if cotizacion.mercadopago_preference_huella == huella and cotizacion.mercadopago_init_point:
+        return cotizacion.mercadopago_init_point
+
+    with transaction.atomic():
+        bloqueada = Cotizacion.objects.select_for_update().only(
+            'id', 'mercadopago_preference_huella', 'mercadopago_init_point'
+        ).get(pk=cotizacion.pk)
+        if bloqueada.mercadopago_preference_huella == huella and bloqueada.mercadopago_init_point:
+            return bloqueada.mercadopago_init_point
+
+        respuesta = obtener_sdk().preference().create(datos)
+        preferencia = respuesta.get('response') or {}
+        if respuesta.get('status') not in (200, 201) or 'init_point' not in preferencia:
+            raise ErrorPago(preferencia.get('message') or f"MercadoPago respondió {respuesta.get('status')}")
+
+        # update() no dispara post_save (la cotización no cambió de contenido)
+        Cotizacion.objects.filter(pk=cotizacion.pk).update(
+            mercadopago_preference_id=preferencia['id'],
+            mercadopago_preference_huella=huella,
+            mercadopago_init_point=preferencia['init_point'],
+            metodo_pago='mercadopago',
+        )
+    return preferencia['init_point']
+
+
+def monto_esperado(cotizacion):
+    """Monto que debe cobrar MercadoPago: la suma de los ítems de la preferencia (precios netos)"""
+    return cotizacion.subtotal
+
+
+def verificar_firma(request, data_id):
+    """
+    Valida el encabezado ``x-signature`` de un webhook de MercadoPago.
+
+    Si no hay ``MERCADOPAGO_WEBHOOK_SECRET`` configurado no se valida nada: el
+    pago igual se confirma consultando la API, así que un aviso falso solo
+    cuesta una consulta.
+    """
+    secreto = settings.MERCADOPAGO_WEBHOOK_SECRET
+    if not secreto:
+        return True
+    partes = dict(
+        parte.strip().split('=', 1)
+        for parte in request.headers.get('x-signature', '').split(',') if '=' in parte
+    )
+    if 'ts' not in partes or 'v1' not in partes:
+        return False
+    manifiesto = f"id:{str(data_id).lower()};request-id:{request.headers.get('x-request-id', '')};ts:{partes['ts']};"
+    firma = hmac.new(secreto.encode(), manifiesto.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(firma, partes['v1'])
+
+
+def registrar_notificacion(payment_id, tipo='payment', payload=None):
+    """
+    Guarda (o vuelve a activar) la notificación de un pago; retorna True si es nueva.
+
+    Un aviso repetido de un pago aún pendiente solo incrementa ``recibidas``.
+    Si el pago ya se había procesado vuelve a la cola de inmediato, porque
+    MercadoPago también avisa cuando cambia el estado del pago.
+    """
+    payment_id = str(payment_id)
+
+    cambios = {
+        'tipo': tipo,
+        'payload': payload or {},
+        'recibidas': F('recibidas') + 1,
+        'estado': 'pendiente',
+        'intentos': Case(When(estado='pendiente', then=F('intentos')), default=Value(0)),
+        'proximo_intento': Case(When(estado='pendiente', then=F('proximo_intento')), default=Value(timezone.now())),
+    }
+    if NotificacionPago.objects.filter(mercadopago_payment_id=payment_id).update(**cambios):
+        nueva = False
+    else:
+        try:
+            with transaction.atomic():
+                NotificacionPago.objects.create(mercadopago_payment_id=payment_id, tipo=tipo, payload=payload or {})
+            nueva = True
+        except IntegrityError:
+            # Otra petición creó la fila entre el UPDATE y el INSERT
+            NotificacionPago.objects.filter(mercadopago_payment_id=payment_id).update(**cambios)
+            nueva = False
+
+    if getattr(settings, 'MERCADOPAGO_CONCILIACION_INMEDIATA', True):
+        transaction.on_commit(lambda: _ejecutor.submit(_procesar_en_segundo_plano, payment_id))
+    return nueva
+
+
+def _procesar_en_segundo_plano(payment_id):
+    try:
+        procesar_notificaciones(payment_ids=[payment_id])
+    except Exception:
+        logger.exception('Error al conciliar el pago %s', payment_id)
+    finally:
+        close_old_connections()
+
+
+def calcular_espera(intentos):
+    """Segundos a esperar antes del siguiente intento (15s, 30s, 60s, ... hasta 1 hora)"""
+    return min(ESPERA_BASE_SEGUNDOS * 2 ** max(intentos - 1, 0), ESPERA_MAXIMA_SEGUNDOS)
+
+
+def _tomar_lote(tamano_lote, payment_ids=None):
+    """
+    Reserva hasta ``tamano_lote`` notificaciones vencidas (solo de
+    ``payment_ids`` si se indica) postergando su próximo intento.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        pendientes = NotificacionPago.objects.filter(
+            estado='pendiente', proximo_intento__lte=ahora
+        ).order_by('proximo_intento', 'id')
+        if payment_ids is not None:
+            pendientes = pendientes.filter(mercadopago_payment_id__in=payment_ids)
+        if connection.features.has_select_for_update_skip_locked:
+            pendientes = pendientes.select_for_update(skip_locked=True)
+        ids = list(pendientes.values_list('id', flat=True)[:tamano_lote])
+        NotificacionPago.objects.filter(id__in=ids).update(
+            proximo_intento=ahora + timedelta(seconds=ARRIENDO_SEGUNDOS)
+        )
+    return list(NotificacionPago.objects.filter(id__in=ids).order_by('id'))
+
+
+class ErrorConciliacion(Exception):
+    """Error definitivo: reintentar la consulta no cambiaría el resultado"""
+
+
+def _conciliar(notificacion, pago):
+    """Aplica un pago consultado a su cotización; retorna la cotización"""
+    cotizacion = Cotizacion.objects.filter(numero_cotizacion=pago.get('external_reference')).first()
+    if cotizacion is None:
+        raise ErrorConciliacion(f"No existe la cotización {pago.get('external_reference')!r}")
+    if pago.get('status') != 'approved':
+        return cotizacion
+
+    monto = Decimal(str(pago.get('transaction_amount') or 0))
+    if monto.quantize(Decimal('1')) < monto_esperado(cotizacion).quantize(Decimal('1')):
+        raise ErrorConciliacion(f'Monto pagado {monto} menor al esperado {monto_esperado(cotizacion)}')
+
+    with transaction.atomic():
+        cotizacion = Cotizacion.objects.select_for_update().get(pk=cotizacion.pk)
+        if not cotizacion.pago_completado:
+            cotizacion.estado = 'pagada'
+            cotizacion.pago_completado = True
+            cotizacion.metodo_pago = 'mercadopago'
+            cotizacion.mercadopago_payment_id = notificacion.mercadopago_payment_id
+            cotizacion.save()
+    return cotizacion
+
+
+def procesar_notificaciones(tamano_lote=50, max_intentos=None, sdk=None, payment_ids=None):
+    """
+    Consulta y concilia un lote de notificaciones pendientes. ``payment_ids``
+    limita el lote a esos pagos (si siguen pendientes y nadie más los tomó).
+
+    Retorna un diccionario con la cantidad de notificaciones procesadas,
+    reprogramadas y fallidas definitivamente.
+    """
+    max_intentos = max_intentos or settings.MERCADOPAGO_MAX_INTENTOS
+    resultado = {'procesadas': 0, 'reintentos': 0, 'fallidas': 0}
+
+    notificaciones = _tomar_lote(tamano_lote, payment_ids)
+    if not notificaciones:
+        return resultado
+
+    sdk = sdk or obtener_sdk()
+    for notificacion in notificaciones:
+        try:
+            respuesta = sdk.payment().get(notificacion.mercadopago_payment_id)
+            if respuesta['status'] != 200:
+                error = f"MercadoPago respondió {respuesta['status']}: {respuesta.get('response')}"
+                if respuesta['status'] not in ESTADOS_HTTP_REINTENTABLES:
+                    raise ErrorConciliacion(error)
+                raise RuntimeError(error)
+            pago = respuesta['response']
+            cotizacion = _conciliar(notificacion, pago)
+        except ErrorConciliacion as e:
+            logger.warning('Notificación de pago %s rechazada: %s', notificacion.mercadopago_payment_id, e)
+            _registrar_fallo(notificacion, e, 0, resultado)
+        except Exception as e:
+            logger.warning('Error al consultar el pago %s: %s', notificacion.mercadopago_payment_id, e)
+            _registrar_fallo(notificacion, e, max_intentos, resultado)
+        else:
+            # Si llegó otro aviso mientras se consultaba, la fila queda pendiente
+            # para volver a consultar el estado más reciente
+            NotificacionPago.objects.filter(id=notificacion.id, recibidas=notificacion.recibidas).update(
+                estado='procesada',
+                estado_pago=pago.get('status', ''),
+                cotizacion=cotizacion,
+                intentos=notificacion.intentos + 1,
+                fecha_procesada=timezone.now(),
+                ultimo_error='',
+            )
+            resultado['procesadas'] += 1
+
+    return resultado
+
+
+def _registrar_fallo(notificacion, error, max_intentos, resultado):
+    intentos = notificacion.intentos + 1
+    cambios = {'intentos': intentos, 'ultimo_error': str(error)[:1000]}
+    if intentos >= max_intentos:
+        cambios['estado'] = 'fallida'
+        resultado['fallidas'] += 1
+    else:
+        cambios['proximo_intento'] = timezone.now() + timedelta(seconds=calcular_espera(intentos))
+        resultado['reintentos'] += 1
+    NotificacionPago.objects.filter(id=notificacion.id).update(**cambios)
@@ -0,0 +1,148 @@
+"""
+Generación y caché de los PDF de cotizaciones.
+
+Una cotización ``finalizada`` o ``pagada`` ya no cambia, así que su PDF se
+genera una sola vez (en segundo plano al finalizarla) y se guarda con un nombre
+derivado del hash de su contenido. Las descargas posteriores se sirven desde
+ese almacenamiento con el mismo hash como ETag. Si el contenido cambia (por
+ejemplo, el estado pasa a pagada) cambia el hash y se genera un PDF nuevo.
+
+Los borradores se generan en cada descarga, pero reutilizando los estilos de
+ReportLab construidos una sola vez (ver ``pdf_plantilla``).
+"""
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import LazyObject
+
+from .models import Cotizacion, tasa_iva
+from .pdf_plantilla import VERSION_PLANTILLA, renderizar_pdf
+
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_CACHEABLES = ('finalizada', 'pagada')
+
+
+class _AlmacenamientoPDF(LazyObject):
+    """
+    Almacenamiento privado de los PDF: S3 (sin acceso público) si está
+    configurado, o un directorio local que no se publica como media.
+    """
+    def _setup(self):
+        if getattr(settings, 'USE_S3_STORAGE', False):
+            from storages.backends.s3boto3 import S3Boto3Storage
+            self._wrapped = S3Boto3Storage(
+                location='cotizaciones-pdf', default_acl='private',
+                querystring_auth=True, file_overwrite=True,
+            )
+        else:
+            self._wrapped = FileSystemStorage(
+                location=settings.PDF_COTIZACIONES_ROOT, allow_overwrite=True,
+            )
+
+
+almacenamiento_pdf = _AlmacenamientoPDF()
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pdf-cotizaciones')
+
+
+def datos_cotizacion(cotizacion):
+    """Todo lo que se imprime en el PDF, en una estructura serializable"""
+    usuario = cotizacion.usuario
+    if 'detalles' in getattr(cotizacion, '_prefetched_objects_cache', {}):
+        detalles = sorted(cotizacion.detalles.all(), key=lambda d: d.id)
+    else:
+        detalles = cotizacion.detalles.select_related('producto').order_by('id')
+    return {
+        'version': VERSION_PLANTILLA,
+        'numero': cotizacion.numero_cotizacion,
+        'cliente': usuario.get_full_name() or usuario.username,
+        'email': usuario.email,
+        'fecha': timezone.localtime(cotizacion.fecha_creacion).strftime('%d/%m/%Y %H:%M'),
+        'estado': cotizacion.get_estado_display(),
+        'lineas': [
+            [d.producto.nombre, d.producto.codigo_producto, d.cantidad,
+             f'{d.precio_unitario:,.0f}', f'{d.subtotal:,.0f}']
+            for d in detalles
+        ],
+        'subtotal': f'{cotizacion.subtotal:,.0f}',
+        'iva_porcentaje': f'{tasa_iva().normalize():f}',
+        'iva': f'{cotizacion.iva:,.0f}',
+        'total': f'{cotizacion.total:,.0f}',
+        'observaciones': cotizacion.observaciones,
+    }
+
+
+def huella(datos):
+    """Hash estable del contenido del PDF; sirve de nombre de archivo y de ETag"""
+    serializado = json.dumps(datos, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serializado.encode()).hexdigest()
+
+
+def nombre_archivo(hash_contenido):
+    """Ruta del PDF dentro del almacenamiento según el hash de su contenido"""
+    return f'{hash_contenido[:2]}/{hash_contenido}.pdf'
+
+
+def _almacenar(datos, hash_contenido):
+    """Guarda el PDF con nombre según su hash si aún no existe; retorna el nombre"""
+    nombre = nombre_archivo(hash_contenido)
+    if not almacenamiento_pdf.exists(nombre):
+        almacenamiento_pdf.save(nombre, ContentFile(renderizar_pdf(datos)))
+    return nombre
+
+
+def obtener_pdf(cotizacion, datos=None):
+    """
+    Retorna el PDF de la cotización como archivo para descargar.
+
+    Si la cotización está cerrada se abre desde el almacenamiento (generándolo
+    primero si el trabajo en segundo plano aún no terminó). Si es un borrador
+    se genera al momento.
+    """
+    datos = datos or datos_cotizacion(cotizacion)
+    if cotizacion.estado not in ESTADOS_CACHEABLES:
+        return ContentFile(renderizar_pdf(datos))
+    return almacenamiento_pdf.open(_almacenar(datos, huella(datos)), 'rb')
+
+
+def generar_pdf_almacenado(cotizacion_id):
+    """Genera y guarda el PDF de una cotización cerrada si aún no existe; retorna el hash"""
+    cotizacion = Cotizacion.objects.select_related('usuario').filter(
+        id=cotizacion_id, estado__in=ESTADOS_CACHEABLES
+    ).first()
+    if cotizacion is None:
+        return None
+    datos = datos_cotizacion(cotizacion)
+    hash_contenido = huella(datos)
+    _almacenar(datos, hash_contenido)
+    return hash_contenido
+
+
+def _generar_en_segundo_plano(cotizacion_id):
+    try:
+        generar_pdf_almacenado(cotizacion_id)
+    except Exception:
+        logger.exception('Error al generar el PDF de la cotización %s', cotizacion_id)
+    finally:
+        close_old_connections()
+
+
+def programar_generacion(cotizacion_id):
+    """Encola la generación del PDF en el pool de hilos, después del commit"""
+    transaction.on_commit(lambda: _ejecutor.submit(_generar_en_segundo_plano, cotizacion_id))
+
+
+@receiver(post_save, sender=Cotizacion)
+def generar_pdf_al_cerrar(sender, instance, raw=False, **kwargs):
+    if not raw and instance.estado in ESTADOS_CACHEABLES and getattr(settings, 'PDF_COTIZACIONES_EN_SEGUNDO_PLANO', True):
+        programar_generacion(instance.id)
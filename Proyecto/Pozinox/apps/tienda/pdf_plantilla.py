@@ -0,0 +1,167 @@
+"""
+Diseño del PDF de cotizaciones con ReportLab.
+
+No depende de Django: recibe la estructura de ``pdf_cotizaciones.datos_cotizacion``
+y retorna los bytes del PDF, por lo que puede ejecutarse en procesos de un
+``ProcessPoolExecutor``. ReportLab se importa y los estilos se construyen una
+sola vez por proceso, al generar el primer PDF, no al importar el módulo.
+"""
+from functools import lru_cache
+from io import BytesIO
+
+
+# Cambiar al modificar el diseño del PDF para no servir versiones antiguas
+VERSION_PLANTILLA = 1
+
+
+@lru_cache(maxsize=None)
+def _estilos():
+    """Estilos del PDF, construidos una sola vez por proceso al generar el primero"""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+
+    base = getSampleStyleSheet()
+    azul = colors.HexColor('#1e3a8a')
+    return {
+        'base': base,
+        'titulo': ParagraphStyle(
+            'CustomTitle',
+            parent=base['Heading1'],
+            fontSize=24,
+            textColor=azul,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        ),
+        'encabezado': ParagraphStyle(
+            'CustomHeading',
+            parent=base['Heading2'],
+            fontSize=14,
+            textColor=azul,
+            spaceAfter=12,
+            fontName='Helvetica-Bold'
+        ),
+        'normal': ParagraphStyle(
+            'CustomNormal',
+            parent=base['Normal'],
+            fontSize=10,
+            spaceAfter=12,
+        ),
+        'pie': ParagraphStyle(
+            'Footer',
+            parent=base['Normal'],
+            fontSize=8,
+            textColor=colors.grey,
+            alignment=TA_CENTER,
+        ),
+        'tabla_info': TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('TEXTCOLOR', (0, 0), (0, -1), azul),
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ]),
+        'tabla_productos': TableStyle([
+            # Encabezado
+            ('BACKGROUND', (0, 0), (-1, 0), azul),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+            # Contenido
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('ALIGN', (2, 1), (2, -1), 'CENTER'),
+            ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8fafc')]),
+            ('TOPPADDING', (0, 1), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ]),
+        'tabla_totales': TableStyle([
+            ('FONTNAME', (0, 0), (0, 1), 'Helvetica'),
+            ('FONTNAME', (1, 0), (1, 1), 'Helvetica-Bold'),
+            ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 2), 11),
+            ('FONTSIZE', (0, 3), (-1, 3), 14),
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('TEXTCOLOR', (0, 3), (-1, 3), azul),
+            ('LINEABOVE', (0, 3), (-1, 3), 2, azul),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ]),
+    }
+
+
+def renderizar_pdf(datos):
+    """Construye el PDF y retorna sus bytes"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+
+    estilos = _estilos()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72,
+                            topMargin=72, bottomMargin=18)
+    elements = []
+
+    # Título
+    elements.append(Paragraph('POZINOX', estilos['titulo']))
+    elements.append(Paragraph('Tienda de Aceros', estilos['base']['Normal']))
+    elements.append(Spacer(1, 20))
+
+    # Información de la cotización
+    elements.append(Paragraph(f"COTIZACIÓN N° {datos['numero']}", estilos['encabezado']))
+    info_table = Table([
+        ['Cliente:', datos['cliente']],
+        ['Email:', datos['email']],
+        ['Fecha:', datos['fecha']],
+        ['Estado:', datos['estado']],
+    ], colWidths=[2*inch, 4*inch])
+    info_table.setStyle(estilos['tabla_info'])
+    elements.append(info_table)
+    elements.append(Spacer(1, 20))
+
+    # Tabla de productos
+    elements.append(Paragraph('DETALLE DE PRODUCTOS', estilos['encabezado']))
+    table_data = [['Producto', 'Código', 'Cantidad', 'Precio Unit.', 'Subtotal']]
+    for nombre, codigo, cantidad, precio, subtotal in datos['lineas']:
+        table_data.append([Paragraph(nombre, estilos['normal']), codigo, str(cantidad), f'${precio}', f'${subtotal}'])
+    product_table = Table(table_data, colWidths=[2.5*inch, 1.2*inch, 0.8*inch, 1*inch, 1*inch])
+    product_table.setStyle(estilos['tabla_productos'])
+    elements.append(product_table)
+    elements.append(Spacer(1, 20))
+
+    # Totales
+    totales_table = Table([
+        ['Subtotal:', f"${datos['subtotal']}"],
+        [f"IVA ({datos['iva_porcentaje']}%):", f"${datos['iva']}"],
+        ['', ''],
+        ['TOTAL:', f"${datos['total']}"],
+    ], colWidths=[5*inch, 1.5*inch])
+    totales_table.setStyle(estilos['tabla_totales'])
+    elements.append(totales_table)
+    elements.append(Spacer(1, 30))
+
+    # Observaciones si existen
+    if datos['observaciones']:
+        elements.append(Paragraph('OBSERVACIONES:', estilos['encabezado']))
+        elements.append(Paragraph(datos['observaciones'], estilos['normal']))
+        elements.append(Spacer(1, 20))
+
+    # Pie de página
+    elements.append(Spacer(1, 30))
+    elements.append(Paragraph('_______________________________________________', estilos['pie']))
+    elements.append(Spacer(1, 10))
+    elements.append(Paragraph('POZINOX - Tienda de Aceros', estilos['pie']))
+    elements.append(Paragraph('www.pozinox.cl | info@pozinox.cl | +56 2 1234 5678', estilos['pie']))
+    elements.append(Paragraph('Este documento es una cotización y no constituye una factura', estilos['pie']))
+
+    doc.build(elements)
+    return buffer.getvalue()
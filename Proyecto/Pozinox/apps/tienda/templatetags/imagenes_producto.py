@@ -0,0 +1,46 @@
+"""
+Tags para mostrar las imágenes de productos con sus variantes reducidas.
+
+    {% load imagenes_producto %}
+    {% imagen_producto producto "product-image" "(max-width: 576px) 50vw, 320px" %}
+
+Si las variantes de la imagen actual ya existen se arma un ``<picture>`` con
+``srcset`` WebP y JPEG; si no, un ``<img>`` con el original.
+"""
+from django import template
+from django.utils.html import format_html
+
+from ..imagenes import variantes_vigentes
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset(producto, formato='webp'):
+    """Valor del atributo ``srcset`` para las variantes de un formato ('' si no hay)"""
+    variantes = variantes_vigentes(producto)
+    if variantes is None:
+        return ''
+    storage = producto.imagen.storage
+    anchos = sorted(variantes.get(formato, {}).items(), key=lambda item: int(item[0]))
+    return ', '.join(f'{storage.url(nombre)} {ancho}w' for ancho, nombre in anchos)
+
+
+@register.simple_tag
+def imagen_producto(producto, clase='', sizes='100vw'):
+    """``<picture>`` con las variantes del producto, o ``<img>`` con el original si aún no existen"""
+    variantes = variantes_vigentes(producto)
+    if variantes is None:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+            producto.imagen.url, producto.nombre, clase,
+        )
+    # El src de respaldo es la variante JPEG más grande
+    jpeg = variantes['jpeg'][max(variantes['jpeg'], key=int)]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        srcset(producto, 'webp'), sizes,
+        producto.imagen.storage.url(jpeg), srcset(producto, 'jpeg'), sizes, producto.nombre, clase,
+    )
@@ -1,3 +1,1240 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import hmac
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import mercadopago
+import requests
+from PIL import Image
+
+from apps import supabase_simulado
+from apps.paginacion import PaginadorCursor, codificar_cursor
+from apps.inventario import stock
+from apps.inventario.models import AlertaInventario, MovimientoInventario
+from apps.supabase_simulado import ClienteSupabaseSimulado
+from apps.utils import SupabaseStorage
+
+from . import busqueda, exportacion_pdf, mercadopago_simulado, pagos, pdf_cotizaciones
+from .almacenamiento import AlmacenamientoDeduplicado
+from .autocompletado import IndiceAutocompletado
+from .cache import CLAVE_VERSION, invalidar_catalogo
+from .captcha import generar_desafio, verificar_desafio
+from .carga_imagenes import cargar_imagenes
+from .facetas import filtrar_productos, obtener_conteos, reconstruir_conteos
+from .imagenes import generar_variantes
+from .management.commands import medir_arranque
+from .lineas_cotizacion import agregar_lineas, parsear_csv
+from .importacion import importar_productos
+from .models import (
+    ArchivoContenido, CategoriaAcero, Cotizacion, DetalleCotizacion, NotificacionPago, Producto, SecuenciaDocumento,
+)
+
+try:
+    import boto3
+    from moto import mock_aws
+    from storages.backends.s3boto3 import S3Boto3Storage
+except ImportError:
+    mock_aws = None
+
+
+def crear_producto(categoria, codigo, **campos):
+    """Producto activo con valores por defecto para las pruebas"""
+    datos = {
+        'nombre': codigo, 'descripcion': 'Producto de prueba', 'tipo_acero': 'carbono',
+        'precio_por_unidad': 1000, **campos,
+    }
+    return Producto.objects.create(codigo_producto=codigo, categoria=categoria, **datos)
+
+
+class BusquedaProductosTests(TestCase):
+    """Índice de texto completo del catálogo y su sincronización por señales"""
+
+    def setUp(self):
+        self.categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        self.plancha = crear_producto(
+            self.categoria, 'PL-304-2', nombre='Plancha Acero Inoxidable', descripcion='Plancha lisa 2 mm',
+        )
+        self.tubo = crear_producto(
+            self.categoria, 'TU-10', nombre='Tubo redondo', descripcion='Tubo para barandas de acero inoxidable',
+        )
+
+    def buscar(self, texto):
+        return list(busqueda.buscar_productos(Producto.objects.all(), texto).values_list('codigo_producto', flat=True))
+
+    def test_sin_tildes_con_derivacion_y_por_codigo(self):
+        self.assertEqual(self.buscar('planchas inóxidables'), ['PL-304-2'])
+        self.assertEqual(self.buscar('pl3042'), ['PL-304-2'])
+        # Una coincidencia en el nombre pesa más que en la descripción
+        self.assertEqual(self.buscar('inoxidable'), ['PL-304-2', 'TU-10'])
+
+    def test_senales_mantienen_el_indice(self):
+        self.tubo.nombre = 'Cañería galvanizada'
+        self.tubo.save()
+        self.assertEqual(self.buscar('canerias'), ['TU-10'])
+        self.assertEqual(self.buscar('redondo'), [])
+
+        self.plancha.delete()
+        self.assertEqual(self.buscar('plancha'), [])
+
+    def test_reconstruccion_fallida_conserva_el_indice(self):
+        with unittest.mock.patch.object(busqueda._BackendSQLite, 'indexar', side_effect=RuntimeError('falla')):
+            with self.assertRaises(RuntimeError):
+                busqueda.reconstruir_indice()
+        self.assertEqual(self.buscar('plancha'), ['PL-304-2'])
+
+        self.assertEqual(busqueda.reconstruir_indice(tamano_lote=1), 2)
+        self.assertEqual(self.buscar('tubo'), ['TU-10'])
+
+
+class AutocompletadoTests(TestCase):
+    """Índice en memoria de prefijos y trigramas para el autocompletado"""
+
+    def setUp(self):
+        categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        crear_producto(categoria, 'PL-304-2', nombre='Plancha inoxidable')
+        crear_producto(categoria, 'TU-10', nombre='Tubo redondo')
+        self.indice = IndiceAutocompletado(ttl=60, tamano_cache=2)
+
+    def codigos(self, texto):
+        return [producto['codigo'] for producto in self.indice.buscar(texto)]
+
+    def test_prefijo_y_errores_de_tipeo(self):
+        self.assertEqual(self.codigos('pl-30'), ['PL-304-2'])
+        self.assertEqual(self.codigos('tubo red'), ['TU-10'])
+        self.assertEqual(self.codigos('plancja'), ['PL-304-2'])
+        self.assertEqual(self.codigos('zzz'), [])
+
+    def test_ttl_y_cache_lru(self):
+        with unittest.mock.patch('apps.tienda.autocompletado.time.monotonic', return_value=1000):
+            self.assertEqual(self.codigos('redondo'), ['TU-10'])
+            # update() no dispara señales: el cambio llega al vencer el TTL
+            Producto.objects.filter(codigo_producto='TU-10').update(nombre='Cañería')
+            self.assertEqual(self.codigos('redondo'), ['TU-10'])
+
+            self.codigos('plancha')
+            self.codigos('pl')
+            self.assertNotIn(('redondo', 'redondo', 10), self.indice._cache)
+            self.assertEqual(len(self.indice._cache), 2)
+
+        with unittest.mock.patch('apps.tienda.autocompletado.time.monotonic', return_value=1061):
+            self.assertEqual(self.codigos('redondo'), [])
+            self.assertEqual(self.codigos('caneria'), ['TU-10'])
+
+    def test_api_json(self):
+        respuesta = self.client.get('/api/productos/autocompletar/', {'q': 'plan', 'limite': 'x'})
+        self.assertEqual(respuesta.json()['resultados'][0]['codigo'], 'PL-304-2')
+        self.assertEqual(self.client.get('/api/productos/autocompletar/').json(), {'resultados': []})
+
+
+class PaginacionCursorTests(TestCase):
+    """Paginación por cursor firmada sobre el orden del catálogo"""
+
+    def setUp(self):
+        categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        # Nombres repetidos: el id desempata el orden
+        for i in range(7):
+            crear_producto(categoria, f'PL-{i}', nombre=f'Plancha {i // 2}')
+        self.paginador = PaginadorCursor(Producto.objects.all(), ['categoria_id', 'nombre', 'id'], 3, total='exacto')
+        self.esperados = list(Producto.objects.order_by('categoria_id', 'nombre', 'id').values_list('codigo_producto', flat=True))
+
+    def codigos(self, pagina):
+        return [producto.codigo_producto for producto in pagina]
+
+    def test_avanzar_y_retroceder(self):
+        primera = self.paginador.get_page()
+        segunda = self.paginador.get_page(primera.cursor_siguiente)
+        tercera = self.paginador.get_page(segunda.cursor_siguiente)
+        self.assertEqual(self.codigos(primera) + self.codigos(segunda) + self.codigos(tercera), self.esperados)
+        self.assertEqual((primera.has_previous, tercera.has_next, tercera.total), (False, False, 7))
+
+        self.assertEqual(self.codigos(self.paginador.get_page(tercera.cursor_anterior)), self.esperados[3:6])
+        anterior = self.paginador.get_page(segunda.cursor_anterior)
+        self.assertEqual(self.codigos(anterior), self.esperados[:3])
+        self.assertFalse(anterior.has_previous)
+
+        ultima = self.paginador.get_page(codificar_cursor('p', None))
+        self.assertEqual(self.codigos(ultima), self.esperados[4:])
+        self.assertEqual((ultima.has_previous, ultima.has_next), (True, False))
+
+    def test_cursor_manipulado_vuelve_al_inicio(self):
+        cursor = self.paginador.get_page().cursor_siguiente
+        for manipulado in (cursor[:-2] + 'xx', 'no-es-un-cursor'):
+            self.assertEqual(self.codigos(self.paginador.get_page(manipulado)), self.esperados[:3])
+
+    def test_enlaces_conservan_filtros(self):
+        pagina = self.paginador.get_page(parametros=QueryDict('q=plancha&page=4&cursor=viejo'))
+        self.assertEqual(pagina.url_primera, '?q=plancha')
+        siguiente = QueryDict(pagina.url_siguiente[1:])
+        self.assertEqual((siguiente['q'], siguiente['cursor']), ('plancha', pagina.cursor_siguiente))
+
+
+class FacetasTests(TestCase):
+    """Conteos precalculados de facetas mantenidos por señales"""
+
+    def setUp(self):
+        self.planchas = CategoriaAcero.objects.create(nombre='Planchas')
+        self.tubos = CategoriaAcero.objects.create(nombre='Tubos')
+
+    def conteos(self):
+        return {faceta: dict(valores) for faceta, valores in obtener_conteos().items()}
+
+    def test_deltas_al_crear_modificar_y_eliminar(self):
+        plancha = crear_producto(self.planchas, 'PL-1', grosor=2, precio_por_unidad=15000)
+        tubo = crear_producto(self.tubos, 'TU-1', tipo_acero='inoxidable', precio_por_unidad=5000)
+        crear_producto(self.tubos, 'TU-2', activo=False)
+        self.assertEqual(self.conteos(), {
+            'tipo': {'carbono': 1, 'inoxidable': 1},
+            'categoria': {str(self.planchas.id): 1, str(self.tubos.id): 1},
+            'grosor': {'1-3': 1},
+            'precio': {'10000-50000': 1, '0-10000': 1},
+        })
+
+        plancha.grosor = 8
+        plancha.categoria = self.tubos
+        plancha.save()
+        tubo.activo = False
+        tubo.save()
+        self.assertEqual(self.conteos(), {
+            'tipo': {'carbono': 1}, 'categoria': {str(self.tubos.id): 1},
+            'grosor': {'6-12': 1}, 'precio': {'10000-50000': 1},
+        })
+
+        plancha.delete()
+        self.assertEqual(self.conteos(), {})
+
+    def test_reconstruir_corrige_cambios_sin_senales(self):
+        crear_producto(self.planchas, 'PL-1')
+        Producto.objects.update(tipo_acero='galvanizado')
+        self.assertEqual(self.conteos()['tipo'], {'carbono': 1})
+        reconstruir_conteos()
+        self.assertEqual(self.conteos()['tipo'], {'galvanizado': 1})
+
+    def test_filtros_ignoran_valores_invalidos(self):
+        crear_producto(self.planchas, 'PL-1', tipo_acero='inoxidable', grosor=2)
+        crear_producto(self.planchas, 'PL-2', grosor=20)
+        productos, seleccion = filtrar_productos(
+            Producto.objects.all(), QueryDict('tipo=inoxidable&tipo=oro&grosor=1-3&categoria=x&precio=caro')
+        )
+        self.assertEqual([p.codigo_producto for p in productos], ['PL-1'])
+        self.assertEqual(seleccion, {'tipo': ['inoxidable'], 'categoria': '', 'grosor': '1-3', 'precio': ''})
+
+
+class CacheCatalogoTests(TestCase):
+    """Caché versionado de las páginas del catálogo"""
+
+    def test_invalidacion_desde_otro_proceso(self):
+        categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        crear_producto(categoria, 'PL-1', precio_por_unidad=1234)
+        self.assertContains(self.client.get('/productos/'), '$1234')
+
+        # Un comando de gestión actualiza sin señales y cambia la versión en el caché compartido
+        Producto.objects.update(precio_por_unidad=5678)
+        self.assertContains(self.client.get('/productos/'), '$1234')
+        caches.create_connection('compartido').set(CLAVE_VERSION, time.time_ns(), None)
+        with override_settings(CACHE_VERSION_CATALOGO_SEGUNDOS=60):
+            self.assertContains(self.client.get('/productos/'), '$1234')
+        with override_settings(CACHE_VERSION_CATALOGO_SEGUNDOS=0):
+            self.assertContains(self.client.get('/productos/'), '$5678')
+
+    def test_visita_anonima_no_escribe_en_la_base(self):
+        categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        crear_producto(categoria, 'PL-1')
+        for url in ('/', '/productos/'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            with override_settings(CACHE_VERSION_CATALOGO_SEGUNDOS=0), CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            escrituras = [c['sql'] for c in consultas if c['sql'].split()[0].upper() in ('INSERT', 'UPDATE', 'DELETE')]
+            self.assertEqual(escrituras, [])
+
+
+class RespuestaCondicionalTests(TestCase):
+    """ETag / Last-Modified del catálogo y del detalle de producto"""
+
+    def setUp(self):
+        categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        self.producto = crear_producto(categoria, 'PL-1')
+        self.url = f'/producto/{self.producto.id}/'
+
+    def test_304_hasta_que_cambia_el_producto(self):
+        for url in ('/productos/', self.url):
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertTrue(respuesta.has_header('Last-Modified'))
+            condicional = self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+            self.assertEqual(condicional.status_code, 304)
+            por_fecha = self.client.get(url, HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+            self.assertEqual(por_fecha.status_code, 304)
+
+        etag = self.client.get(self.url)['ETag']
+        self.producto.precio_por_unidad = 2000
+        self.producto.save()
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_etag_distinto_por_usuario(self):
+        anonimo = self.client.get(self.url)
+        self.client.force_login(User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave'))
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=anonimo['ETag'])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.has_header('Last-Modified'))
+
+    def test_pagina_cacheada_no_consulta_productos(self):
+        for url in ('/productos/?q=PL-1', self.url):
+            respuesta = self.client.get(url)
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+            self.assertEqual([c['sql'] for c in consultas if 'tienda_producto' in c['sql']], [])
+
+    def test_producto_inactivo(self):
+        Producto.objects.filter(pk=self.producto.pk).update(activo=False)
+        invalidar_catalogo()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class CaptchaTests(TestCase):
+    """Captcha de suma firmado del formulario de contacto"""
+
+    def test_un_solo_intento_por_token(self):
+        suma_a, suma_b, token = generar_desafio()
+        self.assertTrue(verificar_desafio(token, str(suma_a + suma_b)))
+        self.assertFalse(verificar_desafio(token, str(suma_a + suma_b)))
+
+        # Una respuesta incorrecta también consume el token
+        suma_a, suma_b, token = generar_desafio()
+        self.assertFalse(verificar_desafio(token, suma_a + suma_b + 1))
+        self.assertFalse(verificar_desafio(token, suma_a + suma_b))
+
+    def test_token_manipulado_o_vencido(self):
+        suma_a, suma_b, token = generar_desafio()
+        self.assertFalse(verificar_desafio(token[:-1] + ('A' if token[-1] != 'A' else 'B'), suma_a + suma_b))
+        self.assertFalse(verificar_desafio(None, suma_a + suma_b))
+        self.assertFalse(verificar_desafio(token, 'x'))
+
+        suma_a, suma_b, token = generar_desafio()
+        with unittest.mock.patch('django.core.signing.time.time', return_value=time.time() + 31 * 60):
+            self.assertFalse(verificar_desafio(token, suma_a + suma_b))
+
+    def test_inicio_no_escribe_en_la_sesion(self):
+        respuesta = self.client.get('/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('sessionid', respuesta.cookies)
+        self.assertFalse(Session.objects.exists())
+        self.assertContains(respuesta, 'name="captcha"')
+
+
+class TotalesCotizacionTests(TestCase):
+    """Totales de cotizaciones actualizados por diferencias y su recálculo completo"""
+
+    def setUp(self):
+        categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        self.plancha = crear_producto(categoria, 'PL-1', precio_por_unidad=Decimal('1.50'))
+        self.tubo = crear_producto(categoria, 'TU-1', precio_por_unidad=Decimal('1000'))
+        self.cotizacion = Cotizacion.objects.create(usuario=User.objects.create_user('cliente'))
+
+    def totales(self):
+        self.cotizacion.refresh_from_db()
+        return self.cotizacion.subtotal, self.cotizacion.iva, self.cotizacion.total
+
+    def test_agregar_modificar_y_eliminar_lineas(self):
+        detalle = DetalleCotizacion.objects.create(cotizacion=self.cotizacion, producto=self.plancha, precio_unitario=Decimal('1.50'))
+        # 1,50 x 19% = 0,285: se redondea hacia arriba por ambos caminos
+        self.assertEqual(self.totales(), (Decimal('1.50'), Decimal('0.29'), Decimal('1.79')))
+        self.assertEqual(Cotizacion.recalcular_totales(corregir=False), [])
+
+        DetalleCotizacion.objects.create(cotizacion=self.cotizacion, producto=self.tubo, cantidad=2, precio_unitario=1000)
+        detalle.cantidad = 3
+        detalle.save()
+        self.assertEqual(self.totales(), (Decimal('2004.50'), Decimal('380.86'), Decimal('2385.36')))
+        self.assertEqual(Cotizacion.recalcular_totales(corregir=False), [])
+
+        detalle.delete()
+        self.assertEqual(self.totales(), (Decimal('2000.00'), Decimal('380.00'), Decimal('2380.00')))
+        self.assertEqual(Cotizacion.recalcular_totales(corregir=False), [])
+
+    def test_recalcular_corrige_cambios_sin_senales(self):
+        DetalleCotizacion.objects.create(cotizacion=self.cotizacion, producto=self.tubo, precio_unitario=1000)
+        DetalleCotizacion.objects.update(subtotal=Decimal('1.50'))
+
+        inconsistentes = Cotizacion.recalcular_totales()
+        self.assertEqual([c.pk for c in inconsistentes], [self.cotizacion.pk])
+        self.assertEqual(self.totales(), (Decimal('1.50'), Decimal('0.29'), Decimal('1.79')))
+        self.assertEqual(Cotizacion.recalcular_totales(), [])
+
+
+class LineasCotizacionTests(TestCase):
+    """Edición de líneas de cotizaciones: carga masiva y ediciones concurrentes"""
+
+    def setUp(self):
+        categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        self.plancha = crear_producto(categoria, 'PL-1', precio_por_unidad=1000)
+        self.tubo = crear_producto(categoria, 'TU-1', precio_por_unidad=500)
+        crear_producto(categoria, 'XX-1', activo=False)
+        self.usuario = User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave')
+        self.cotizacion = Cotizacion.objects.create(usuario=self.usuario)
+
+    def test_carga_masiva_suma_repetidos_y_reporta_errores(self):
+        DetalleCotizacion.objects.create(cotizacion=self.cotizacion, producto=self.tubo, precio_unitario=500)
+        lineas = parsear_csv('codigo;cantidad\nPL-1;2\nTU-1\nPL-1,3\nXX-1,1\nPL-1,-4')
+        self.assertEqual([linea['linea'] for linea in lineas], [2, 3, 4, 5, 6])
+
+        resultado = agregar_lineas(self.cotizacion, lineas + [{'producto_id': 'x'}])
+        self.assertEqual((resultado['creadas'], resultado['actualizadas']), (1, 1))
+        self.assertEqual([error['linea'] for error in resultado['errores']], [5, 6, 6])
+        self.assertEqual(
+            dict(self.cotizacion.detalles.values_list('producto__codigo_producto', 'cantidad')), {'PL-1': 5, 'TU-1': 2}
+        )
+        self.cotizacion.refresh_from_db()
+        self.assertEqual((self.cotizacion.subtotal, self.cotizacion.total), (Decimal('6000'), Decimal('7140')))
+
+    def test_ediciones_con_datos_desactualizados(self):
+        detalle = DetalleCotizacion.objects.create(cotizacion=self.cotizacion, producto=self.plancha, precio_unitario=1000)
+        otra_copia = DetalleCotizacion.objects.get(pk=detalle.pk)
+
+        # Dos peticiones leen la misma línea y la guardan una tras otra
+        detalle.cantidad = 3
+        detalle.save()
+        otra_copia.cantidad = 5
+        otra_copia.save()
+        agregar_lineas(self.cotizacion, [{'producto_id': self.plancha.id, 'cantidad': 1}])
+
+        self.cotizacion.refresh_from_db()
+        self.assertEqual(self.cotizacion.detalles.get().cantidad, 6)
+        self.assertEqual(self.cotizacion.subtotal, Decimal('6000'))
+        self.assertEqual(Cotizacion.recalcular_totales(corregir=False), [])
+
+    def test_cotizacion_finalizada_despues_de_leerla(self):
+        DetalleCotizacion.objects.create(cotizacion=self.cotizacion, producto=self.plancha, precio_unitario=1000)
+        Cotizacion.objects.filter(pk=self.cotizacion.pk).update(estado='finalizada')
+
+        # self.cotizacion todavía dice 'borrador'
+        resultado = agregar_lineas(self.cotizacion, [{'codigo_producto': 'TU-1', 'cantidad': 1}])
+        self.assertEqual(resultado['errores'], [{'linea': None, 'error': 'La cotización ya no está en borrador'}])
+        self.assertEqual(self.cotizacion.detalles.count(), 1)
+
+        self.client.force_login(self.usuario)
+        detalle = self.cotizacion.detalles.get()
+        respuesta = self.client.post(f'/cotizaciones/detalle/{detalle.id}/actualizar-cantidad/', {'cantidad': 9})
+        self.assertEqual(respuesta.status_code, 400)
+        self.client.post(f'/cotizaciones/detalle/{detalle.id}/eliminar/')
+        self.client.post(f'/cotizaciones/{self.cotizacion.id}/agregar-producto/', {'producto_id': self.tubo.id})
+        self.assertEqual(list(self.cotizacion.detalles.values_list('cantidad', flat=True)), [1])
+
+
+class PDFCotizacionesTests(TestCase):
+    """PDF de cotizaciones cerradas guardados según el hash de su contenido"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.almacenamiento = FileSystemStorage(location=directorio.name)
+        almacenamiento = unittest.mock.patch.object(pdf_cotizaciones, 'almacenamiento_pdf', self.almacenamiento)
+        almacenamiento.start()
+        self.addCleanup(almacenamiento.stop)
+
+        self.usuario = User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave')
+        self.producto = crear_producto(CategoriaAcero.objects.create(nombre='Planchas'), 'PL-1')
+        self.cotizacion = self.cotizacion_con_linea()
+
+    def cotizacion_con_linea(self, **campos):
+        cotizacion = Cotizacion.objects.create(usuario=self.usuario, **campos)
+        DetalleCotizacion.objects.create(cotizacion=cotizacion, producto=self.producto, cantidad=2, precio_unitario=1000)
+        return Cotizacion.objects.get(pk=cotizacion.pk)
+
+    def renderizar(self):
+        """Cuenta las generaciones sin dejar de producir el PDF real"""
+        return unittest.mock.patch.object(
+            pdf_cotizaciones, 'renderizar_pdf', side_effect=pdf_cotizaciones.renderizar_pdf
+        )
+
+    def test_huella_cambia_con_el_contenido(self):
+        datos = pdf_cotizaciones.datos_cotizacion(self.cotizacion)
+        self.assertEqual(datos['lineas'], [['PL-1', 'PL-1', 2, '1,000', '2,000']])
+        self.assertEqual(pdf_cotizaciones.huella(datos), pdf_cotizaciones.huella(dict(reversed(datos.items()))))
+
+        self.cotizacion.estado = 'pagada'
+        self.assertNotEqual(pdf_cotizaciones.huella(pdf_cotizaciones.datos_cotizacion(self.cotizacion)), pdf_cotizaciones.huella(datos))
+
+    def test_cotizacion_cerrada_se_genera_una_vez(self):
+        Cotizacion.objects.filter(pk=self.cotizacion.pk).update(estado='finalizada')
+        self.cotizacion.refresh_from_db()
+
+        with self.renderizar() as renderizar:
+            hash_contenido = pdf_cotizaciones.generar_pdf_almacenado(self.cotizacion.id)
+            self.assertEqual(pdf_cotizaciones.generar_pdf_almacenado(self.cotizacion.id), hash_contenido)
+            with pdf_cotizaciones.obtener_pdf(self.cotizacion) as archivo:
+                self.assertTrue(archivo.read().startswith(b'%PDF'))
+        self.assertEqual(renderizar.call_count, 1)
+        self.assertTrue(self.almacenamiento.exists(pdf_cotizaciones.nombre_archivo(hash_contenido)))
+
+    def test_borrador_se_genera_en_cada_descarga(self):
+        self.assertIsNone(pdf_cotizaciones.generar_pdf_almacenado(self.cotizacion.id))
+        with self.renderizar() as renderizar:
+            pdf_cotizaciones.obtener_pdf(self.cotizacion)
+            pdf_cotizaciones.obtener_pdf(self.cotizacion)
+        self.assertEqual(renderizar.call_count, 2)
+        self.assertEqual(self.almacenamiento.listdir('')[0], [])
+
+    def test_se_genera_en_segundo_plano_al_finalizar(self):
+        # El trabajo corre en este hilo, dentro de la transacción de la prueba: no cerrar la conexión
+        en_linea = unittest.mock.patch.object(pdf_cotizaciones._ejecutor, 'submit', lambda funcion, *args: funcion(*args))
+        with en_linea, unittest.mock.patch.object(pdf_cotizaciones, 'close_old_connections'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.cotizacion.estado = 'finalizada'
+                self.cotizacion.save()
+
+        hash_contenido = pdf_cotizaciones.huella(pdf_cotizaciones.datos_cotizacion(self.cotizacion))
+        self.assertTrue(self.almacenamiento.exists(pdf_cotizaciones.nombre_archivo(hash_contenido)))
+
+    def test_descarga_con_etag(self):
+        self.client.force_login(self.usuario)
+        url = f'/cotizaciones/{self.cotizacion.id}/descargar-pdf/'
+
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(b''.join(respuesta.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+
+        # Otro usuario no puede descargarla
+        self.client.force_login(User.objects.create_user('otro'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(PDF_EXPORTACION_PROCESOS=1)
+class ExportacionPDFTests(TestCase):
+    """ZIP con los PDF de las cotizaciones, generados en procesos aparte"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.almacenamiento = FileSystemStorage(location=directorio.name)
+        for modulo in (pdf_cotizaciones, exportacion_pdf):
+            almacenamiento = unittest.mock.patch.object(modulo, 'almacenamiento_pdf', self.almacenamiento)
+            almacenamiento.start()
+            self.addCleanup(almacenamiento.stop)
+
+        usuario = User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave')
+        producto = crear_producto(CategoriaAcero.objects.create(nombre='Planchas'), 'PL-1')
+        for estado in ('borrador', 'finalizada', 'pagada'):
+            cotizacion = Cotizacion.objects.create(usuario=usuario)
+            DetalleCotizacion.objects.create(cotizacion=cotizacion, producto=producto, precio_unitario=1000)
+            Cotizacion.objects.filter(pk=cotizacion.pk).update(estado=estado)
+        self.cotizaciones = Cotizacion.objects.order_by('id')
+
+    def leer_zip(self, partes):
+        return zipfile.ZipFile(io.BytesIO(b''.join(partes)))
+
+    def test_zip_reutiliza_y_completa_el_cache(self):
+        pagada = self.cotizaciones.get(estado='pagada')
+        almacenado = pdf_cotizaciones.generar_pdf_almacenado(pagada.id)
+
+        archivo_zip = self.leer_zip(exportacion_pdf.generar_zip(self.cotizaciones))
+        self.assertEqual(archivo_zip.namelist(), [f'Cotizacion_{c.numero_cotizacion}.pdf' for c in self.cotizaciones])
+        with self.almacenamiento.open(pdf_cotizaciones.nombre_archivo(almacenado)) as archivo:
+            self.assertEqual(archivo_zip.read(f'Cotizacion_{pagada.numero_cotizacion}.pdf'), archivo.read())
+        for nombre in archivo_zip.namelist():
+            self.assertTrue(archivo_zip.read(nombre).startswith(b'%PDF'))
+
+        # La finalizada quedó en el caché; el borrador no se guarda
+        cerradas = {pdf_cotizaciones.generar_pdf_almacenado(c.id) for c in self.cotizaciones.exclude(estado='borrador')}
+        directorios = self.almacenamiento.listdir('')[0]
+        guardados = {nombre[:-4] for d in directorios for nombre in self.almacenamiento.listdir(d)[1]}
+        self.assertEqual(guardados, cerradas)
+
+    def test_bloques_mantienen_el_orden(self):
+        with unittest.mock.patch.object(exportacion_pdf, 'TAMANO_BLOQUE', 2):
+            partes = list(exportacion_pdf.generar_zip(self.cotizaciones))
+        # Una parte por PDF más el directorio central
+        self.assertEqual(len(partes), 4)
+        self.assertEqual(
+            self.leer_zip(partes).namelist(), [f'Cotizacion_{c.numero_cotizacion}.pdf' for c in self.cotizaciones]
+        )
+
+    def test_vista_filtra_por_estado(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@pozinox.cl', 'clave'))
+        url = '/panel-admin/cotizaciones/exportar-pdf/'
+
+        respuesta = self.client.get(url, {'estado': 'pagada'})
+        self.assertEqual(respuesta['Content-Type'], 'application/zip')
+        pagada = self.cotizaciones.get(estado='pagada')
+        self.assertEqual(self.leer_zip(respuesta.streaming_content).namelist(), [f'Cotizacion_{pagada.numero_cotizacion}.pdf'])
+
+        self.assertRedirects(self.client.get(url, {'estado': 'cancelada'}), '/panel-admin/', fetch_redirect_response=False)
+
+
+@override_settings(
+    MERCADOPAGO_SIMULADO=True, MERCADOPAGO_WEBHOOK_SECRET='', MERCADOPAGO_CONCILIACION_INMEDIATA=False,
+    PDF_COTIZACIONES_EN_SEGUNDO_PLANO=False,
+)
+class NotificacionesPagoTests(TestCase):
+    """Bandeja de notificaciones de MercadoPago y conciliación contra la API simulada"""
+
+    def setUp(self):
+        mercadopago_simulado.reiniciar()
+        self.addCleanup(mercadopago_simulado.reiniciar)
+        self.usuario = User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave')
+        self.cotizacion = Cotizacion.objects.create(
+            usuario=self.usuario, estado='finalizada', subtotal=Decimal('10000'), iva=Decimal('1900'), total=Decimal('11900'),
+        )
+
+    def webhook(self, payment_id, **cabeceras):
+        return self.client.post(
+            '/pagos/mercadopago/webhook/', {'type': 'payment', 'data': {'id': payment_id}},
+            content_type='application/json', **cabeceras,
+        )
+
+    def test_avisos_repetidos_usan_una_fila(self):
+        self.assertTrue(pagos.registrar_notificacion('123'))
+        self.assertFalse(pagos.registrar_notificacion(123, 'retorno'))
+        self.assertEqual(self.webhook('123').status_code, 200)
+        self.assertEqual(self.client.post('/pagos/mercadopago/webhook/', {'type': 'merchant_order', 'data': {'id': '9'}},
+                                          content_type='application/json').status_code, 200)
+
+        notificacion = NotificacionPago.objects.get()
+        self.assertEqual((notificacion.mercadopago_payment_id, notificacion.recibidas, notificacion.tipo), ('123', 3, 'payment'))
+
+        # Un aviso sobre un pago ya procesado lo vuelve a poner en la cola
+        NotificacionPago.objects.update(estado='procesada', intentos=2)
+        pagos.registrar_notificacion('123')
+        notificacion.refresh_from_db()
+        self.assertEqual((notificacion.estado, notificacion.intentos, notificacion.recibidas), ('pendiente', 0, 4))
+
+    @override_settings(MERCADOPAGO_WEBHOOK_SECRET='secreto')
+    def test_firma_del_webhook(self):
+        ts = '1700000000'
+        manifiesto = f'id:abc123;request-id:req-1;ts:{ts};'
+        firma = hmac.new(b'secreto', manifiesto.encode(), hashlib.sha256).hexdigest()
+
+        valida = self.webhook('ABC123', HTTP_X_SIGNATURE=f'ts={ts},v1={firma}', HTTP_X_REQUEST_ID='req-1')
+        self.assertEqual(valida.status_code, 200)
+        self.assertEqual(self.webhook('ABC123', HTTP_X_SIGNATURE=f'ts={ts},v1={"0" * 64}', HTTP_X_REQUEST_ID='req-1').status_code, 401)
+        self.assertEqual(self.webhook('ABC123', HTTP_X_SIGNATURE=f'ts={ts},v1={firma}', HTTP_X_REQUEST_ID='req-2').status_code, 401)
+        self.assertEqual(self.webhook('ABC123').status_code, 401)
+        self.assertEqual(NotificacionPago.objects.get().recibidas, 1)
+
+    def test_conciliacion_marca_la_cotizacion_pagada(self):
+        payment_id = mercadopago_simulado.registrar_pago(self.cotizacion.numero_cotizacion, 10000)
+        pagos.registrar_notificacion(payment_id)
+
+        self.assertEqual(pagos.procesar_notificaciones(), {'procesadas': 1, 'reintentos': 0, 'fallidas': 0})
+        self.cotizacion.refresh_from_db()
+        self.assertEqual((self.cotizacion.estado, self.cotizacion.pago_completado), ('pagada', True))
+        self.assertEqual(self.cotizacion.mercadopago_payment_id, payment_id)
+        notificacion = NotificacionPago.objects.get()
+        self.assertEqual((notificacion.estado, notificacion.estado_pago, notificacion.cotizacion), ('procesada', 'approved', self.cotizacion))
+        self.assertEqual(pagos.procesar_notificaciones(), {'procesadas': 0, 'reintentos': 0, 'fallidas': 0})
+
+    def test_pagos_rechazados_y_reintentos(self):
+        pendiente = mercadopago_simulado.registrar_pago(self.cotizacion.numero_cotizacion, 10000, estado='pending')
+        incompleto = mercadopago_simulado.registrar_pago(self.cotizacion.numero_cotizacion, 5000)
+        for payment_id in (pendiente, incompleto, '404'):
+            pagos.registrar_notificacion(payment_id)
+
+        with self.assertLogs('apps.tienda.pagos', 'WARNING'):
+            self.assertEqual(pagos.procesar_notificaciones(), {'procesadas': 1, 'reintentos': 1, 'fallidas': 1})
+        self.cotizacion.refresh_from_db()
+        self.assertEqual(self.cotizacion.estado, 'finalizada')
+
+        estados = dict(NotificacionPago.objects.values_list('mercadopago_payment_id', 'estado'))
+        self.assertEqual(estados, {pendiente: 'procesada', incompleto: 'fallida', '404': 'pendiente'})
+        # El pago aún no visible (404) espera antes del siguiente intento
+        self.assertGreater(NotificacionPago.objects.get(mercadopago_payment_id='404').proximo_intento, timezone.now())
+
+    @override_settings(MERCADOPAGO_CONCILIACION_INMEDIATA=True)
+    def test_retorno_concilia_despues_del_commit(self):
+        payment_id = mercadopago_simulado.registrar_pago(self.cotizacion.numero_cotizacion, 10000)
+        self.client.force_login(self.usuario)
+
+        # La consulta corre en este hilo, dentro de la transacción de la prueba: no cerrar la conexión
+        en_linea = unittest.mock.patch.object(pagos._ejecutor, 'submit', lambda funcion, *args: funcion(*args))
+        with en_linea, unittest.mock.patch.object(pagos, 'close_old_connections'):
+            with self.captureOnCommitCallbacks(execute=True):
+                respuesta = self.client.get(f'/cotizaciones/{self.cotizacion.id}/pago-exitoso/', {'payment_id': payment_id})
+                self.assertEqual(respuesta.status_code, 200)
+                self.cotizacion.refresh_from_db()
+                self.assertFalse(self.cotizacion.pago_completado)
+
+        self.cotizacion.refresh_from_db()
+        self.assertEqual(self.cotizacion.estado, 'pagada')
+        self.assertEqual(NotificacionPago.objects.get().estado, 'procesada')
+
+
+@override_settings(MERCADOPAGO_SIMULADO=True, PDF_COTIZACIONES_EN_SEGUNDO_PLANO=False)
+class PreferenciasPagoTests(TestCase):
+    """SDK compartido de MercadoPago y reutilización de preferencias, contra la API simulada"""
+
+    def setUp(self):
+        mercadopago_simulado.reiniciar()
+        self.addCleanup(mercadopago_simulado.reiniciar)
+        sdks = unittest.mock.patch.dict(pagos._sdks, clear=True)
+        sdks.start()
+        self.addCleanup(sdks.stop)
+
+        self.usuario = User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave')
+        self.client.force_login(self.usuario)
+        self.cotizacion = Cotizacion.objects.create(usuario=self.usuario)
+        producto = crear_producto(CategoriaAcero.objects.create(nombre='Planchas'), 'PL-1')
+        self.detalle = DetalleCotizacion.objects.create(cotizacion=self.cotizacion, producto=producto, precio_unitario=1000)
+        Cotizacion.objects.filter(pk=self.cotizacion.pk).update(estado='finalizada')
+        self.url = f'/cotizaciones/{self.cotizacion.id}/pagar-mercadopago/'
+
+    def test_sdk_compartido_entre_hilos(self):
+        sdks = []
+        hilos = [threading.Thread(target=lambda: sdks.append(pagos.obtener_sdk())) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len({id(sdk) for sdk in sdks}), 1)
+        self.assertIs(pagos.obtener_sdk(), sdks[0])
+
+        with self.settings(MERCADOPAGO_SIMULADO=False, MERCADOPAGO_ACCESS_TOKEN=None):
+            with self.assertRaises(ImproperlyConfigured):
+                pagos.obtener_sdk()
+
+    @override_settings(MERCADOPAGO_SIMULADO=False, MERCADOPAGO_ACCESS_TOKEN='TEST-token')
+    def test_sdk_real_usa_una_sesion_persistente(self):
+        respuesta = unittest.mock.Mock(status_code=200, content=b'{}', json=lambda: {'id': 1})
+        with unittest.mock.patch.object(requests.Session, 'request', autospec=True, return_value=respuesta) as peticion:
+            pagos.obtener_sdk().payment().get('1')
+            pagos.obtener_sdk().payment().get('2')
+        sesiones = {id(llamada.args[0]) for llamada in peticion.call_args_list}
+        self.assertEqual((peticion.call_count, len(sesiones)), (2, 1))
+
+    def test_preferencia_se_reutiliza_si_no_cambia(self):
+        primera = self.client.get(self.url)
+        self.assertEqual(primera.status_code, 302)
+        self.assertTrue(primera['Location'].startswith('https://sandbox.mercadopago.simulado/checkout?pref_id=SIM-'))
+        self.assertEqual(self.client.get(self.url)['Location'], primera['Location'])
+        self.assertEqual(mercadopago_simulado.llamadas()['POST'], 1)
+
+        self.cotizacion.refresh_from_db()
+        self.assertEqual(self.cotizacion.mercadopago_init_point, primera['Location'])
+        self.assertEqual(self.cotizacion.metodo_pago, 'mercadopago')
+
+        # Cambia un ítem: se crea una preferencia nueva
+        self.detalle.cantidad = 2
+        self.detalle.save()
+        segunda = self.client.get(self.url)
+        self.assertNotEqual(segunda['Location'], primera['Location'])
+        self.assertEqual(mercadopago_simulado.llamadas()['POST'], 2)
+
+    def test_borrador_no_crea_preferencia(self):
+        Cotizacion.objects.filter(pk=self.cotizacion.pk).update(estado='borrador')
+        self.assertRedirects(self.client.get(self.url), f'/cotizaciones/{self.cotizacion.id}/', fetch_redirect_response=False)
+        self.assertEqual(mercadopago_simulado.llamadas()['POST'], 0)
+
+
+@override_settings(MERCADOPAGO_SIMULADO=True, PDF_COTIZACIONES_EN_SEGUNDO_PLANO=False)
+class PreferenciaConcurrenciaTests(TransactionTestCase):
+    """Clics simultáneos en pagar la misma cotización crean una sola preferencia"""
+    HILOS = 8
+
+    def test_una_preferencia_por_contenido(self):
+        mercadopago_simulado.reiniciar()
+        self.addCleanup(mercadopago_simulado.reiniciar)
+        # La API tarda en responder, para que los hilos se encuentren esperando el bloqueo
+        sdk = mercadopago.SDK('TEST-SIMULADO', http_client=mercadopago_simulado.ClienteHttpSimulado(latencia=0.05))
+        with unittest.mock.patch.object(pagos, 'obtener_sdk', return_value=sdk):
+            self.ejecutar_clics()
+
+    def ejecutar_clics(self):
+        usuario = User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave')
+        cotizacion = Cotizacion.objects.create(usuario=usuario, estado='finalizada')
+        request = RequestFactory().get('/')
+        request.user = usuario
+        datos = pagos.datos_preferencia(cotizacion, request)
+        barrera = threading.Barrier(self.HILOS)
+        init_points, errores = [], []
+
+        def pagar():
+            try:
+                barrera.wait()
+                init_points.append(pagos.obtener_init_point(Cotizacion.objects.get(pk=cotizacion.pk), datos))
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=pagar) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(len(set(init_points)), 1)
+        self.assertEqual(mercadopago_simulado.llamadas()['POST'], 1)
+
+
+class SecuenciaDocumentoTests(TestCase):
+    """Numeración correlativa de documentos"""
+
+    def test_correlativo_por_prefijo_y_dia(self):
+        hoy = datetime.date(2025, 3, 1)
+        manana = datetime.date(2025, 3, 2)
+        self.assertEqual(SecuenciaDocumento.siguiente('COT', hoy), 1)
+        self.assertEqual(SecuenciaDocumento.siguiente('COT', hoy), 2)
+        self.assertEqual(SecuenciaDocumento.siguiente('ORD', hoy), 1)
+        self.assertEqual(SecuenciaDocumento.siguiente('COT', manana), 1)
+
+    def test_valor_inicial_solo_al_crear_el_contador(self):
+        hoy = datetime.date(2025, 3, 1)
+        self.assertEqual(SecuenciaDocumento.siguiente('POZ', hoy, inicial=lambda: 7), 8)
+        self.assertEqual(SecuenciaDocumento.siguiente('POZ', hoy, inicial=lambda: 100), 9)
+
+    def test_numero_de_cotizacion(self):
+        usuario = User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave')
+        primera = Cotizacion.objects.create(usuario=usuario)
+        segunda = Cotizacion.objects.create(usuario=usuario)
+        self.assertTrue(primera.numero_cotizacion.startswith('COT'))
+        self.assertEqual(primera.numero_cotizacion[-4:], '0001')
+        self.assertEqual(segunda.numero_cotizacion[-4:], '0002')
+
+
+class EdicionProductoTests(TestCase):
+    """El formulario de productos registra el stock en el libro de inventario"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@pozinox.cl', 'clave')
+        self.client.force_login(self.admin)
+        self.categoria = CategoriaAcero.objects.create(nombre='Planchas')
+
+    def datos(self, **campos):
+        return {
+            'nombre': 'Plancha', 'descripcion': 'Plancha de acero', 'codigo_producto': 'PL-1',
+            'categoria': self.categoria.id, 'tipo_acero': 'carbono',
+            'precio_por_unidad': '1000', 'stock_actual': '10', 'stock_minimo': '5', 'unidad_medida': 'unidad',
+            'activo': 'on', **campos,
+        }
+
+    def test_crear_registra_el_inventario_inicial(self):
+        respuesta = self.client.post('/panel-admin/productos/crear/', self.datos())
+        self.assertRedirects(respuesta, '/panel-admin/productos/', fetch_redirect_response=False)
+        movimiento = MovimientoInventario.objects.get()
+        self.assertEqual((movimiento.motivo_entrada, movimiento.cantidad_nueva, movimiento.producto.stock_actual),
+                         ('inventario_inicial', 10, 10))
+
+    def test_crear_es_todo_o_nada(self):
+        with unittest.mock.patch('apps.inventario.stock.entrada', side_effect=RuntimeError('caído')):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/panel-admin/productos/crear/', self.datos())
+        self.assertFalse(Producto.objects.exists())
+
+    def test_editar_aplica_solo_la_diferencia(self):
+        producto = crear_producto(self.categoria, 'PL-1', stock_actual=10)
+        url = f'/panel-admin/productos/editar/{producto.id}/'
+        self.assertContains(self.client.get(url), 'name="stock_mostrado" value="10"')
+
+        # Mientras el formulario está abierto se venden 3 unidades
+        stock.salida(producto, 3, self.admin)
+        self.client.post(url, self.datos(stock_actual='15', stock_mostrado='10', nombre='Plancha 2'))
+        producto.refresh_from_db()
+        self.assertEqual((producto.nombre, producto.stock_actual), ('Plancha 2', 12))
+        ultimo = MovimientoInventario.objects.latest('id')
+        self.assertEqual((ultimo.tipo_movimiento, ultimo.motivo_entrada, ultimo.cantidad), ('entrada', 'ajuste_inventario', 5))
+
+        # Sin cambio de stock no se registra movimiento
+        self.client.post(url, self.datos(stock_actual='15', stock_mostrado='15'))
+        self.assertEqual(MovimientoInventario.objects.count(), 2)
+
+    def test_alertas_al_crear_y_al_cambiar_el_minimo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/panel-admin/productos/crear/', self.datos(stock_actual='0'))
+        producto = Producto.objects.get()
+        self.assertEqual(list(AlertaInventario.objects.filter(leida=False).values_list('tipo_alerta', flat=True)), ['sin_stock'])
+
+        stock.entrada(producto, 10, self.admin)
+        url = f'/panel-admin/productos/editar/{producto.id}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, self.datos(stock_actual='10', stock_mostrado='10', stock_minimo='15'))
+        self.assertEqual(list(AlertaInventario.objects.filter(leida=False).values_list('tipo_alerta', flat=True)), ['stock_bajo'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, self.datos(stock_actual='10', stock_mostrado='10', stock_minimo='15', activo=''))
+        self.assertFalse(AlertaInventario.objects.filter(leida=False).exists())
+
+    def test_editar_no_deja_stock_negativo(self):
+        producto = crear_producto(self.categoria, 'PL-1', stock_actual=10)
+        stock.salida(producto, 8, self.admin)
+
+        respuesta = self.client.post(
+            f'/panel-admin/productos/editar/{producto.id}/', self.datos(stock_actual='5', stock_mostrado='10', nombre='Otro')
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('Stock insuficiente', str(respuesta.context['form'].errors['stock_actual']))
+        producto.refresh_from_db()
+        self.assertEqual((producto.nombre, producto.stock_actual), ('PL-1', 2))
+
+
+class ImportacionProductosTests(TestCase):
+    """Importación masiva de productos desde planillas"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('bodega', 'bodega@pozinox.cl', 'clave')
+        CategoriaAcero.objects.create(nombre='Planchas')
+        CategoriaAcero.objects.create(nombre='Tubos')
+
+    def importar(self, texto, **opciones):
+        return importar_productos(io.BytesIO(texto.encode()), 'lista.csv', self.usuario, **opciones)
+
+    def test_crea_y_reporta_errores(self):
+        resultado = self.importar(
+            'Código;Nombre;Descripción;Categoría;Tipo de Acero;Precio;Stock;Color\n'
+            'PL-1;Plancha 1;Plancha lisa;planchas;Acero Inoxidable;1200,5;10;gris\n'
+            'PL-2;Plancha 2;Plancha estriada;Tubos;carbono;900;0;\n'
+            'PL-1;Repetida;Plancha;Tubos;carbono;900;0;\n'
+            'PL-3;Mala;Plancha;Perfiles;carbono;-5;x;\n'
+        )
+
+        self.assertEqual((resultado['creados'], resultado['actualizados']), (2, 0))
+        self.assertEqual(resultado['columnas_ignoradas'], ['Color'])
+        self.assertEqual([error['fila'] for error in resultado['errores']], [4, 5])
+        self.assertIn('precio_por_unidad: El precio debe ser mayor a 0.', resultado['errores'][1]['error'])
+
+        producto = Producto.objects.get(codigo_producto='PL-1')
+        self.assertEqual((producto.categoria.nombre, producto.tipo_acero), ('Planchas', 'inoxidable'))
+        self.assertEqual((producto.precio_por_unidad, producto.stock_actual), (Decimal('1200.50'), 10))
+        movimiento = MovimientoInventario.objects.get(producto=producto)
+        self.assertEqual((movimiento.motivo_entrada, movimiento.cantidad_nueva), ('inventario_inicial', 10))
+
+    def test_lista_de_precios_actualiza_solo_sus_columnas(self):
+        self.importar(
+            'codigo_producto,nombre,descripcion,categoria,tipo_acero,precio_por_unidad,stock_actual,stock_minimo\n'
+            + ''.join(f'PL-{i},Plancha {i},Plancha,Planchas,carbono,1000,10,3\n' for i in range(30))
+        )
+        lista = 'codigo,precio,stock\n' + ''.join(f'PL-{i},{1500 + i},{10 if i % 2 else 4}\n' for i in range(30))
+
+        # Categorías y una consulta por lote de productos existentes
+        with self.assertNumQueries(4):
+            resultado = self.importar(lista, simular=True, tamano_lote=10)
+        self.assertEqual((resultado['creados'], resultado['actualizados'], resultado['errores']), (0, 30, []))
+        self.assertFalse(Producto.objects.exclude(precio_por_unidad=1000).exists())
+
+        resultado = self.importar(lista)
+        self.assertEqual(resultado['movimientos'], 15)
+        producto = Producto.objects.get(codigo_producto='PL-2')
+        self.assertEqual((producto.nombre, producto.stock_minimo), ('Plancha 2', 3))
+        self.assertEqual((producto.precio_por_unidad, producto.stock_actual), (Decimal('1502'), 4))
+        self.assertEqual(MovimientoInventario.objects.filter(tipo_movimiento='ajuste').count(), 15)
+
+    def test_separadores_de_miles_y_decimales(self):
+        resultado = self.importar(
+            'codigo;nombre;descripcion;categoria;tipo;precio;stock\n'
+            'PL-1;Plancha 1;Plancha;Planchas;carbono;10.000;1.200\n'
+            'PL-2;Plancha 2;Plancha;Planchas;carbono;1.234,56;0\n'
+            'PL-3;Plancha 3;Plancha;Planchas;carbono;1,5;0\n'
+            'PL-4;Plancha 4;Plancha;Planchas;carbono;2.5;1,5\n'
+        )
+        self.assertEqual([error['fila'] for error in resultado['errores']], [5])
+        self.assertIn('stock_actual', resultado['errores'][0]['error'])
+        self.assertEqual(
+            dict(Producto.objects.values_list('codigo_producto', 'precio_por_unidad')),
+            {'PL-1': Decimal('10000'), 'PL-2': Decimal('1234.56'), 'PL-3': Decimal('1.5')},
+        )
+        self.assertEqual(Producto.objects.get(codigo_producto='PL-1').stock_actual, 1200)
+
+
+class SupabaseStorageTests(SimpleTestCase):
+    """Índice de metadatos de SupabaseStorage sobre el bucket simulado"""
+
+    def setUp(self):
+        supabase_simulado.reiniciar()
+        self.addCleanup(supabase_simulado.reiniciar)
+        self.storage = SupabaseStorage(client=ClienteSupabaseSimulado())
+
+    def test_una_consulta_por_carpeta(self):
+        bucket = ClienteSupabaseSimulado().storage.from_('pozinox-media')
+        for i in range(150):
+            bucket.upload(f'productos/{i}.jpg', b'x' * i)
+
+        self.assertTrue(self.storage.exists('productos/149.jpg'))
+        self.assertFalse(self.storage.exists('productos/no-existe.jpg'))
+        self.assertEqual(self.storage.size('productos/42.jpg'), 42)
+        self.assertTrue(self.storage.url('productos/1.jpg').endswith('/pozinox-media/productos/1.jpg'))
+        self.assertEqual(supabase_simulado.llamadas(), {'upload': 150, 'list': 1})
+
+    def test_guardar_y_eliminar_actualizan_el_indice(self):
+        self.assertFalse(self.storage.exists('productos/a.png'))
+        nombre = self.storage.save('productos/a.png', ContentFile(b'12345'))
+        self.assertEqual(self.storage.size(nombre), 5)
+        otro = self.storage.save('productos/a.png', ContentFile(b'123'))
+        self.assertNotEqual(otro, nombre)
+
+        self.storage.delete(nombre)
+        self.assertFalse(self.storage.exists(nombre))
+        self.assertTrue(self.storage.exists(otro))
+        self.assertEqual(supabase_simulado.llamadas(), {'list': 1, 'upload': 2, 'remove': 1})
+        self.assertEqual(self.storage.listdir('productos'), ([], [otro.split('/')[-1]]))
+
+
+class VariantesImagenTests(TestCase):
+    """Variantes reducidas de las imágenes de productos"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.storage = FileSystemStorage(location=directorio.name, base_url='/media/')
+
+    def test_variantes_sin_agrandar_y_sin_duplicar(self):
+        original = io.BytesIO()
+        Image.new('RGBA', (500, 250), (200, 0, 0, 128)).save(original, 'PNG')
+
+        variantes = generar_variantes(io.BytesIO(original.getvalue()), 'productos/plancha.png', self.storage)
+        self.assertEqual(sorted(variantes['webp'], key=int), ['160', '320'])
+        with Image.open(self.storage.path(variantes['jpeg']['320'])) as jpeg:
+            self.assertEqual((jpeg.format, jpeg.mode, jpeg.size), ('JPEG', 'RGB', (320, 160)))
+        with Image.open(self.storage.path(variantes['webp']['160'])) as webp:
+            self.assertEqual((webp.format, webp.mode), ('WEBP', 'RGBA'))
+
+        # Mismo contenido, mismos nombres: no se suben copias
+        self.assertEqual(generar_variantes(io.BytesIO(original.getvalue()), 'productos/plancha.png', self.storage), variantes)
+        self.assertEqual(len(self.storage.listdir('productos')[1]), 4)
+
+    def test_tag_usa_solo_variantes_de_la_imagen_actual(self):
+        producto = Producto(nombre='Plancha', imagen='productos/plancha.png', variantes_imagen={
+            'origen': 'productos/plancha.png',
+            'webp': {'320': 'productos/p-320w.webp', '160': 'productos/p-160w.webp'},
+            'jpeg': {'160': 'productos/p-160w.jpg', '320': 'productos/p-320w.jpg'},
+        })
+        producto.imagen.storage = self.storage
+        plantilla = Template('{% load imagenes_producto %}{% imagen_producto producto "product-image" "80px" %}')
+
+        html = plantilla.render(Context({'producto': producto}))
+        self.assertIn('srcset="/media/productos/p-160w.webp 160w, /media/productos/p-320w.webp 320w"', html)
+        self.assertIn('<img src="/media/productos/p-320w.jpg"', html)
+
+        producto.imagen.name = 'productos/nueva.png'
+        html = plantilla.render(Context({'producto': producto}))
+        self.assertNotIn('<picture>', html)
+        self.assertIn('<img src="/media/productos/nueva.png"', html)
+
+
+class AlmacenamientoDeduplicadoTests(TestCase):
+    """Archivos deduplicados por contenido sobre el bucket simulado de Supabase"""
+
+    def setUp(self):
+        supabase_simulado.reiniciar()
+        self.addCleanup(supabase_simulado.reiniciar)
+        self.storage = AlmacenamientoDeduplicado(SupabaseStorage(client=ClienteSupabaseSimulado()))
+
+    def test_contenido_repetido_se_sube_una_vez(self):
+        nombres = {self.storage.save(f'productos/foto-{i}.JPG', ContentFile(b'plancha')) for i in range(3)}
+        otro = self.storage.save('productos/otra.jpg', ContentFile(b'tubo'))
+
+        self.assertEqual(len(nombres), 1)
+        nombre = nombres.pop()
+        self.assertRegex(nombre, r'^productos/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(ArchivoContenido.objects.get(nombre=nombre).referencias, 3)
+        self.assertEqual(self.storage.size(nombre), 7)
+        self.assertEqual(supabase_simulado.llamadas()['upload'], 2)
+
+        # El objeto se elimina solo con la última referencia
+        self.storage.delete(nombre)
+        self.storage.delete(nombre)
+        self.assertNotIn('remove', supabase_simulado.llamadas())
+        self.assertEqual(self.storage.open(nombre).read(), b'plancha')
+        self.storage.delete(nombre)
+        self.assertFalse(self.storage.exists(nombre))
+        self.assertTrue(self.storage.exists(otro))
+        self.assertEqual(supabase_simulado.llamadas()['remove'], 1)
+
+    def test_archivos_anteriores_pasan_al_backend(self):
+        antigua = self.storage.backend.save('productos/antigua.jpg', ContentFile(b'plancha'))
+        self.assertTrue(self.storage.exists(antigua))
+        self.storage.delete(antigua)
+        self.assertFalse(self.storage.backend.exists(antigua))
+
+
+class AlmacenamientoDeduplicadoConcurrenciaTests(TransactionTestCase):
+    """Subir un contenido mientras otro proceso borra su última referencia"""
+
+    def test_save_espera_al_borrado_y_vuelve_a_subir(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        storage = AlmacenamientoDeduplicado(FileSystemStorage(location=directorio.name))
+        nombre = storage.save('productos/foto.jpg', ContentFile(b'plancha'))
+
+        borrando, continuar = threading.Event(), threading.Event()
+        eliminar = storage.backend.delete
+
+        def eliminar_lento(name):
+            borrando.set()
+            continuar.wait(5)
+            eliminar(name)
+
+        def en_hilo(funcion):
+            def ejecutar():
+                try:
+                    funcion()
+                finally:
+                    connection.close()
+            hilo = threading.Thread(target=ejecutar)
+            hilo.start()
+            return hilo
+
+        with unittest.mock.patch.object(storage.backend, 'delete', side_effect=eliminar_lento):
+            borrado = en_hilo(lambda: storage.delete(nombre))
+            self.assertTrue(borrando.wait(5))
+            subida = en_hilo(lambda: storage.save('productos/otra.jpg', ContentFile(b'plancha')))
+            # La subida espera a que termine el borrado, que tiene la fila bloqueada
+            subida.join(0.3)
+            self.assertTrue(subida.is_alive())
+            continuar.set()
+            borrado.join()
+            subida.join()
+
+        self.assertEqual(ArchivoContenido.objects.get(nombre=nombre).referencias, 1)
+        self.assertTrue(storage.backend.exists(nombre))
+        self.assertEqual(storage.open(nombre).read(), b'plancha')
+
+
+class CargaImagenesTests(TransactionTestCase):
+    """Carga masiva de imágenes por código de producto (las subidas corren en otros hilos)"""
+
+    def setUp(self):
+        categoria = CategoriaAcero.objects.create(nombre='Planchas')
+        for codigo in ('PL-1', 'PL-2'):
+            Producto.objects.create(
+                codigo_producto=codigo, nombre=codigo, descripcion='Plancha', categoria=categoria,
+                tipo_acero='carbono', precio_por_unidad=1000,
+            )
+        origen = tempfile.TemporaryDirectory()
+        destino = tempfile.TemporaryDirectory()
+        self.addCleanup(origen.cleanup)
+        self.addCleanup(destino.cleanup)
+        self.origen = origen.name
+        self.storage = FileSystemStorage(location=destino.name, base_url='/media/')
+
+    def guardar_imagen(self, nombre, color, tamano=(40, 30), **opciones):
+        Image.new('RGB', tamano, color).save(os.path.join(self.origen, nombre), **opciones)
+
+    def test_salta_archivos_sin_cambios(self):
+        self.guardar_imagen('pl-1.jpg', 'red')
+        self.guardar_imagen('PL-2.png', 'blue')
+        self.guardar_imagen('XX-9.png', 'blue')
+        with open(os.path.join(self.origen, 'PL-3.jpg'), 'wb') as archivo:
+            archivo.write(b'no es una imagen')
+
+        resultado = cargar_imagenes(self.origen, storage=self.storage, generar_variantes=False)
+        self.assertEqual((resultado['subidos'], resultado['sin_cambios']), (2, 0))
+        self.assertEqual(resultado['sin_producto'], ['PL-3.jpg', 'XX-9.png'])
+        producto = Producto.objects.get(codigo_producto='PL-1')
+        self.assertEqual(producto.imagen.name, 'productos/pl-1.jpg')
+        self.assertTrue(self.storage.exists(producto.imagen.name))
+
+        # Una nueva ejecución solo sube lo que cambió
+        self.guardar_imagen('PL-2.png', 'green')
+        resultado = cargar_imagenes(self.origen, storage=self.storage, generar_variantes=False)
+        self.assertEqual((resultado['subidos'], resultado['sin_cambios'], resultado['errores']), (1, 1, []))
+        # La imagen reemplazada se elimina
+        self.assertEqual(len(self.storage.listdir('productos')[1]), 2)
+
+    @unittest.skipIf(mock_aws is None, 'La prueba con S3 local requiere moto')
+    def test_s3_sube_en_partes_los_archivos_grandes(self):
+        # PNG sin compresión de unos 6 MB
+        self.guardar_imagen('PL-1.png', 'red', tamano=(1400, 1400), compress_level=0)
+        self.guardar_imagen('PL-2.jpg', 'blue')
+        variables = {'AWS_ACCESS_KEY_ID': 'local', 'AWS_SECRET_ACCESS_KEY': 'local', 'AWS_DEFAULT_REGION': 'us-east-1'}
+        with unittest.mock.patch.dict(os.environ, variables), mock_aws():
+            boto3.client('s3').create_bucket(Bucket='productos')
+            storage = S3Boto3Storage(bucket_name='productos', querystring_auth=False)
+
+            resultado = cargar_imagenes(self.origen, storage=storage, umbral_multipart=5 * 1024 * 1024)
+            self.assertEqual((resultado['subidos'], resultado['errores']), (2, []))
+            producto = Producto.objects.get(codigo_producto='PL-1')
+            etag = boto3.client('s3').head_object(Bucket='productos', Key=producto.imagen.name)['ETag']
+            self.assertTrue(etag.endswith('-2"'))
+            self.assertEqual(sorted(producto.variantes_imagen['webp'], key=int), ['160', '320', '640'])
+
+
+class ArranqueTests(SimpleTestCase):
+    """Costo de cargar la aplicación WSGI"""
+
+    def test_cargar_la_aplicacion_no_importa_dependencias_pesadas(self):
+        # En un proceso nuevo: en este ya se importaron al correr otras pruebas
+        codigo = (
+            'import json, sys\n'
+            'from Pozinox.wsgi import application\n'
+            'print(json.dumps([m for m in ("boto3", "supabase", "mercadopago", "reportlab") if m in sys.modules]))'
+        )
+        entorno = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'Pozinox.settings'}
+        proceso = subprocess.run(
+            [sys.executable, '-c', codigo], cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True,
+        )
+        self.assertEqual(proceso.returncode, 0, proceso.stderr)
+        self.assertEqual(json.loads(proceso.stdout), [])
+
+    def test_medicion_sin_respuesta(self):
+        # El proceso hijo cargó la aplicación pero nunca llamó a start_response
+        proceso = unittest.mock.Mock(stdout='{"carga": 0.1, "primera": 0.2}\n', stderr='')
+        salida = io.StringIO()
+        with unittest.mock.patch.object(medir_arranque.Command, '_ejecutar', return_value=(proceso, 0.3)):
+            call_command('medir_arranque', repeticiones=2, stdout=salida)
+        self.assertIn('2 de 2 procesos terminaron sin responder', salida.getvalue())
+        self.assertIn('estado HTTP sin respuesta', salida.getvalue())
+
+
+class SecuenciaDocumentoConcurrenciaTests(TransactionTestCase):
+    """
+    Prueba de carga: muchos hilos creando cotizaciones a la vez.
+
+    En PostgreSQL los serializa el bloqueo de la fila del contador; en SQLite
+    la transacción IMMEDIATE (ver DATABASES en settings) sobre la base de
+    pruebas en archivo.
+    """
+    HILOS = 20
+    COTIZACIONES_POR_HILO = 10
+
+    def test_sin_numeros_repetidos(self):
+        usuario = User.objects.create_user('cliente', 'cliente@pozinox.cl', 'clave')
+        barrera = threading.Barrier(self.HILOS)
+        errores = []
+
+        def crear():
+            try:
+                barrera.wait()
+                for _ in range(self.COTIZACIONES_POR_HILO):
+                    Cotizacion.objects.create(usuario=usuario)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=crear) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        numeros = list(Cotizacion.objects.values_list('numero_cotizacion', flat=True))
+        total = self.HILOS * self.COTIZACIONES_POR_HILO
+        self.assertEqual(len(numeros), total)
+        self.assertEqual(len(set(numeros)), total)
+        self.assertEqual(sorted(int(n[-4:]) for n in numeros), list(range(1, total + 1)))
@@ -1,24 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q, F
-from django.http import JsonResponse, HttpResponse
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from .models import Producto, CategoriaAcero, Cotizacion, DetalleCotizacion
-from .forms import ProductoForm, CategoriaForm
-import mercadopago
-import os
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-from io import BytesIO
-import random
-from django.core.mail import send_mail
+from .forms import ProductoForm, CategoriaForm, ImportacionProductosForm
+from .busqueda import buscar_productos
+from .autocompletado import indice_autocompletado
+from .facetas import filtrar_productos, obtener_conteos, construir_facetas
+from .cache import cachear_para_anonimos, categorias_activas, respuesta_condicional
+from .captcha import generar_desafio, verificar_desafio
+from .lineas_cotizacion import agregar_lineas, bloquear_si_editable, parsear_csv
+from .importacion import ErrorImportacion, importar_productos
+from .imagenes import eliminar_archivos
+from .pdf_cotizaciones import datos_cotizacion, huella, obtener_pdf
+from .exportacion_pdf import generar_zip
+from .pagos import datos_preferencia, obtener_init_point, registrar_notificacion, verificar_firma
+from apps.paginacion import paginar_por_cursor
+from apps.inventario import stock
+from apps.inventario.alertas import evaluar_alertas, productos_con_alerta_abierta
+import json
+from apps.usuarios.correo import encolar_correo
 from django.conf import settings
 
 
@@ -26,26 +34,20 @@ def home(request):
     """Vista principal de la página de inicio.
 
     Además maneja el formulario de contacto (GET para mostrar suma captcha, POST para validar
-    y enviar el correo al administrador).
+    y enviar el correo al administrador). El captcha viaja firmado en el formulario, por lo
+    que la página no escribe en la sesión.
     """
-    # Obtener productos destacados y categorías
+    # Obtener productos destacados y categorías (el template cachea el bloque de destacados,
+    # por lo que el queryset solo se evalúa cuando el fragmento no está en caché)
     productos_destacados = Producto.objects.filter(activo=True)[:6]
-    categorias = CategoriaAcero.objects.filter(activa=True)[:4]
+    categorias = categorias_activas()[:4]
 
     error_suma = None
     success = None
 
     if request.method == 'POST':
-        # Recuperar suma desde sesión
-        suma_a = request.session.get('suma_a', 0)
-        suma_b = request.session.get('suma_b', 0)
-
-        try:
-            suma_usuario = int(request.POST.get('suma', 0))
-        except (ValueError, TypeError):
-            suma_usuario = None
-
-        if suma_usuario is None or suma_usuario != (suma_a + suma_b):
+        # Validar el desafío firmado que se envió junto al formulario
+        if not verificar_desafio(request.POST.get('captcha'), request.POST.get('suma')):
             error_suma = 'La suma es incorrecta. Intenta nuevamente.'
         else:
             # Campos del formulario
@@ -81,75 +83,79 @@ def home(request):
             cuerpo_texto = '\n'.join(cuerpo)
 
             try:
-                send_mail(
-                    subject='[Contacto] Nuevo mensaje desde Pozinox',
-                    message=cuerpo_texto,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=['benj.veliz@duocuc.cl'],
-                    fail_silently=False,
+                # Se envía tras el commit; si falla, el comando procesar_correos lo reintenta
+                encolar_correo(
+                    asunto='[Contacto] Nuevo mensaje desde Pozinox',
+                    mensaje=cuerpo_texto,
+                    destinatarios=['benj.veliz@duocuc.cl'],
                 )
                 success = '¡Mensaje enviado correctamente! Nos contactaremos pronto.'
             except Exception:
                 error_suma = 'Ocurrió un error al enviar el mensaje. Intenta más tarde.'
 
-        # Generar nueva suma para el siguiente intento (GET de vuelta al template)
-        suma_a = random.randint(1, 9)
-        suma_b = random.randint(1, 9)
-        request.session['suma_a'] = suma_a
-        request.session['suma_b'] = suma_b
-
-    else:
-        # GET: generar suma captcha
-        suma_a = random.randint(1, 9)
-        suma_b = random.randint(1, 9)
-        request.session['suma_a'] = suma_a
-        request.session['suma_b'] = suma_b
+    # Nuevo desafío para mostrar (o para el siguiente intento)
+    suma_a, suma_b, captcha = generar_desafio()
 
     context = {
         'productos_destacados': productos_destacados,
         'categorias': categorias,
         'titulo': 'Pozinox - Tienda de Aceros',
-        'suma_a': request.session.get('suma_a', 0),
-        'suma_b': request.session.get('suma_b', 0),
+        'suma_a': suma_a,
+        'suma_b': suma_b,
+        'captcha': captcha,
         'error_suma': error_suma,
         'success': success,
     }
     return render(request, 'tienda/home.html', context)
 
 
-def productos_publicos(request):
-    """Vista pública de productos para todos los usuarios"""
-    productos = Producto.objects.filter(activo=True)
-    categorias = CategoriaAcero.objects.filter(activa=True)
+def _productos_catalogo(request):
+    """Productos del catálogo público con los filtros y la búsqueda de la petición"""
+    productos = Producto.objects.filter(activo=True).select_related('categoria')
     
-    # Filtros
-    categoria_id = request.GET.get('categoria')
+    # Filtros por facetas (tipo de acero, categoría, grosor y precio)
+    productos, seleccion = filtrar_productos(productos, request.GET)
     busqueda = request.GET.get('q')
     
-    if categoria_id:
-        productos = productos.filter(categoria_id=categoria_id)
+    if busqueda:
+        # Búsqueda de texto completo ordenada por relevancia
+        productos = buscar_productos(productos, busqueda)
+    
+    return productos, seleccion, busqueda
+
+
+@respuesta_condicional
+@cachear_para_anonimos('productos')
+def productos_publicos(request):
+    """Vista pública de productos para todos los usuarios"""
+    productos, seleccion, busqueda = _productos_catalogo(request)
+    categorias = categorias_activas()
     
     if busqueda:
-        productos = productos.filter(
-            Q(nombre__icontains=busqueda) |
-            Q(descripcion__icontains=busqueda) |
-            Q(codigo_producto__icontains=busqueda)
+        productos_paginados = paginar_por_cursor(
+            request, productos, ['-relevancia', 'nombre', 'id'], 12, total='estimado'
+        )
+    else:
+        # Paginación por cursor sobre el orden del catálogo (categoría, nombre)
+        productos_paginados = paginar_por_cursor(
+            request, productos, ['categoria_id', 'nombre', 'id'], 12
         )
     
-    # Paginación
-    paginator = Paginator(productos, 12)
-    page_number = request.GET.get('page')
-    productos_paginados = paginator.get_page(page_number)
+    # Conteos precalculados de todas las facetas (una sola consulta)
+    facetas = construir_facetas(obtener_conteos(), seleccion, categorias)
     
     context = {
         'productos': productos_paginados,
         'categorias': categorias,
-        'categoria_actual': categoria_id,
+        'facetas': facetas,
+        'categoria_actual': seleccion['categoria'],
         'busqueda': busqueda,
     }
     return render(request, 'tienda/productos.html', context)
 
 
+@respuesta_condicional
+@cachear_para_anonimos('detalle_producto')
 def detalle_producto(request, producto_id):
     """Vista de detalle de un producto específico"""
     producto = get_object_or_404(Producto, id=producto_id, activo=True)
@@ -167,6 +173,22 @@ def detalle_producto(request, producto_id):
     return render(request, 'tienda/detalle_producto.html', context)
 
 
+def autocompletar_productos(request):
+    """API JSON de autocompletado por código y nombre de producto"""
+    texto = request.GET.get('q', '').strip()
+    try:
+        limite = min(max(int(request.GET.get('limite', 10)), 1), 20)
+    except ValueError:
+        limite = 10
+    
+    resultados = indice_autocompletado.buscar(texto, limite) if texto else []
+    
+    return JsonResponse(
+        {'resultados': resultados},
+        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False},
+    )
+
+
 # Decorador para verificar si es superusuario
 def es_superusuario(user):
     return user.is_superuser
@@ -179,12 +201,42 @@ def panel_admin(request):
     context = {
         'total_productos': Producto.objects.count(),
         'productos_activos': Producto.objects.filter(activo=True).count(),
-        'productos_stock_bajo': Producto.objects.filter(stock_actual__lte=F('stock_minimo')).count(),
+        # Mantenido por el motor de alertas de inventario
+        'productos_stock_bajo': productos_con_alerta_abierta(),
         'total_categorias': CategoriaAcero.objects.count(),
+        'estados_cotizacion': Cotizacion.ESTADOS_COTIZACION,
     }
     return render(request, 'tienda/panel_admin.html', context)
 
 
+@login_required
+@user_passes_test(es_superusuario)
+def exportar_cotizaciones_pdf(request):
+    """Descargar en un ZIP los PDF de las cotizaciones filtradas por fecha y estado"""
+    cotizaciones = Cotizacion.objects.all()
+    desde = parse_date(request.GET.get('desde') or '')
+    hasta = parse_date(request.GET.get('hasta') or '')
+    estado = request.GET.get('estado')
+    
+    if desde:
+        cotizaciones = cotizaciones.filter(fecha_creacion__date__gte=desde)
+    if hasta:
+        cotizaciones = cotizaciones.filter(fecha_creacion__date__lte=hasta)
+    if estado in dict(Cotizacion.ESTADOS_COTIZACION):
+        cotizaciones = cotizaciones.filter(estado=estado)
+    
+    if not cotizaciones.exists():
+        messages.warning(request, 'No hay cotizaciones que coincidan con los filtros.')
+        return redirect('panel_admin')
+    
+    nombre = f"cotizaciones_{desde or 'inicio'}_{hasta or 'hoy'}.zip"
+    response = StreamingHttpResponse(
+        generar_zip(cotizaciones.order_by('fecha_creacion', 'id')), content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return response
+
+
 @login_required
 @user_passes_test(es_superusuario)
 def lista_productos_admin(request):
@@ -211,10 +263,10 @@ def lista_productos_admin(request):
             Q(codigo_producto__icontains=busqueda)
         )
     
-    # Paginación
-    paginator = Paginator(productos, 20)
-    page_number = request.GET.get('page')
-    productos_paginados = paginator.get_page(page_number)
+    # Paginación por cursor
+    productos_paginados = paginar_por_cursor(
+        request, productos.select_related('categoria'), ['-fecha_creacion', '-id'], 20, total='estimado'
+    )
     
     categorias = CategoriaAcero.objects.all()
     
@@ -235,7 +287,17 @@ def crear_producto(request):
     if request.method == 'POST':
         form = ProductoForm(request.POST, request.FILES)
         if form.is_valid():
-            producto = form.save()
+            # El stock inicial entra como movimiento para que el libro de inventario cuadre
+            with transaction.atomic():
+                producto = form.save(commit=False)
+                stock_inicial = producto.stock_actual
+                producto.stock_actual = 0
+                producto.save()
+                if stock_inicial:
+                    stock.entrada(producto, stock_inicial, request.user, motivo='inventario_inicial')
+                else:
+                    # Sin movimiento que evalúe las alertas: un producto nuevo sin stock ya está bajo el mínimo
+                    transaction.on_commit(lambda: evaluar_alertas([producto.id]))
             messages.success(request, f'Producto "{producto.nombre}" creado exitosamente.')
             return redirect('lista_productos_admin')
     else:
@@ -254,9 +316,32 @@ def editar_producto(request, producto_id):
     if request.method == 'POST':
         form = ProductoForm(request.POST, request.FILES, instance=producto)
         if form.is_valid():
-            producto = form.save()
-            messages.success(request, f'Producto "{producto.nombre}" actualizado exitosamente.')
-            return redirect('lista_productos_admin')
+            # El stock no se sobrescribe con el valor del formulario (perdería los movimientos
+            # hechos mientras estaba abierto): solo se registra la diferencia con el stock mostrado
+            diferencia = form.diferencia_stock()
+            try:
+                with transaction.atomic():
+                    producto = form.save(commit=False)
+                    campos = [campo for campo in form._meta.fields if campo != 'stock_actual']
+                    producto.save(update_fields=campos + ['imagen_hash', 'fecha_actualizacion'])
+                    if diferencia > 0:
+                        stock.entrada(producto, diferencia, request.user, motivo='ajuste_inventario',
+                                      observaciones='Edición del producto')
+                    elif diferencia < 0:
+                        stock.salida(producto, -diferencia, request.user, motivo='ajuste_inventario',
+                                     observaciones='Edición del producto')
+                    if {'stock_minimo', 'activo'} & set(form.changed_data):
+                        # Cambia el umbral (o si el producto cuenta): las alertas abiertas pueden no aplicar
+                        transaction.on_commit(lambda: evaluar_alertas([producto.id]))
+            except stock.StockInsuficiente as e:
+                form.add_error('stock_actual', str(e))
+            else:
+                imagen_anterior = form.initial.get('imagen')
+                if 'imagen' in form.changed_data and imagen_anterior:
+                    # Con el almacenamiento deduplicado solo se borra si ningún otro producto la usa
+                    eliminar_archivos(imagen_anterior.storage, [imagen_anterior.name])
+                messages.success(request, f'Producto "{producto.nombre}" actualizado exitosamente.')
+                return redirect('lista_productos_admin')
     else:
         form = ProductoForm(instance=producto)
     
@@ -268,6 +353,44 @@ def editar_producto(request, producto_id):
     return render(request, 'tienda/admin/formulario_producto.html', context)
 
 
+@login_required
+@user_passes_test(es_superusuario)
+def importar_productos_admin(request):
+    """Crear o actualizar productos por código desde una planilla CSV o XLSX"""
+    resultado = None
+    if request.method == 'POST':
+        form = ImportacionProductosForm(request.POST, request.FILES)
+        if form.is_valid():
+            archivo = form.cleaned_data['archivo']
+            try:
+                resultado = importar_productos(
+                    archivo, archivo.name, request.user,
+                    registrar_movimientos=form.cleaned_data['registrar_movimientos'],
+                    simular=form.cleaned_data['simular'],
+                )
+            except ErrorImportacion as e:
+                messages.error(request, str(e))
+            else:
+                prefijo = 'Validación' if form.cleaned_data['simular'] else 'Importación'
+                messages.success(
+                    request,
+                    f"{prefijo}: {resultado['filas']} filas, {resultado['creados']} productos nuevos y "
+                    f"{resultado['actualizados']} actualizados."
+                )
+                if resultado['errores']:
+                    messages.error(request, f"{len(resultado['errores'])} filas con errores no se importaron.")
+    else:
+        form = ImportacionProductosForm()
+
+    context = {
+        'form': form,
+        'resultado': resultado,
+        # El reporte completo se obtiene con el comando importar_productos --reporte
+        'errores': resultado['errores'][:500] if resultado else [],
+    }
+    return render(request, 'tienda/admin/importar_productos.html', context)
+
+
 @login_required
 @user_passes_test(es_superusuario)
 def eliminar_producto(request, producto_id):
@@ -305,10 +428,8 @@ def lista_categorias_admin(request):
             Q(descripcion__icontains=busqueda)
         )
     
-    # Paginación
-    paginator = Paginator(categorias, 20)
-    page_number = request.GET.get('page')
-    categorias_paginadas = paginator.get_page(page_number)
+    # Paginación por cursor
+    categorias_paginadas = paginar_por_cursor(request, categorias, ['nombre', 'id'], 20)
     
     context = {
         'categorias': categorias_paginadas,
@@ -394,10 +515,8 @@ def mis_cotizaciones(request):
     if estado:
         cotizaciones = cotizaciones.filter(estado=estado)
     
-    # Paginación
-    paginator = Paginator(cotizaciones, 10)
-    page_number = request.GET.get('page')
-    cotizaciones_paginadas = paginator.get_page(page_number)
+    # Paginación por cursor
+    cotizaciones_paginadas = paginar_por_cursor(request, cotizaciones, ['-fecha_creacion', '-id'], 10)
     
     context = {
         'cotizaciones': cotizaciones_paginadas,
@@ -443,16 +562,14 @@ def detalle_cotizacion(request, cotizacion_id):
         productos_disponibles = productos_disponibles.filter(categoria_id=categoria_id)
     
     if busqueda:
-        productos_disponibles = productos_disponibles.filter(
-            Q(nombre__icontains=busqueda) |
-            Q(codigo_producto__icontains=busqueda)
-        )
+        productos_disponibles = buscar_productos(productos_disponibles, busqueda)
     
-    categorias = CategoriaAcero.objects.filter(activa=True)
+    categorias = categorias_activas()
     
     context = {
         'cotizacion': cotizacion,
         'detalles': detalles,
+        'productos_en_cotizacion': list(productos_en_cotizacion),
         'productos_disponibles': productos_disponibles[:20],  # Limitar a 20 productos
         'categorias': categorias,
         'puede_editar': cotizacion.estado == 'borrador',
@@ -466,30 +583,34 @@ def agregar_producto_cotizacion(request, cotizacion_id):
     """Agregar un producto a la cotización"""
     cotizacion = get_object_or_404(Cotizacion, id=cotizacion_id, usuario=request.user)
     
-    # Solo se puede agregar productos si la cotización está en borrador
-    if cotizacion.estado != 'borrador':
-        messages.error(request, 'No se pueden agregar productos a una cotización finalizada.')
-        return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
-    
     producto_id = request.POST.get('producto_id')
     cantidad = int(request.POST.get('cantidad', 1))
     
     producto = get_object_or_404(Producto, id=producto_id, activo=True)
     
-    # Verificar si el producto ya está en la cotización
-    detalle, created = DetalleCotizacion.objects.get_or_create(
-        cotizacion=cotizacion,
-        producto=producto,
-        defaults={
-            'cantidad': cantidad,
-            'precio_unitario': producto.precio_por_unidad
-        }
-    )
+    with transaction.atomic():
+        # Solo se puede agregar productos si la cotización sigue en borrador (se
+        # verifica con la fila bloqueada, por si se finaliza al mismo tiempo)
+        if bloquear_si_editable(cotizacion.id) is None:
+            messages.error(request, 'No se pueden agregar productos a una cotización finalizada.')
+            return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
+        
+        # Verificar si el producto ya está en la cotización
+        detalle, created = DetalleCotizacion.objects.get_or_create(
+            cotizacion=cotizacion,
+            producto=producto,
+            defaults={
+                'cantidad': cantidad,
+                'precio_unitario': producto.precio_por_unidad
+            }
+        )
+        
+        if not created:
+            # Si ya existe, actualizar la cantidad
+            detalle.cantidad += cantidad
+            detalle.save()
     
     if not created:
-        # Si ya existe, actualizar la cantidad
-        detalle.cantidad += cantidad
-        detalle.save()
         messages.info(request, f'Se actualizó la cantidad de {producto.nombre} en la cotización.')
     else:
         messages.success(request, f'{producto.nombre} agregado a la cotización.')
@@ -497,6 +618,50 @@ def agregar_producto_cotizacion(request, cotizacion_id):
     return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
 
 
+@login_required
+@require_POST
+def agregar_productos_masivo_cotizacion(request, cotizacion_id):
+    """Agregar muchos productos a la cotización (JSON o CSV pegado)"""
+    cotizacion = get_object_or_404(Cotizacion, id=cotizacion_id, usuario=request.user)
+    es_json = request.content_type == 'application/json'
+    
+    if cotizacion.estado != 'borrador':
+        if es_json:
+            return JsonResponse({'error': 'No se pueden agregar productos a una cotización finalizada'}, status=400)
+        messages.error(request, 'No se pueden agregar productos a una cotización finalizada.')
+        return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
+    
+    if es_json:
+        # {"lineas": [{"producto_id": 1, "cantidad": 2}, {"codigo_producto": "PL-304", "cantidad": 5}]}
+        try:
+            datos = json.loads(request.body or b'{}')
+            lineas = datos.get('lineas') if isinstance(datos, dict) else datos
+            if not isinstance(lineas, list):
+                raise ValueError
+        except ValueError:
+            return JsonResponse({'error': 'JSON inválido: se espera {"lineas": [...]}'}, status=400)
+    else:
+        lineas = parsear_csv(request.POST.get('lineas_csv', ''))
+    
+    resultado = agregar_lineas(cotizacion, lineas)
+    
+    if es_json:
+        cotizacion.refresh_from_db(fields=['subtotal', 'iva', 'total'])
+        resultado['total_cotizacion'] = float(cotizacion.total)
+        return JsonResponse(resultado, status=200 if resultado['creadas'] or resultado['actualizadas'] else 400)
+    
+    if resultado['creadas'] or resultado['actualizadas']:
+        messages.success(
+            request,
+            f"Carga masiva: {resultado['creadas']} productos agregados y {resultado['actualizadas']} actualizados."
+        )
+    for error in resultado['errores'][:10]:
+        messages.error(request, f"Línea {error['linea']}: {error['error']}" if error['linea'] else error['error'])
+    if len(resultado['errores']) > 10:
+        messages.error(request, f"... y {len(resultado['errores']) - 10} errores más.")
+    return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
+
+
 @login_required
 @require_POST
 def actualizar_cantidad_producto(request, detalle_id):
@@ -508,21 +673,25 @@ def actualizar_cantidad_producto(request, detalle_id):
     if cotizacion.usuario != request.user:
         return JsonResponse({'error': 'No autorizado'}, status=403)
     
-    # Solo se puede editar si está en borrador
-    if cotizacion.estado != 'borrador':
-        return JsonResponse({'error': 'No se puede editar una cotización finalizada'}, status=400)
-    
     cantidad = int(request.POST.get('cantidad', 1))
     
     if cantidad <= 0:
         return JsonResponse({'error': 'La cantidad debe ser mayor a 0'}, status=400)
     
-    detalle.cantidad = cantidad
-    detalle.save()
+    with transaction.atomic():
+        # Solo se puede editar si sigue en borrador (verificado con la fila bloqueada)
+        if bloquear_si_editable(cotizacion.id) is None:
+            return JsonResponse({'error': 'No se puede editar una cotización finalizada'}, status=400)
+        detalle.cantidad = cantidad
+        detalle.save()
+    # Los totales se actualizan en la base de datos con F(); leer solo esos campos
+    cotizacion.refresh_from_db(fields=['subtotal', 'iva', 'total'])
     
     return JsonResponse({
         'success': True,
         'subtotal': float(detalle.subtotal),
+        'subtotal_cotizacion': float(cotizacion.subtotal),
+        'iva_cotizacion': float(cotizacion.iva),
         'total_cotizacion': float(cotizacion.total)
     })
 
@@ -539,13 +708,13 @@ def eliminar_producto_cotizacion(request, detalle_id):
         messages.error(request, 'No autorizado.')
         return redirect('mis_cotizaciones')
     
-    # Solo se puede eliminar si está en borrador
-    if cotizacion.estado != 'borrador':
-        messages.error(request, 'No se pueden eliminar productos de una cotización finalizada.')
-        return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
-    
     producto_nombre = detalle.producto.nombre
-    detalle.delete()
+    with transaction.atomic():
+        # Solo se puede eliminar si sigue en borrador (verificado con la fila bloqueada)
+        if bloquear_si_editable(cotizacion.id) is None:
+            messages.error(request, 'No se pueden eliminar productos de una cotización finalizada.')
+            return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
+        detalle.delete()
     messages.success(request, f'{producto_nombre} eliminado de la cotización.')
     
     return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
@@ -556,20 +725,21 @@ def finalizar_cotizacion(request, cotizacion_id):
     """Finalizar cotización y mostrar opciones de pago"""
     cotizacion = get_object_or_404(Cotizacion, id=cotizacion_id, usuario=request.user)
     
-    # Verificar que esté en borrador
-    if cotizacion.estado != 'borrador':
-        messages.error(request, 'Esta cotización ya fue finalizada.')
-        return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
-    
-    # Verificar que tenga al menos un producto
-    if not cotizacion.detalles.exists():
-        messages.error(request, 'Debe agregar al menos un producto a la cotización.')
-        return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
-    
-    # Actualizar estado
-    cotizacion.estado = 'finalizada'
-    cotizacion.fecha_finalizacion = timezone.now()
-    cotizacion.save()
+    with transaction.atomic():
+        # Verificar que esté en borrador, con la fila bloqueada frente a ediciones de líneas
+        if bloquear_si_editable(cotizacion.id) is None:
+            messages.error(request, 'Esta cotización ya fue finalizada.')
+            return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
+        
+        # Verificar que tenga al menos un producto
+        if not cotizacion.detalles.exists():
+            messages.error(request, 'Debe agregar al menos un producto a la cotización.')
+            return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
+        
+        # Actualizar estado (sin reescribir los totales, que se mantienen con F())
+        cotizacion.estado = 'finalizada'
+        cotizacion.fecha_finalizacion = timezone.now()
+        cotizacion.save(update_fields=['estado', 'fecha_finalizacion', 'fecha_actualizacion'])
     
     messages.success(request, 'Cotización finalizada. Seleccione un método de pago.')
     return redirect('seleccionar_pago', cotizacion_id=cotizacion.id)
@@ -604,55 +774,16 @@ def procesar_pago_mercadopago(request, cotizacion_id):
         messages.error(request, 'La cotización debe estar finalizada para proceder al pago.')
         return redirect('detalle_cotizacion', cotizacion_id=cotizacion.id)
     
-    # Obtener el Access Token de MercadoPago desde variables de entorno
-    mp_access_token = os.getenv('MERCADOPAGO_ACCESS_TOKEN')
-    
-    if not mp_access_token:
+    if not (settings.MERCADOPAGO_ACCESS_TOKEN or settings.MERCADOPAGO_SIMULADO):
         messages.error(request, 'MercadoPago no está configurado. Contacte al administrador.')
         return redirect('seleccionar_pago', cotizacion_id=cotizacion.id)
     
     try:
-        # Inicializar SDK de MercadoPago
-        sdk = mercadopago.SDK(mp_access_token)
-        
-        # Crear items de la preferencia
-        items = []
-        for detalle in cotizacion.detalles.all():
-            items.append({
-                "title": detalle.producto.nombre,
-                "quantity": detalle.cantidad,
-                "unit_price": float(detalle.precio_unitario),
-                "currency_id": "CLP"  # Peso chileno
-            })
-        
-        # Crear preferencia
-        preference_data = {
-            "items": items,
-            "back_urls": {
-                "success": request.build_absolute_uri(f'/cotizaciones/{cotizacion.id}/pago-exitoso/'),
-                "failure": request.build_absolute_uri(f'/cotizaciones/{cotizacion.id}/pago-fallido/'),
-                "pending": request.build_absolute_uri(f'/cotizaciones/{cotizacion.id}/pago-pendiente/'),
-            },
-            "auto_return": "approved",
-            "external_reference": cotizacion.numero_cotizacion,
-            "statement_descriptor": "Pozinox",
-            "payer": {
-                "name": request.user.first_name,
-                "surname": request.user.last_name,
-                "email": request.user.email,
-            }
-        }
-        
-        preference_response = sdk.preference().create(preference_data)
-        preference = preference_response["response"]
-        
-        # Guardar el ID de preferencia
-        cotizacion.mercadopago_preference_id = preference["id"]
-        cotizacion.metodo_pago = 'mercadopago'
-        cotizacion.save()
+        # Reutiliza la preferencia existente si la cotización no cambió
+        init_point = obtener_init_point(cotizacion, datos_preferencia(cotizacion, request))
         
         # Redirigir a MercadoPago
-        return redirect(preference["init_point"])
+        return redirect(init_point)
         
     except Exception as e:
         messages.error(request, f'Error al procesar el pago: {str(e)}')
@@ -664,16 +795,11 @@ def pago_exitoso(request, cotizacion_id):
     """Página de confirmación de pago exitoso"""
     cotizacion = get_object_or_404(Cotizacion, id=cotizacion_id, usuario=request.user)
     
-    # Actualizar estado de la cotización
-    cotizacion.estado = 'pagada'
-    cotizacion.pago_completado = True
-    
-    # Obtener payment_id de MercadoPago si está disponible
+    # Los parámetros del retorno se pueden falsificar: el pago se confirma
+    # consultando a MercadoPago desde la cola de notificaciones
     payment_id = request.GET.get('payment_id')
-    if payment_id:
-        cotizacion.mercadopago_payment_id = payment_id
-    
-    cotizacion.save()
+    if payment_id and payment_id != 'null':
+        registrar_notificacion(payment_id, 'retorno', request.GET.dict())
     
     context = {
         'cotizacion': cotizacion,
@@ -681,6 +807,30 @@ def pago_exitoso(request, cotizacion_id):
     return render(request, 'tienda/cotizaciones/pago_exitoso.html', context)
 
 
+@csrf_exempt
+@require_POST
+def webhook_mercadopago(request):
+    """Recibe notificaciones (webhook o IPN) de MercadoPago y las deja en la cola"""
+    try:
+        cuerpo = json.loads(request.body or b'{}')
+    except ValueError:
+        cuerpo = {}
+    if not isinstance(cuerpo, dict):
+        cuerpo = {}
+    
+    # Webhook: {"type": "payment", "data": {"id": ...}}; IPN: ?topic=payment&id=...
+    tipo = cuerpo.get('type') or request.GET.get('type') or request.GET.get('topic') or ''
+    data_id = (cuerpo.get('data') or {}).get('id') or request.GET.get('data.id') or request.GET.get('id')
+    
+    if not verificar_firma(request, request.GET.get('data.id') or data_id or ''):
+        return HttpResponse(status=401)
+    
+    # Otros avisos (merchant_order, etc.) se aceptan para que no se reenvíen
+    if tipo == 'payment' and data_id:
+        registrar_notificacion(data_id, tipo, cuerpo or request.GET.dict())
+    return HttpResponse(status=200)
+
+
 @login_required
 def pago_fallido(request, cotizacion_id):
     """Página de pago fallido"""
@@ -705,180 +855,22 @@ def pago_pendiente(request, cotizacion_id):
 
 @login_required
 def descargar_cotizacion_pdf(request, cotizacion_id):
-    """Generar y descargar PDF de la cotización"""
-    cotizacion = get_object_or_404(Cotizacion, id=cotizacion_id, usuario=request.user)
-    detalles = cotizacion.detalles.all().select_related('producto')
-    
-    # Crear el buffer
-    buffer = BytesIO()
-    
-    # Crear el documento PDF
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72,
-                           topMargin=72, bottomMargin=18)
-    
-    # Contenedor para los elementos del PDF
-    elements = []
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    
-    # Estilo personalizado para el título
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1e3a8a'),
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Estilo para encabezados
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#1e3a8a'),
-        spaceAfter=12,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Estilo normal
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=12,
+    """Descargar PDF de la cotización (desde el caché si ya está cerrada)"""
+    cotizacion = get_object_or_404(Cotizacion.objects.select_related('usuario'), id=cotizacion_id, usuario=request.user)
+    
+    # El hash del contenido identifica el PDF: si el navegador ya lo tiene se responde 304
+    datos = datos_cotizacion(cotizacion)
+    etag = f'"{huella(datos)}"'
+    respuesta_304 = get_conditional_response(request, etag=etag)
+    if respuesta_304 is not None:
+        return respuesta_304
+    
+    response = FileResponse(
+        obtener_pdf(cotizacion, datos),
+        as_attachment=True,
+        filename=f'Cotizacion_{cotizacion.numero_cotizacion}.pdf',
+        content_type='application/pdf',
     )
-    
-    # Título
-    elements.append(Paragraph('POZINOX', title_style))
-    elements.append(Paragraph('Tienda de Aceros', styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Información de la cotización
-    elements.append(Paragraph(f'COTIZACIÓN N° {cotizacion.numero_cotizacion}', heading_style))
-    
-    # Datos del cliente y cotización
-    info_data = [
-        ['Cliente:', f'{request.user.get_full_name() or request.user.username}'],
-        ['Email:', request.user.email],
-        ['Fecha:', cotizacion.fecha_creacion.strftime('%d/%m/%Y %H:%M')],
-        ['Estado:', cotizacion.get_estado_display()],
-    ]
-    
-    info_table = Table(info_data, colWidths=[2*inch, 4*inch])
-    info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e3a8a')),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    
-    elements.append(info_table)
-    elements.append(Spacer(1, 20))
-    
-    # Tabla de productos
-    elements.append(Paragraph('DETALLE DE PRODUCTOS', heading_style))
-    
-    # Encabezados de tabla
-    table_data = [['Producto', 'Código', 'Cantidad', 'Precio Unit.', 'Subtotal']]
-    
-    # Datos de productos
-    for detalle in detalles:
-        table_data.append([
-            Paragraph(detalle.producto.nombre, normal_style),
-            detalle.producto.codigo_producto,
-            str(detalle.cantidad),
-            f'${detalle.precio_unitario:,.0f}',
-            f'${detalle.subtotal:,.0f}'
-        ])
-    
-    # Crear tabla
-    product_table = Table(table_data, colWidths=[2.5*inch, 1.2*inch, 0.8*inch, 1*inch, 1*inch])
-    product_table.setStyle(TableStyle([
-        # Encabezado
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        
-        # Contenido
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('ALIGN', (2, 1), (2, -1), 'CENTER'),
-        ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8fafc')]),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-    ]))
-    
-    elements.append(product_table)
-    elements.append(Spacer(1, 20))
-    
-    # Totales
-    totales_data = [
-        ['Subtotal:', f'${cotizacion.subtotal:,.0f}'],
-        ['IVA (19%):', f'${cotizacion.iva:,.0f}'],
-        ['', ''],
-        ['TOTAL:', f'${cotizacion.total:,.0f}'],
-    ]
-    
-    totales_table = Table(totales_data, colWidths=[5*inch, 1.5*inch])
-    totales_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, 1), 'Helvetica'),
-        ('FONTNAME', (1, 0), (1, 1), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 2), 11),
-        ('FONTSIZE', (0, 3), (-1, 3), 14),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('TEXTCOLOR', (0, 3), (-1, 3), colors.HexColor('#1e3a8a')),
-        ('LINEABOVE', (0, 3), (-1, 3), 2, colors.HexColor('#1e3a8a')),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-    ]))
-    
-    elements.append(totales_table)
-    elements.append(Spacer(1, 30))
-    
-    # Observaciones si existen
-    if cotizacion.observaciones:
-        elements.append(Paragraph('OBSERVACIONES:', heading_style))
-        elements.append(Paragraph(cotizacion.observaciones, normal_style))
-        elements.append(Spacer(1, 20))
-    
-    # Pie de página
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=TA_CENTER,
-    )
-    
-    elements.append(Spacer(1, 30))
-    elements.append(Paragraph('_______________________________________________', footer_style))
-    elements.append(Spacer(1, 10))
-    elements.append(Paragraph('POZINOX - Tienda de Aceros', footer_style))
-    elements.append(Paragraph('www.pozinox.cl | info@pozinox.cl | +56 2 1234 5678', footer_style))
-    elements.append(Paragraph('Este documento es una cotización y no constituye una factura', footer_style))
-    
-    # Construir PDF
-    doc.build(elements)
-    
-    # Obtener el valor del buffer
-    pdf = buffer.getvalue()
-    buffer.close()
-    
-    # Crear la respuesta HTTP
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Cotizacion_{cotizacion.numero_cotizacion}.pdf"'
-    response.write(pdf)
-    
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
     return response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PerfilUsuario, ConfiguracionSistema, LogActividad, Notificacion, EmailVerificationToken
+from .models import PerfilUsuario, ConfiguracionSistema, LogActividad, Notificacion, EmailVerificationToken, CorreoPendiente
 
 
 @admin.register(PerfilUsuario)
@@ -50,3 +50,11 @@ class NotificacionAdmin(admin.ModelAdmin):
     list_filter = ['tipo', 'leida', 'fecha_creacion']
     search_fields = ['usuario__username', 'titulo', 'mensaje']
     readonly_fields = ['fecha_creacion', 'fecha_leida']
+
+
+@admin.register(CorreoPendiente)
+class CorreoPendienteAdmin(admin.ModelAdmin):
+    list_display = ['asunto', 'estado', 'intentos', 'proximo_intento', 'fecha_creacion', 'fecha_envio']
+    list_filter = ['estado', 'fecha_creacion']
+    search_fields = ['asunto', 'destinatarios']
+    readonly_fields = ['fecha_creacion', 'fecha_envio', 'ultimo_error']
@@ -0,0 +1,173 @@
+"""
+Cola de salida de correos.
+
+Las vistas solo llaman a ``encolar_correo``, que inserta una fila en
+``CorreoPendiente`` y retorna de inmediato. Después del commit el correo se
+intenta enviar en un pool de hilos (``CORREO_ENVIO_INMEDIATO``); si falla queda
+en la cola. El comando ``procesar_correos`` (servicio ``correos`` de
+docker-compose) toma los correos por lotes, abre una sola conexión SMTP por
+lote y registra el resultado de cada envío. Los fallos se reintentan con espera
+exponencial hasta ``CORREO_MAX_INTENTOS``.
+
+Al tomar un correo se posterga su ``proximo_intento`` (arriendo) con un UPDATE
+condicional, de modo que si el proceso muere a mitad de camino los correos
+vuelven a la cola solos y dos procesos no envían el mismo correo a la vez.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import CorreoPendiente
+
+
+logger = logging.getLogger(__name__)
+
+ARRIENDO_SEGUNDOS = 300
+ESPERA_BASE_SEGUNDOS = 30
+ESPERA_MAXIMA_SEGUNDOS = 3600
+
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='correos')
+
+
+def encolar_correo(asunto, mensaje, destinatarios, mensaje_html='', remitente=None):
+    """Agrega un correo a la cola de salida y retorna la fila creada"""
+    correo = CorreoPendiente.objects.create(
+        asunto=asunto,
+        mensaje=mensaje,
+        mensaje_html=mensaje_html or '',
+        remitente=remitente or settings.DEFAULT_FROM_EMAIL,
+        destinatarios=list(destinatarios),
+    )
+    if getattr(settings, 'CORREO_ENVIO_INMEDIATO', True):
+        transaction.on_commit(lambda: _ejecutor.submit(_enviar_en_segundo_plano, correo.id))
+    return correo
+
+
+def _enviar_en_segundo_plano(correo_id):
+    try:
+        procesar_cola(ids=[correo_id])
+    except Exception:
+        logger.exception('Error al enviar el correo %s', correo_id)
+    finally:
+        close_old_connections()
+
+
+def calcular_espera(intentos):
+    """Segundos a esperar antes del siguiente intento (30s, 60s, 120s, ... hasta 1 hora)"""
+    return min(ESPERA_BASE_SEGUNDOS * 2 ** max(intentos - 1, 0), ESPERA_MAXIMA_SEGUNDOS)
+
+
+def _reservar(ids, ahora):
+    """
+    Posterga el próximo intento de los correos ``ids`` que sigan pendientes y
+    vencidos en ``ahora``, con un UPDATE condicional por correo. Retorna los
+    que tomó esta llamada (otro proceso pudo reservar el resto).
+    """
+    arriendo = ahora + timedelta(seconds=ARRIENDO_SEGUNDOS)
+    return [
+        correo_id for correo_id in ids
+        if CorreoPendiente.objects.filter(
+            id=correo_id, estado='pendiente', proximo_intento__lte=ahora
+        ).update(proximo_intento=arriendo)
+    ]
+
+
+def _tomar_lote(tamano_lote, ids=None):
+    """
+    Reserva hasta ``tamano_lote`` correos vencidos (solo de ``ids`` si se
+    indica) postergando su próximo intento.
+    """
+    ahora = timezone.now()
+    pendientes = CorreoPendiente.objects.filter(
+        estado='pendiente', proximo_intento__lte=ahora
+    ).order_by('proximo_intento', 'id')
+    if ids is not None:
+        pendientes = pendientes.filter(id__in=ids)
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            tomados = list(pendientes.select_for_update(skip_locked=True).values_list('id', flat=True)[:tamano_lote])
+            CorreoPendiente.objects.filter(id__in=tomados).update(
+                proximo_intento=ahora + timedelta(seconds=ARRIENDO_SEGUNDOS)
+            )
+    else:
+        # Sin bloqueo por fila (SQLite) dos procesos pueden leer los mismos correos
+        tomados = _reservar(list(pendientes.values_list('id', flat=True)[:tamano_lote]), ahora)
+    return list(CorreoPendiente.objects.filter(id__in=tomados).order_by('id'))
+
+
+def _mensaje(correo, conexion):
+    email = EmailMultiAlternatives(
+        subject=correo.asunto,
+        body=correo.mensaje,
+        from_email=correo.remitente,
+        to=correo.destinatarios,
+        connection=conexion,
+    )
+    if correo.mensaje_html:
+        email.attach_alternative(correo.mensaje_html, 'text/html')
+    return email
+
+
+def procesar_cola(tamano_lote=None, max_intentos=None, ids=None):
+    """
+    Envía un lote de correos usando una sola conexión SMTP. ``ids`` limita el
+    lote a esos correos (si siguen pendientes y nadie más los tomó).
+
+    Retorna un diccionario con la cantidad de correos enviados, reprogramados
+    y fallidos definitivamente.
+    """
+    tamano_lote = tamano_lote or settings.CORREO_LOTE
+    max_intentos = max_intentos or settings.CORREO_MAX_INTENTOS
+    resultado = {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+
+    correos = _tomar_lote(tamano_lote, ids)
+    if not correos:
+        return resultado
+
+    conexion = get_connection(fail_silently=False)
+    try:
+        conexion.open()
+    except Exception as e:
+        # Sin conexión no se puede enviar nada del lote: todos se reprograman
+        logger.warning('No se pudo abrir la conexión de correo: %s', e)
+        for correo in correos:
+            _registrar_fallo(correo, e, max_intentos, resultado)
+        return resultado
+
+    try:
+        for correo in correos:
+            try:
+                _mensaje(correo, conexion).send()
+            except Exception as e:
+                logger.warning('Error al enviar correo %s: %s', correo.id, e)
+                _registrar_fallo(correo, e, max_intentos, resultado)
+            else:
+                CorreoPendiente.objects.filter(id=correo.id).update(
+                    estado='enviado',
+                    intentos=correo.intentos + 1,
+                    fecha_envio=timezone.now(),
+                    ultimo_error='',
+                )
+                resultado['enviados'] += 1
+    finally:
+        conexion.close()
+
+    return resultado
+
+
+def _registrar_fallo(correo, error, max_intentos, resultado):
+    intentos = correo.intentos + 1
+    cambios = {'intentos': intentos, 'ultimo_error': str(error)[:1000]}
+    if intentos >= max_intentos:
+        cambios['estado'] = 'fallido'
+        resultado['fallidos'] += 1
+    else:
+        cambios['proximo_intento'] = timezone.now() + timedelta(seconds=calcular_espera(intentos))
+        resultado['reintentos'] += 1
+    CorreoPendiente.objects.filter(id=correo.id).update(**cambios)
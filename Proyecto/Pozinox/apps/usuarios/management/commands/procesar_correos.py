@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.usuarios.correo import procesar_cola
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos pendientes de la cola de salida (una conexión SMTP por lote)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=None, help='Cantidad de correos por lote')
+        parser.add_argument('--continuo', action='store_true', help='Seguir revisando la cola indefinidamente')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera cuando la cola está vacía')
+
+    def handle(self, *args, **options):
+        while True:
+            resultado = procesar_cola(tamano_lote=options['lote'])
+            if any(resultado.values()):
+                self.stdout.write(self.style.SUCCESS(
+                    f"Enviados: {resultado['enviados']}, reintentos: {resultado['reintentos']}, "
+                    f"fallidos: {resultado['fallidos']}"
+                ))
+            if not options['continuo']:
+                break
+            if not any(resultado.values()):
+                time.sleep(options['intervalo'])
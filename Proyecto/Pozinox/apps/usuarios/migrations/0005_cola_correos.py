@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0004_perfilusuario_api_token_perfilusuario_token_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorreoPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asunto', models.CharField(max_length=255)),
+                ('mensaje', models.TextField()),
+                ('mensaje_html', models.TextField(blank=True)),
+                ('remitente', models.CharField(max_length=255)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviado', 'Enviado'), ('fallido', 'Fallido')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Correo Pendiente',
+                'verbose_name_plural': 'Cola de Correos',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='correo_cola_idx')],
+            },
+        ),
+    ]
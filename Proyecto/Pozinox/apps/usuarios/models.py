@@ -244,3 +244,37 @@ class EmailVerificationToken(models.Model):
         
         return False
     
+
+
+class CorreoPendiente(models.Model):
+    """Correo en la cola de salida, enviado por el comando procesar_correos"""
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'),
+    ]
+    
+    asunto = models.CharField(max_length=255)
+    mensaje = models.TextField()
+    mensaje_html = models.TextField(blank=True)
+    remitente = models.CharField(max_length=255)
+    destinatarios = models.JSONField(default=list)
+    
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Correo Pendiente'
+        verbose_name_plural = 'Cola de Correos'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='correo_cola_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.asunto} -> {', '.join(self.destinatarios)} ({self.get_estado_display()})"
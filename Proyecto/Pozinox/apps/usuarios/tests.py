@@ -1,3 +1,78 @@
-from django.test import TestCase
+import smtplib
+import unittest.mock
+from datetime import timedelta
 
-# Create your tests here.
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import correo
+from .models import CorreoPendiente
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', CORREO_ENVIO_INMEDIATO=False)
+class ColaCorreosTests(TestCase):
+    """Cola de salida de correos sobre el backend locmem"""
+
+    def encolar(self, cantidad=1):
+        return [
+            correo.encolar_correo(f'Asunto {i}', 'Mensaje', ['cliente@pozinox.cl'], mensaje_html='<p>Mensaje</p>')
+            for i in range(cantidad)
+        ]
+
+    def test_encolar_no_envia_y_el_comando_despacha_el_lote(self):
+        self.encolar(3)
+        self.assertEqual(mail.outbox, [])
+
+        call_command('procesar_correos', stdout=unittest.mock.Mock())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertEqual(CorreoPendiente.objects.filter(estado='enviado', intentos=1).count(), 3)
+        self.assertEqual(correo.procesar_cola(), {'enviados': 0, 'reintentos': 0, 'fallidos': 0})
+
+    @override_settings(CORREO_ENVIO_INMEDIATO=True)
+    def test_envio_inmediato_tras_el_commit(self):
+        # El envío corre en este hilo, dentro de la transacción de la prueba: no cerrar la conexión
+        en_linea = unittest.mock.patch.object(correo._ejecutor, 'submit', lambda funcion, *args: funcion(*args))
+        with en_linea, unittest.mock.patch.object(correo, 'close_old_connections'):
+            with self.captureOnCommitCallbacks(execute=True):
+                pendiente, = self.encolar()
+                self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(len(mail.outbox), 1)
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, 'enviado')
+
+    def test_reintentos_con_espera_exponencial(self):
+        pendiente, = self.encolar()
+        fallo = unittest.mock.patch.object(correo.EmailMultiAlternatives, 'send', side_effect=smtplib.SMTPException('caído'))
+        with fallo, self.assertLogs('apps.usuarios.correo', 'WARNING'):
+            self.assertEqual(correo.procesar_cola(max_intentos=3)['reintentos'], 1)
+            pendiente.refresh_from_db()
+            self.assertEqual((pendiente.estado, pendiente.intentos, pendiente.ultimo_error), ('pendiente', 1, 'caído'))
+            self.assertGreater(pendiente.proximo_intento, timezone.now() + timedelta(seconds=25))
+            # Aún no vence la espera
+            self.assertEqual(correo.procesar_cola(max_intentos=3)['reintentos'], 0)
+
+            CorreoPendiente.objects.update(proximo_intento=timezone.now())
+            correo.procesar_cola(max_intentos=3)
+            CorreoPendiente.objects.update(proximo_intento=timezone.now())
+            self.assertEqual(correo.procesar_cola(max_intentos=3)['fallidos'], 1)
+        pendiente.refresh_from_db()
+        self.assertEqual((pendiente.estado, pendiente.intentos), ('fallido', 3))
+        self.assertEqual([correo.calcular_espera(i) for i in (1, 2, 3, 10)], [30, 60, 120, 3600])
+
+    def test_arriendo_impide_enviar_dos_veces(self):
+        ids = [pendiente.id for pendiente in self.encolar(2)]
+        ahora = timezone.now()
+
+        # Dos procesos leyeron los mismos correos: solo el primero que los reserva los toma
+        self.assertEqual(correo._reservar(ids, ahora), ids)
+        self.assertEqual(correo._reservar(ids, ahora), [])
+        self.assertEqual(correo.procesar_cola(), {'enviados': 0, 'reintentos': 0, 'fallidos': 0})
+
+        # Si el proceso que los tomó muere, vuelven a la cola al vencer el arriendo
+        with unittest.mock.patch.object(correo.timezone, 'now', return_value=ahora + timedelta(seconds=correo.ARRIENDO_SEGUNDOS)):
+            self.assertEqual(correo.procesar_cola()['enviados'], 2)
+        self.assertEqual(len(mail.outbox), 2)
@@ -1,10 +1,11 @@
+import logging
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_protect
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils import timezone
@@ -12,6 +13,9 @@ from django.conf import settings
 from django.http import JsonResponse
 from .models import PerfilUsuario, EmailVerificationToken
 from .forms import LoginForm, RegistroForm, UsuarioForm
+from .correo import encolar_correo
+
+logger = logging.getLogger(__name__)
 
 
 def login_view(request):
@@ -125,8 +129,8 @@ def es_superusuario(user):
 @user_passes_test(es_superusuario)
 def lista_usuarios_admin(request):
     """Lista de usuarios para administración"""
-    from django.core.paginator import Paginator
     from django.db.models import Q
+    from apps.paginacion import paginar_por_cursor
     
     usuarios = User.objects.all().order_by('-date_joined')
     
@@ -151,10 +155,10 @@ def lista_usuarios_admin(request):
             Q(email__icontains=busqueda)
         )
     
-    # Paginación
-    paginator = Paginator(usuarios, 20)
-    page_number = request.GET.get('page')
-    usuarios_paginados = paginator.get_page(page_number)
+    # Paginación por cursor
+    usuarios_paginados = paginar_por_cursor(
+        request, usuarios.select_related('perfil'), ['-date_joined', '-id'], 20, total='estimado'
+    )
     
     context = {
         'usuarios': usuarios_paginados,
@@ -262,19 +266,17 @@ Saludos,
 Equipo Pozinox
     """
     
-    # Enviar email
+    # Encolar email (se envía tras el commit; procesar_correos reintenta los fallidos)
     try:
-        send_mail(
-            subject='Tu código de verificación - Pozinox',
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email],
-            html_message=html_message,
-            fail_silently=False,
+        encolar_correo(
+            asunto='Tu código de verificación - Pozinox',
+            mensaje=plain_message,
+            destinatarios=[email],
+            mensaje_html=html_message,
         )
         return True
-    except Exception as e:
-        print(f"Error al enviar email: {e}")
+    except Exception:
+        logger.exception('Error al encolar el código de verificación para %s', email)
         return False
 
 
@@ -1,26 +1,180 @@
 """
 Utilidades para integración con Supabase Storage
+
+``SupabaseStorage`` mantiene un índice en memoria con los metadatos (tamaño,
+tipo de contenido y etag) de los objetos del bucket, para que ``exists`` y
+``size`` respondan sin llamar a la API. El índice se organiza por carpeta:
+
+- Cada ``_save`` y ``delete`` del proceso actualiza el índice.
+- La primera consulta sobre una carpeta la carga completa con ``list(carpeta)``
+  (paginado); desde ahí la carpeta responde también por los nombres que no
+  existen.
+- Las carpetas expiran tras ``TTL_INDICE_SEGUNDOS`` (para recoger cambios de
+  otros procesos) y se descartan las menos usadas sobre ``MAX_CARPETAS_INDICE``.
+
+El cliente de Supabase se crea recién al primer uso (``obtener_cliente_supabase``),
+así importar este módulo o instanciar el storage no carga el SDK. Con
+``SUPABASE_SIMULADO=True`` se usa el cliente en memoria de
+``apps/supabase_simulado.py``.
 """
+import mimetypes
 import os
+import threading
+import time
+from collections import OrderedDict
 from django.conf import settings
 from django.core.files.storage import Storage
 from django.core.files.base import ContentFile
-from supabase import create_client
 import uuid
 
 
+TTL_INDICE_SEGUNDOS = 300
+MAX_CARPETAS_INDICE = 256
+LIMITE_LISTADO = 1000
+
+
+_clientes = {}
+_lock_cliente = threading.Lock()
+
+
+def _crear_cliente():
+    if getattr(settings, 'SUPABASE_SIMULADO', False):
+        from .supabase_simulado import ClienteSupabaseSimulado
+        return ClienteSupabaseSimulado()
+    if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
+        raise ValueError("SUPABASE_URL y SUPABASE_KEY deben estar configurados en settings.py")
+    from supabase import create_client
+    return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+
+
+def obtener_cliente_supabase():
+    """Cliente de Supabase compartido por el proceso, creado al primer uso"""
+    clave = (settings.SUPABASE_URL, settings.SUPABASE_KEY, getattr(settings, 'SUPABASE_SIMULADO', False))
+    cliente = _clientes.get(clave)
+    if cliente is None:
+        with _lock_cliente:
+            cliente = _clientes.get(clave)
+            if cliente is None:
+                cliente = _clientes[clave] = _crear_cliente()
+    return cliente
+
+
+class IndiceObjetos:
+    """Metadatos de los objetos de un bucket por carpeta, con expiración y desalojo LRU"""
+
+    def __init__(self, ttl=TTL_INDICE_SEGUNDOS, max_carpetas=MAX_CARPETAS_INDICE):
+        self.ttl = ttl
+        self.max_carpetas = max_carpetas
+        self._lock = threading.Lock()
+        # carpeta -> {'creada_en', 'completa', 'objetos': {nombre: metadatos}}
+        self._carpetas = OrderedDict()
+
+    @staticmethod
+    def dividir(nombre):
+        """Separa un nombre en (carpeta, archivo)"""
+        carpeta, _, archivo = nombre.strip('/').rpartition('/')
+        return carpeta, archivo
+
+    def _carpeta(self, carpeta, crear=False):
+        entrada = self._carpetas.get(carpeta)
+        if entrada is not None and time.monotonic() - entrada['creada_en'] >= self.ttl:
+            del self._carpetas[carpeta]
+            entrada = None
+        if entrada is None and crear:
+            entrada = self._carpetas[carpeta] = {'creada_en': time.monotonic(), 'completa': False, 'objetos': {}}
+            if len(self._carpetas) > self.max_carpetas:
+                self._carpetas.popitem(last=False)
+        if entrada is not None:
+            self._carpetas.move_to_end(carpeta)
+        return entrada
+
+    def consultar(self, nombre):
+        """
+        Retorna ``(conocido, metadatos)``. Si ``conocido`` es False hay que
+        cargar la carpeta; si es True, ``metadatos`` es None cuando el objeto
+        no existe.
+        """
+        carpeta, archivo = self.dividir(nombre)
+        with self._lock:
+            entrada = self._carpeta(carpeta)
+            if entrada is None:
+                return False, None
+            if archivo in entrada['objetos']:
+                return True, entrada['objetos'][archivo]
+            return entrada['completa'], None
+
+    def cargar(self, carpeta, objetos):
+        """Reemplaza la carpeta con un listado completo ``{archivo: metadatos}``"""
+        with self._lock:
+            entrada = self._carpeta(carpeta, crear=True)
+            entrada.update(creada_en=time.monotonic(), completa=True, objetos=dict(objetos))
+
+    def registrar(self, nombre, metadatos):
+        carpeta, archivo = self.dividir(nombre)
+        with self._lock:
+            self._carpeta(carpeta, crear=True)['objetos'][archivo] = metadatos
+
+    def eliminar(self, nombre):
+        carpeta, archivo = self.dividir(nombre)
+        with self._lock:
+            entrada = self._carpeta(carpeta)
+            if entrada is not None:
+                entrada['objetos'].pop(archivo, None)
+
+    def invalidar(self):
+        with self._lock:
+            self._carpetas.clear()
+
+
 class SupabaseStorage(Storage):
     """
     Storage backend personalizado para usar Supabase Storage en lugar de almacenamiento local.
     Ideal para el plan gratuito de Supabase.
     """
     
-    def __init__(self):
-        if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
-            raise ValueError("SUPABASE_URL y SUPABASE_KEY deben estar configurados en settings.py")
-        
-        self.client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-        self.bucket_name = 'pozinox-media'  # Nombre del bucket en Supabase
+    def __init__(self, client=None, bucket_name='pozinox-media', indice=None):
+        self._client = client
+        self.bucket_name = bucket_name  # Nombre del bucket en Supabase
+        self.indice = indice or IndiceObjetos()
+    
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = obtener_cliente_supabase()
+        return self._client
+    
+    def _bucket(self):
+        return self.client.storage.from_(self.bucket_name)
+    
+    def _listar(self, path):
+        """Todos los elementos de una carpeta (la API pagina los listados)"""
+        items = []
+        while True:
+            pagina = self._bucket().list(path, {'limit': LIMITE_LISTADO, 'offset': len(items)})
+            items.extend(pagina)
+            if len(pagina) < LIMITE_LISTADO:
+                return items
+    
+    def _cargar_carpeta(self, carpeta):
+        """Lista una carpeta y la carga en el índice; retorna los elementos"""
+        items = self._listar(carpeta)
+        self.indice.cargar(carpeta, {
+            item['name']: {
+                'size': item['metadata'].get('size', 0),
+                'content_type': item['metadata'].get('mimetype'),
+                'etag': item['metadata'].get('eTag'),
+            }
+            for item in items if item.get('metadata')
+        })
+        return items
+    
+    def _metadatos(self, name):
+        """Metadatos de un objeto (None si no existe), cargando su carpeta si no está en el índice"""
+        conocido, metadatos = self.indice.consultar(name)
+        if not conocido:
+            self._cargar_carpeta(self.indice.dividir(name)[0])
+            conocido, metadatos = self.indice.consultar(name)
+        return metadatos
     
     def _save(self, name, content):
         """
@@ -37,22 +191,25 @@ class SupabaseStorage(Storage):
             file_content = content
         
         # Subir a Supabase Storage
+        content_type = self._guess_content_type(name)
         try:
-            self.client.storage.from_(self.bucket_name).upload(
+            self._bucket().upload(
                 name,
                 file_content,
-                file_options={"content-type": self._guess_content_type(name)}
+                file_options={"content-type": content_type}
             )
-            return name
         except Exception as e:
             raise IOError(f"Error al subir archivo a Supabase: {str(e)}")
+        # La respuesta de la subida no trae el etag; se completa en el próximo listado
+        self.indice.registrar(name, {'size': len(file_content), 'content_type': content_type, 'etag': None})
+        return name
     
     def _open(self, name, mode='rb'):
         """
         Descarga un archivo desde Supabase Storage
         """
         try:
-            response = self.client.storage.from_(self.bucket_name).download(name)
+            response = self._bucket().download(name)
             return ContentFile(response)
         except Exception as e:
             raise IOError(f"Error al descargar archivo de Supabase: {str(e)}")
@@ -62,18 +219,18 @@ class SupabaseStorage(Storage):
         Elimina un archivo de Supabase Storage
         """
         try:
-            self.client.storage.from_(self.bucket_name).remove([name])
+            self._bucket().remove([name])
         except Exception as e:
             raise IOError(f"Error al eliminar archivo de Supabase: {str(e)}")
+        self.indice.eliminar(name)
     
     def exists(self, name):
         """
-        Verifica si un archivo existe en Supabase Storage
+        Verifica si un archivo existe en Supabase Storage (según el índice)
         """
         try:
-            files = self.client.storage.from_(self.bucket_name).list()
-            return any(f['name'] == name for f in files)
-        except:
+            return self._metadatos(name) is not None
+        except Exception:
             return False
     
     def listdir(self, path):
@@ -81,40 +238,37 @@ class SupabaseStorage(Storage):
         Lista archivos y directorios en una ruta
         """
         try:
-            files = self.client.storage.from_(self.bucket_name).list(path)
+            files = self._cargar_carpeta(path.strip('/'))
             directories = []
             filenames = []
             
             for item in files:
-                if item.get('metadata', {}).get('mimetype') == 'application/x-directory':
+                if not item.get('metadata') or item['metadata'].get('mimetype') == 'application/x-directory':
                     directories.append(item['name'])
                 else:
                     filenames.append(item['name'])
             
             return directories, filenames
-        except:
+        except Exception:
             return [], []
     
     def size(self, name):
         """
-        Retorna el tamaño de un archivo
+        Retorna el tamaño de un archivo (según el índice)
         """
         try:
-            files = self.client.storage.from_(self.bucket_name).list()
-            for f in files:
-                if f['name'] == name:
-                    return f.get('metadata', {}).get('size', 0)
-            return 0
-        except:
+            metadatos = self._metadatos(name)
+        except Exception:
             return 0
+        return metadatos['size'] if metadatos else 0
     
     def url(self, name):
         """
-        Retorna la URL pública del archivo
+        Retorna la URL pública del archivo (se arma localmente, sin llamar a la API)
         """
         try:
             # Obtener URL pública del archivo
-            response = self.client.storage.from_(self.bucket_name).get_public_url(name)
+            response = self._bucket().get_public_url(name)
             return response
         except Exception as e:
             return f"{settings.SUPABASE_URL}/storage/v1/object/public/{self.bucket_name}/{name}"
@@ -137,7 +291,6 @@ class SupabaseStorage(Storage):
         """
         Adivina el tipo de contenido basado en la extensión del archivo
         """
-        import mimetypes
         content_type, _ = mimetypes.guess_type(name)
         return content_type or 'application/octet-stream'
 